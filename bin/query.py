@@ -122,7 +122,7 @@ def do1Query(dbh, qry, args):
 
 def query(args):
     """ Send the query to the database and render the results as requested """
-    dbh = despydb.DesDbi(args.service, args.section)
+    dbh = despydb.DesDbi(args.service, args.section, fetchsize=args.fetchsize)
     if args.query not in "-+":
         do1Query(dbh, args.query, args)
     elif args.query == "-":
@@ -151,6 +151,8 @@ def main():
     parser.add_argument('--format', '-f', help='format = csv or pretty', default="pretty", choices=["pretty", "csv"])
     parser.add_argument('--delimiter', help='delimiter for csv', default=",")
     parser.add_argument('--log', help='log queries to file (via append)', default=None)
+    parser.add_argument('--fetchsize', type=int, default=None,
+                        help='rows fetched per round trip (default: fetchsize in the services section, if any)')
     parser.add_argument('query', help='query to execute (or -, read from standard in)', default=None)
 
     args = parser.parse_args()
@@ -11,6 +11,14 @@
                  upon instantiation and the resulting object provides an
                  interface based on the Python DB API with extensions to allow
                  interaction with the database in a dialect-neutral manner.
+        DesDbiPool - A process-wide pool of sessions that DesDbi objects can
+                     check their connection out of.
+        SchemaRegistry - Offline table layouts, from DDL files or a JSON
+                         snapshot, that DesDbi can answer column metadata
+                         lookups from.
+
+    An asyncio interface, AsyncDesDbi, is provided by despydb.asyncdesdbi and a
+    multi-session bulk loader, ParallelLoader, by despydb.parallelload.
 
     Error Classes:
         MissingDBId (Exception)
@@ -30,11 +38,13 @@ __version__ = "2.0.1"
 # Note that pydoc includes documentation for entries in the __all__  list when
 # generating documentation for this package.
 
-__all__ = ['DesDbi', 'MissingDBId',
+__all__ = ['DesDbi', 'DesDbiPool', 'SchemaRegistry', 'MissingDBId',
            'UnknownDBTypeError', 'UnknownCaseSensitiveError']
 
 # Make the main class and all the error classes available directly within
 # the package to simplify imports for package users.
 
 from .desdbi import DesDbi
+from .dbpool import DesDbiPool
+from .schemaregistry import SchemaRegistry
 from .errors import MissingDBId, UnknownDBTypeError, UnknownCaseSensitiveError
@@ -0,0 +1,266 @@
+"""
+    Provide an asyncio interface to DES databases.
+
+    Classes:
+        AsyncDesDbi      - Awaitable versions of the DesDbi methods, each run in
+                           a bounded pool of worker threads on a session checked
+                           out of a DesDbiPool.
+        AsyncTransaction - Awaitable DesDbi methods pinned to a single session,
+                           so that several calls share one transaction.
+
+    Developed at:
+    The National Center for Supercomputing Applications(NCSA).
+
+    Copyright(C) 2026 Board of Trustees of the University of Illinois.
+    All rights reserved.
+
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import inspect
+
+import despydb.desdbi as desdbi
+import despydb.dbpool as dbpool
+
+# The DesDbi methods which may be awaited.  Each returns a plain value, so it
+# may be run on a session which is returned to the pool as soon as it is done;
+# methods returning cursors, statements, handles or generators tied to the
+# session, or which manage the connection itself, are deliberately left out.
+AWAITABLE_METHODS = frozenset([
+    'basic_insert_row', 'basic_update_row', 'delete_many',
+    'exec_sql_expression', 'from_dual', 'get_column_lengths',
+    'get_column_metadata', 'get_column_names', 'get_column_types',
+    'get_current_timestamp_str', 'get_expr_exec_format', 'get_input_sizes',
+    'get_named_bind_string', 'get_positional_bind_string', 'get_regex_clause',
+    'get_regex_format', 'get_seq_next_clause', 'get_seq_next_value',
+    'get_seq_next_values', 'get_table_triggers', 'insert_columns',
+    'insert_many', 'insert_many_indiv', 'is_oracle', 'query_results_dict',
+    'query_simple', 'sequence_drop', 'table_drop', 'update_many', 'upsert_many',
+])
+
+# Methods which only mean something on a session the caller keeps, so they are
+# awaitable on an AsyncTransaction but not on AsyncDesDbi, where every call has
+# a session, and a transaction, of its own.
+TRANSACTION_METHODS = AWAITABLE_METHODS | {'commit', 'ping', 'rollback', 'savepoint'}
+
+def _is_db_method(name, methods=AWAITABLE_METHODS):
+    """ Return whether name is a DesDbi method which may be awaited.
+    """
+    return name in methods
+
+class AsyncTransaction:
+    """ Awaitable DesDbi methods which all run on the same session.
+
+        Obtained from AsyncDesDbi.transaction().  When the context is exited the
+        transaction is committed, or rolled back if an exception was raised, and
+        the session is returned to the pool.
+
+            async with adbh.transaction() as tx:
+                await tx.basic_insert_row('my_table', {'col1': 1})
+                await tx.basic_update_row('other_table', {'col2': 2}, {'id': 3})
+
+        Calls on one transaction are run one at a time.  Besides the methods
+        of AsyncDesDbi, commit(), rollback(), savepoint() and ping() may be
+        awaited, as they act on the transaction's own session.
+
+        Parameters
+        ----------
+        adbh : AsyncDesDbi
+            The handle whose pool and workers are used.
+    """
+
+    def __init__(self, adbh):
+        self.adbh = adbh
+        self.dbh = None
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        self.dbh = await self.adbh.run(functools.partial(desdbi.DesDbi, pool=self.adbh.pool))
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        dbh, self.dbh = self.dbh, None
+        await self.adbh.run(dbh.__exit__, exc_type, exc_value, traceback)
+        return False
+
+    def __getattr__(self, name):
+        """ Return an awaitable version of the named DesDbi method.
+        """
+        if not _is_db_method(name, TRANSACTION_METHODS):
+            raise AttributeError(name)
+
+        async def method(*args, **kwargs):
+            if self.dbh is None:
+                raise Exception('Transaction is not active')
+            async with self._lock:
+                return await self.adbh.run(getattr(self.dbh, name), *args, **kwargs)
+        method.__name__ = name
+        return method
+
+class AsyncDesDbi:
+    """ Provide awaitable versions of the DesDbi methods.
+
+        The DesDbi methods in AWAITABLE_METHODS are available as coroutines
+        with the same arguments.  Each call checks a session out of a
+        DesDbiPool, runs the method on it in a worker thread and then commits,
+        or rolls back if the method raised, before returning the session to
+        the pool.  Dialect helpers which need no session, such as
+        get_named_bind_string(), are answered directly.  Independent calls
+        may therefore be run concurrently:
+
+            async with AsyncDesDbi(desfile, 'db-desoper', maxsess=4) as adbh:
+                exps, tiles = await asyncio.gather(
+                    adbh.query_simple('exposure', ['expnum', 'nite']),
+                    adbh.query_simple('coaddtile_geom', 'tilename'))
+
+                async for row in adbh.iter_query('se_object', where='expnum=:1',
+                                                 params=(123456,)):
+                    ...
+
+        Use transaction() for several calls which must share a transaction.
+
+        Parameters
+        ----------
+        desfile : str, optional
+            The file to use for the services data, default is None.
+
+        section : str, optional
+            The section of the services file to use. Default is None
+
+        retry : bool, optional
+            Whether to retry when reading the services file. Default is False.
+
+        maxsess : int, optional
+            The number of worker threads, and so the number of database calls
+            in progress at once. Default is 4.
+
+        pool : DesDbiPool, optional
+            The pool to take sessions from. Default is None, use the
+            process-wide pool for desfile and section.
+    """
+
+    def __init__(self, desfile=None, section=None, retry=False, maxsess=4, pool=None):
+        if pool is None:
+            pool = dbpool.DesDbiPool.get(desfile, section, retry, maxsess=maxsess)
+        self.pool = pool
+        self.dialectClass = desdbi.get_dialect_class(pool.type)
+        self.maxsess = maxsess
+        # leave at least one session and worker for other calls
+        self.max_iterators = max(1, min(maxsess, pool.sizing[1]) - 1)
+        self._iterators = None
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=maxsess,
+                                                              thread_name_prefix='AsyncDesDbi')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        """ Shut down the worker threads, waiting for calls in progress to finish.
+        """
+        self.executor.shutdown(wait=True)
+
+    async def run(self, func, *args, **kwargs):
+        """ Run a blocking function in one of the worker threads.
+
+            Parameters
+            ----------
+            func : callable
+                The function to call.
+
+            args, kwargs
+                The arguments to pass to the function.
+
+            Returns
+            -------
+            various
+                The return value of the function.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor,
+                                          functools.partial(func, *args, **kwargs))
+
+    def _call(self, name, *args, **kwargs):
+        """ Run a DesDbi method in its own transaction on a pooled session.
+        """
+        with desdbi.DesDbi(pool=self.pool) as dbh:
+            return getattr(dbh, name)(*args, **kwargs)
+
+    def __getattr__(self, name):
+        """ Return an awaitable version of the named DesDbi method.
+        """
+        if not _is_db_method(name):
+            raise AttributeError(name)
+
+        helper = inspect.getattr_static(self.dialectClass, name, None)
+        if isinstance(helper, (staticmethod, classmethod)):
+            # a dialect helper needs no session, so none is checked out
+            func = getattr(self.dialectClass, name)
+
+            async def method(*args, **kwargs):
+                return func(*args, **kwargs)
+        else:
+            async def method(*args, **kwargs):
+                return await self.run(self._call, name, *args, **kwargs)
+        method.__name__ = name
+        return method
+
+    def transaction(self):
+        """ Return a context manager whose methods share one session and transaction.
+
+            Returns
+            -------
+            AsyncTransaction
+        """
+        return AsyncTransaction(self)
+
+    async def iter_query(self, from_, cols='*', where=None, orderby=None, params=None,
+                         rowtype=dict, batchsize=1000):
+        """ Issue a simple query and iterate asynchronously over the results.
+
+            The arguments are those of DesDbi.query_simple().  Rows are fetched
+            batchsize at a time in a worker thread, so the whole result set is
+            never held in memory.  The session is held until iteration ends, so
+            at most max_iterators, one less than the number of workers or
+            sessions in the pool, run at once; further iterators wait for one
+            of them to end before issuing their query, rather than leaving no
+            session or worker for other calls.
+
+            Parameters
+            ----------
+            batchsize : int, optional
+                The number of rows fetched per round trip. Default is 1000.
+
+            Yields
+            ------
+            various
+                One row of the specified rowtype at a time.
+        """
+        stmt = desdbi.DesDbi.build_query(from_, cols, where, orderby)
+        if self._iterators is None:
+            self._iterators = asyncio.Semaphore(self.max_iterators)
+        async with self._iterators:
+            dbh = await self.run(functools.partial(desdbi.DesDbi, pool=self.pool))
+            curs = None
+            try:
+                curs = await self.run(dbh.cursor)
+                if params:
+                    await self.run(curs.execute, stmt, params)
+                else:
+                    await self.run(curs.execute, stmt)
+                rcols = [desc[0].lower() for desc in curs.description]
+                while True:
+                    rows = await self.run(curs.fetchmany, batchsize)
+                    if not rows:
+                        break
+                    for row in desdbi.DesDbi.convert_rows(rows, rcols, rowtype):
+                        yield row
+            finally:
+                if curs is not None:
+                    await self.run(curs.close)
+                await self.run(dbh.close)
@@ -0,0 +1,83 @@
+"""
+    Provide access to columnar data for bulk inserts.
+
+    Functions:
+        column_source - Return the column names, the number of rows and a
+                        function slicing a column into python values, for a
+                        dictionary of 1-D arrays, a NumPy structured (or
+                        masked, or FITS) array or a pyarrow Table.
+
+    Neither NumPy nor pyarrow is imported; the data are accessed through their
+    own methods, so both remain optional.
+
+    Developed at:
+    The National Center for Supercomputing Applications(NCSA).
+
+    Copyright(C) 2026 Board of Trustees of the University of Illinois.
+    All rights reserved.
+
+"""
+
+def _array_values(col, start, stop, pytype):
+    """ Return a slice of a 1-D array, or list, as a list of python values.
+
+        Masked values become None.  datetime64 values are converted to
+        datetime, byte strings are decoded for character columns and booleans
+        become integers for numeric columns.
+    """
+    col = col[start:stop]
+    dtype = getattr(col, 'dtype', None)
+    if dtype is not None and dtype.kind == 'M':
+        col = col.astype('datetime64[us]')
+    values = col.tolist() if hasattr(col, 'tolist') else list(col)
+    if dtype is not None and dtype.kind == 'S' and pytype is str:
+        values = [v.decode() if v is not None else None for v in values]
+    elif dtype is not None and dtype.kind == 'b' and pytype in (int, float):
+        values = [int(v) if v is not None else None for v in values]
+    return values
+
+def column_source(arrays):
+    """ Return access to the columns of a dictionary of arrays, a structured
+        array or a pyarrow Table.
+
+        Parameters
+        ----------
+        arrays : various
+            A dictionary of 1-D arrays (or lists) indexed by column name, a
+            structured array, including masked and FITS record arrays, or a
+            pyarrow Table.
+
+        Returns
+        -------
+        tuple
+            The column names, the number of rows and a function of
+            (name, start, stop, pytype) returning that slice of the column as a
+            list of python values, with None for masked or null values.
+
+        Raises
+        ------
+        ValueError
+            If the columns are not all the same length.
+    """
+    if hasattr(arrays, 'column_names') and hasattr(arrays, 'num_rows'):
+        # pyarrow Table
+        def arrow_values(name, start, stop, _pytype):
+            return arrays.column(name).slice(start, stop - start).to_pylist()
+        return list(arrays.column_names), arrays.num_rows, arrow_values
+
+    dtype = getattr(arrays, 'dtype', None)
+    if dtype is not None and dtype.names:
+        names = list(dtype.names)
+        nrows = len(arrays)
+        columns = {name: arrays[name] for name in names}
+    else:
+        names = list(arrays.keys())
+        columns = arrays
+        lengths = {len(columns[name]) for name in names}
+        if len(lengths) > 1:
+            raise ValueError('The columns are not all the same length')
+        nrows = lengths.pop() if lengths else 0
+
+    def values(name, start, stop, pytype):
+        return _array_values(columns[name], start, stop, pytype)
+    return names, nrows, values
@@ -0,0 +1,91 @@
+"""
+    Provide a process-level cache of parsed service access configuration.
+
+    Functions:
+        get_config   - Return the validated DB configuration for a DES services
+                       file and section, reading the file only when it has not
+                       been read before or has changed since.
+        clear_cache  - Forget all cached configurations.
+
+    Developed at:
+    The National Center for Supercomputing Applications(NCSA).
+
+    Copyright(C) 2026 Board of Trustees of the University of Illinois.
+    All rights reserved.
+
+"""
+
+import copy
+import os
+import threading
+from despyserviceaccess import serviceaccess
+
+_CACHE = {}
+_LOCK = threading.Lock()
+
+def _mtime(filename):
+    """ Return the modification time of a file, or None if it cannot be read.
+    """
+    try:
+        return os.stat(filename).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+
+def _resolve(desfile, section):
+    """ Return the services file and section which serviceaccess will use for
+        the given values, following the DES_SERVICES and DES_DB_SECTION
+        environment variables for None values.
+    """
+    if desfile is None:
+        desfile = os.environ.get('DES_SERVICES', os.path.join(os.path.expanduser('~'),
+                                                              '.desservices.ini'))
+    if section is None:
+        section = os.environ.get('DES_DB_SECTION')
+    return os.path.abspath(desfile), section
+
+def get_config(desfile=None, section=None, retry=False):
+    """ Return the parsed and checked DB configuration for a services file section.
+
+        The result of serviceaccess.parse and serviceaccess.check is kept for
+        the life of the process and reused as long as the modification time of
+        the services file is unchanged, so a process that opens many handles
+        reads and validates the file once.  Entries are keyed on the file and
+        section used, with None values resolved from the DES_SERVICES and
+        DES_DB_SECTION environment variables at each call, so changing these
+        selects another entry.
+
+        Parameters
+        ----------
+        desfile : str, optional
+            The file to use for the services data, default is None.
+
+        section : str, optional
+            The section of the services file to use. Default is None
+
+        retry : bool, optional
+            Whether to retry when reading the services file. Default is False.
+
+        Returns
+        -------
+        dict
+            A copy of the configuration which the caller may modify.
+    """
+    key = _resolve(desfile, section)
+    with _LOCK:
+        entry = _CACHE.get(key)
+    if entry is not None:
+        mtime, configdict = entry
+        if mtime is not None and mtime == _mtime(configdict['meta_file']):
+            return copy.copy(configdict)
+
+    configdict = serviceaccess.parse(desfile, section, 'DB', retry)
+    serviceaccess.check(configdict, 'DB')
+    with _LOCK:
+        _CACHE[key] = (_mtime(configdict['meta_file']), configdict)
+    return copy.copy(configdict)
+
+def clear_cache():
+    """ Forget all cached configurations.
+    """
+    with _LOCK:
+        _CACHE.clear()
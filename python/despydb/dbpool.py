@@ -0,0 +1,200 @@
+"""
+    Provide process-wide pools of database sessions.
+
+    Classes:
+        DesDbiPool - A pool of sessions to the database identified by a DES
+                     services file section.  DesDbi objects created with the
+                     pool check their connection out of it and return it on
+                     close, so short-lived handles do not each pay for a full
+                     logon.  With an Oracle server configured for DRCP, the
+                     pooled sessions use the DESDM connection class.  A pool
+                     used after fork() opens a new set of sessions in the child.
+
+    Developed at:
+    The National Center for Supercomputing Applications(NCSA).
+
+    Copyright(C) 2026 Board of Trustees of the University of Illinois.
+    All rights reserved.
+
+"""
+
+import threading
+import time
+import warnings
+
+import despydb.configcache as configcache
+import despydb.desdbi as desdbi
+
+class DesDbiPool:
+    """ A pool of database sessions for one DES services file section.
+
+        The pool itself is implemented by the connection class of the database
+        type (a cx_Oracle SessionPool for Oracle).  Use DesDbiPool.get() to share
+        a single pool per services file and section across the process:
+
+            pool = DesDbiPool.get(desfile, 'db-desoper', maxsess=16)
+            with DesDbi(pool=pool) as dbh:
+                dbh.query_simple('my_table')
+
+        Parameters
+        ----------
+        desfile : str, optional
+            The file to use for the services data, default is None.
+
+        section : str, optional
+            The section of the services file to use. Default is None
+
+        retry : bool, optional
+            Whether to retry when reading the services file. Default is False.
+
+        minsess : int, optional
+            The minimum number of sessions kept open. Default is 1.
+
+        maxsess : int, optional
+            The maximum number of sessions open at once. Default is 8.
+
+        increment : int, optional
+            The number of sessions opened each time the pool grows. Default is 1.
+
+        timeout : float, optional
+            The number of seconds acquire() waits for a free session. Default
+            is 60.
+    """
+
+    _pools = {}
+    _lock = threading.Lock()
+
+    def __init__(self, desfile=None, section=None, retry=False, minsess=1, maxsess=8,
+                 increment=1, timeout=60):
+        self.configdict = configcache.get_config(desfile, section, retry)
+        self.type = self.configdict['type']
+        if self.type == 'oracle':
+            self.configdict['threaded'] = True
+        self.conClass = desdbi.get_connection_class(self.type)
+        self.sizing = (minsess, maxsess, increment, timeout)
+        self.pool = self.conClass.create_pool(self.configdict, *self.sizing)
+        self._forkgen = desdbi.fork_generation()
+
+        self._statlock = threading.Lock()
+        self.acquires = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    @classmethod
+    def get(cls, desfile=None, section=None, retry=False, **kwargs):
+        """ Return the process-wide pool for a services file section, creating it if needed.
+
+            Pools are shared by calls naming the same file, by any path, and
+            section, including through the DES_SERVICES and DES_DB_SECTION
+            environment variables.
+
+            Parameters
+            ----------
+            desfile : str, optional
+                The file to use for the services data, default is None.
+
+            section : str, optional
+                The section of the services file to use. Default is None
+
+            retry : bool, optional
+                Whether to retry when reading the services file. Default is False.
+
+            kwargs : dict
+                Pool sizing arguments used when the pool is created, see the
+                class documentation.  A warning is issued if the pool already
+                exists with different sizing, which is kept.
+
+            Returns
+            -------
+            DesDbiPool
+        """
+        # None values select the file and section of DES_SERVICES and DES_DB_SECTION
+        key = configcache._resolve(desfile, section)
+        with cls._lock:
+            if key not in cls._pools:
+                cls._pools[key] = cls(desfile, section, retry, **kwargs)
+                return cls._pools[key]
+            pool = cls._pools[key]
+        sizing = dict(zip(('minsess', 'maxsess', 'increment', 'timeout'), pool.sizing))
+        ignored = {k: v for k, v in kwargs.items() if sizing.get(k) != v}
+        if ignored:
+            warnings.warn(f'The pool for section {key[1]} already exists with {sizing}, '
+                          f'ignoring {ignored}', RuntimeWarning, stacklevel=2)
+        return pool
+
+    @classmethod
+    def close_all(cls):
+        """ Close all of the process-wide pools.
+        """
+        with cls._lock:
+            pools = list(cls._pools.values())
+            cls._pools.clear()
+        for pool in pools:
+            pool.pool.close()
+
+    def acquire(self):
+        """ Check a session out of the pool, waiting for one if none are free.
+
+            Returns
+            -------
+            connection
+                A connection of the pool's connection class.
+        """
+        start = time.time()
+        if self._forkgen != desdbi.fork_generation():
+            # the sessions of a pool inherited across fork() belong to the parent
+            with self._statlock:
+                if self._forkgen != desdbi.fork_generation():
+                    self.pool = self.conClass.create_pool(self.configdict, *self.sizing)
+                    self._forkgen = desdbi.fork_generation()
+        con = self.conClass(self.configdict, pool=self.pool)
+        waited = time.time() - start
+        with self._statlock:
+            self.acquires += 1
+            self.wait_time += waited
+            self.max_wait = max(self.max_wait, waited)
+        return con
+
+    def release(self, con, discard=False):
+        """ Return a session to the pool.
+
+            Parameters
+            ----------
+            con : connection
+                A connection obtained from acquire().
+
+            discard : bool, optional
+                Whether to drop the session from the pool instead of keeping it
+                for reuse, e.g. when it is no longer live. Default is False.
+        """
+        if discard:
+            self.pool.drop(con)
+        else:
+            self.pool.release(con)
+
+    def close(self):
+        """ Close the pool and remove it from the process-wide pools.
+        """
+        with DesDbiPool._lock:
+            for key, pool in list(DesDbiPool._pools.items()):
+                if pool is self:
+                    del DesDbiPool._pools[key]
+        self.pool.close()
+
+    def stats(self):
+        """ Return usage statistics for the pool.
+
+            Returns
+            -------
+            dict
+                The number of busy and open sessions, the maximum number of
+                sessions, the number of acquires and the total and longest time
+                in seconds spent waiting for a session.
+        """
+        with self._statlock:
+            return {'busy': self.pool.busy,
+                    'open': self.pool.opened,
+                    'max': self.pool.max,
+                    'acquires': self.acquires,
+                    'wait_time': self.wait_time,
+                    'max_wait': self.max_wait}
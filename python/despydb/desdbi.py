@@ -22,18 +22,247 @@
 
 __version__ = "2.0.0"
 
+import os
 import sys
 import copy
 import time
 import socket
+import inspect
+import weakref
+import threading
+import warnings
+import contextlib
 import collections
-from despyserviceaccess import serviceaccess
 
 # importing of DB specific modules done down inside code
 
 import despydb.errors as errors
+import despydb.configcache as configcache
+import despydb.columnar as columnar
+# aliased, as DesDbi() has a metacache argument
+import despydb.metacache as _metacache
+import despydb.schemaregistry as schemaregistry
 import despydb.desdbi_defs as defs
 
+# Incremented in the child after every fork(), so that handles can tell that
+# their session was opened by the parent process.
+_FORK_GENERATION = 0
+
+def _after_fork():
+    global _FORK_GENERATION
+    _FORK_GENERATION += 1
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+def fork_generation():
+    """ Return the number of times the process ancestry has forked since import.
+
+        Returns
+        -------
+        int
+    """
+    return _FORK_GENERATION
+
+def get_connection_class(dbtype):
+    """ Return the connection class implementing the given database type.
+
+        Parameters
+        ----------
+        dbtype : str
+            The database type from the services file section.
+
+        Returns
+        -------
+        class
+
+        Raises
+        ------
+        errors.UnknownDBTypeError
+            If the database type is not supported.
+    """
+    #pylint: disable=import-error
+    if dbtype == 'oracle':
+        import despydb.oracon
+        return despydb.oracon.OracleConnection
+    #elif dbtype == 'postgres':
+    #    import despydb.pgcon
+    #    return despydb.pgcon.PostgresConnection
+    if dbtype == 'test':
+        sys.path.append('../../tests')
+        import MockDBI
+        return MockDBI.MockConnection
+    raise errors.UnknownDBTypeError(dbtype)
+
+def get_dialect_class(dbtype):
+    """ Return a class providing the dialect helpers for the given database type.
+
+        Unlike get_connection_class, this does not import the database driver.
+
+        Parameters
+        ----------
+        dbtype : str
+            The database type from the services file section.
+
+        Returns
+        -------
+        class
+
+        Raises
+        ------
+        errors.UnknownDBTypeError
+            If the database type is not supported.
+    """
+    if dbtype == 'oracle':
+        import despydb.oradialect
+        return despydb.oradialect.OracleDialect
+    return get_connection_class(dbtype)
+
+def _bind_bytes(row):
+    """ Estimate the number of bytes needed to bind the values of a row.
+    """
+    if hasattr(row, 'values'):
+        row = row.values()
+    nbytes = 0
+    for val in row:
+        if isinstance(val, (str, bytes, bytearray)):
+            nbytes += len(val)
+        else:
+            nbytes += 8
+    return nbytes
+
+class PreparedStatement:
+    """ A SQL statement kept prepared on its own cursor for repeated execution.
+
+        Obtained from DesDbi.prepare().  The cursor is opened and the statement
+        parsed on first use, and again whenever the handle's connection has
+        changed, e.g. after a reconnect.  Each execution only sends new bind
+        values.
+
+        Parameters
+        ----------
+        dbh : DesDbi
+            The handle whose connection is used.
+
+        sql : str
+            The SQL statement.
+    """
+
+    def __init__(self, dbh, sql):
+        self.dbh = dbh
+        self.sql = sql
+        self.executions = 0
+        self.inputsizes = None
+        self._curs = None
+        self._con = None
+
+    @property
+    def cursor(self):
+        """ The cursor the statement is prepared on.
+        """
+        con = self.dbh.con
+        if self._curs is None or self._con is not con:
+            self.close()
+            self._curs = self.dbh.cursor()
+            self._curs.prepare(self.sql)
+            self._con = con
+        return self._curs
+
+    def setinputsizes(self, sizes):
+        """ Set the bind types and sizes used for every execution.
+
+            Parameters
+            ----------
+            sizes : list or dict
+                The arguments of Cursor.setinputsizes, positional for a list and
+                by name for a dict. None removes the sizes.
+        """
+        self.inputsizes = sizes
+
+    def _bind_sizes(self, curs, outvars=None):
+        """ Apply the input sizes, and any output variables, to the cursor before
+            an execution.
+        """
+        sizes = self.inputsizes
+        if outvars:
+            sizes = dict(sizes or {}, **outvars)
+        if sizes is None:
+            return
+        if isinstance(sizes, dict):
+            curs.setinputsizes(**sizes)
+        else:
+            curs.setinputsizes(*sizes)
+
+    @property
+    def rowcount(self):
+        """ The number of rows affected by the last execution.
+        """
+        return self._curs.rowcount if self._curs is not None else -1
+
+    def execute(self, params=None, outvars=None):
+        """ Execute the statement with a set of bind values.
+
+            Parameters
+            ----------
+            params : dict or sequence, optional
+                The bind values. Default is None, no binds.
+
+            outvars : dict, optional
+                Output variables, e.g. for a RETURNING clause, by bind name.
+                Default is None.
+
+            Returns
+            -------
+            cursor
+                The cursor, from which any results can be fetched.
+        """
+        if outvars:
+            params = dict(params or {}, **outvars)
+        with self.dbh._uselock:
+            curs = self.cursor
+            self._bind_sizes(curs)
+            curs.execute(None, params or {})
+        self.executions += 1
+        return curs
+
+    def executemany(self, rows, outvars=None, **kwargs):
+        """ Execute the statement once for each set of bind values.
+
+            Parameters
+            ----------
+            rows : list
+                The sets of bind values.
+
+            outvars : dict, optional
+                Output variables with an array size of at least the number of
+                rows, e.g. for a RETURNING clause, by bind name. Default is None.
+
+            kwargs
+                Passed to Cursor.executemany, e.g. batcherrors.
+
+            Returns
+            -------
+            cursor
+        """
+        with self.dbh._uselock:
+            curs = self.cursor
+            self._bind_sizes(curs, outvars)
+            curs.executemany(None, rows, **kwargs)
+        self.executions += 1
+        return curs
+
+    def close(self):
+        """ Close the cursor; it is reopened if the statement is executed again.
+        """
+        curs, self._curs = self._curs, None
+        self._con = None
+        if curs is not None:
+            try:
+                curs.close()
+            except Exception:
+                # the connection may already be closed
+                pass
+
 class DesDbi:
     """ Provide a dialect-neutral interface to a DES database.
 
@@ -85,40 +314,143 @@ class DesDbi:
         threaded : bool, optional
             Whether to use a thread safe connection or not. Default is False, no
             thread safety.
+
+        pool : DesDbiPool or bool, optional
+            A session pool to check the connection out of; the session is
+            returned to the pool by close() or when the context exits.  Any other
+            true value uses the process-wide pool for desfile and section.
+            Default is None, open a dedicated connection.
+
+        lazy : bool, optional
+            Whether to put off connecting to the database until the first call
+            that needs a session.  Dialect helpers such as
+            get_named_bind_string() are answered without connecting. Default
+            is False, connect during instantiation.
+
+        keepalive : float, optional
+            If given, start a background thread that pings the connection
+            whenever it has not been verified alive for this many seconds, see
+            start_keepalive(). Default is None, no keepalive.
+
+        metacache : various, optional
+            The cache used by get_column_metadata(), get_column_lengths(),
+            get_column_names() and get_column_types().  True gives the handle
+            its own cache, 'process' uses a cache shared by all handles of the
+            process connected to the same database and schema, a
+            ColumnMetadataCache is used as is and False disables caching.
+            Default is True.
+
+        metacache_ttl : float, optional
+            The number of seconds cached column metadata stays valid when a
+            cache is created. Default is None, until invalidated.
+
+        stmtcachesize : int, optional
+            The number of statements kept prepared, both by the Oracle client
+            statement cache and by prepare(). Default is None, the
+            stmtcachesize entry of the services section if there is one,
+            otherwise 20.
+
+        schema : SchemaRegistry or str, optional
+            An offline registry of table layouts, or the name of a JSON
+            snapshot or of a directory of DDL files to load one from.
+            get_column_metadata() and friends answer from it, without querying
+            the database, for the tables it contains. Default is None.
+
+        fetchsize : int, optional
+            The number of rows fetched per round trip by cursors which are not
+            given their own, see cursor(). Default is None, the fetchsize entry
+            of the services section if there is one, otherwise the driver's
+            default.
     """
 
-    def __init__(self, desfile=None, section=None, retry=False, connection=None, threaded=False):
+    def __init__(self, desfile=None, section=None, retry=False, connection=None, threaded=False,
+                 pool=None, lazy=False, keepalive=None, metacache=True, metacache_ttl=None,
+                 stmtcachesize=None, schema=None, fetchsize=None):
         #pylint: disable=import-error
         self.retry = retry
+        self.pool = None
+        self._con = None
+        self._forkgen = _FORK_GENERATION
+        self._owner = threading.get_ident()
+        self._threadlocal = threading.local()
+        self._thread_handles = []
+        self.last_alive = None
+        self.last_used = None
+        self._uselock = threading.RLock()
+        self.keepalive_interval = None
+        self._keepalive_stop = None
+        self.dialectClass = None
+        self.schema = self._make_schema(schema)
+        self._prepared = collections.OrderedDict()
+        self._seqcache = {}
         if connection is None:
             self.inherit = False
-            self.configdict = serviceaccess.parse(desfile, section, 'DB', retry)
-
-            self.type = self.configdict['type']
-
-            serviceaccess.check(self.configdict, 'DB')
-
-            if self.type == 'oracle':
-                self.configdict['threaded'] = threaded
-                import despydb.oracon
-                self.conClass = despydb.oracon.OracleConnection
-            #elif self.type == 'postgres':
-            #    import despydb.pgcon
-            #    self.conClass = despydb.pgcon.PostgresConnection
-            elif self.type == 'test':
-                sys.path.append('../../tests')
-                import MockDBI
-                self.conClass = MockDBI.MockConnection
+            if pool:
+                import despydb.dbpool
+                if not isinstance(pool, despydb.dbpool.DesDbiPool):
+                    pool = despydb.dbpool.DesDbiPool.get(desfile, section, retry)
+                self.pool = pool
+                self.configdict = pool.configdict
+                self.type = pool.type
+                self.conClass = pool.conClass
             else:
-                raise errors.UnknownDBTypeError(self.type)
-
-            self.connect()
+                self.configdict = configcache.get_config(desfile, section, retry)
+
+                self.type = self.configdict['type']
+
+                if self.type == 'oracle':
+                    # the keepalive thread shares the connection
+                    self.configdict['threaded'] = threaded or bool(keepalive)
+                if stmtcachesize is not None:
+                    self.configdict['stmtcachesize'] = stmtcachesize
+                # the driver is not imported until the connection is opened
+                self.conClass = None
+            self.dialectClass = get_dialect_class(self.type)
+            self.metacache = self._make_metacache(metacache, metacache_ttl)
+            self.stmtcachesize = int(stmtcachesize or self.configdict.get('stmtcachesize') or 20)
+            self.fetchsize = int(fetchsize or self.configdict.get('fetchsize') or 0) or None
+
+            if not lazy:
+                self.connect()
         else:
             self.inherit = True
             self.configdict = connection.configdict
             self.type = connection.type
+            self.conClass = getattr(connection, 'conClass', None)
+            self.dialectClass = getattr(connection, 'dialectClass', None)
+            self.metacache = getattr(connection, 'metacache', None)
+            if self.schema is None:
+                self.schema = getattr(connection, 'schema', None)
+            self.stmtcachesize = stmtcachesize or getattr(connection, 'stmtcachesize', 20)
+            self.fetchsize = fetchsize or getattr(connection, 'fetchsize', None)
             self.con = connection.con
 
+        if keepalive:
+            self.start_keepalive(keepalive)
+
+    def _make_metacache(self, cache, ttl):
+        """ Return the column metadata cache selected by the metacache argument.
+        """
+        if isinstance(cache, _metacache.ColumnMetadataCache):
+            return cache
+        if cache == 'process':
+            key = tuple(self.configdict.get(k) for k in ('type', 'server', 'port', 'sid', 'name',
+                                                          'user'))
+            return _metacache.ColumnMetadataCache.shared(key, ttl)
+        if cache:
+            return _metacache.ColumnMetadataCache(ttl)
+        return None
+
+    @staticmethod
+    def _make_schema(schema):
+        """ Return the schema registry selected by the schema argument.
+        """
+        if schema is None or isinstance(schema, schemaregistry.SchemaRegistry):
+            return schema
+        if os.path.isdir(schema):
+            return schemaregistry.SchemaRegistry.from_ddl(schema)
+        return schemaregistry.SchemaRegistry.from_json(schema)
+
     def __enter__(self):
         """ Enable the use of this class as a context manager.
         """
@@ -143,6 +475,104 @@ class DesDbi:
 
         return False
 
+    @property
+    def con(self):
+        """ The database connection, opened on first use for a lazy handle or
+            after the process has forked.
+        """
+        if self._current_con() is None:
+            self.connect()
+        self.last_used = time.time()
+        return self._con
+
+    @con.setter
+    def con(self, value):
+        self._con = value
+        self._forkgen = _FORK_GENERATION
+
+    def _current_con(self):
+        """ Return the connection if it was opened by this process, otherwise None.
+
+            A connection inherited across fork() belongs to the parent process.
+            It is abandoned without being closed, since closing it would end the
+            parent's session, and the handle then owns any new connection.
+        """
+        if self._con is not None and self._forkgen != _FORK_GENERATION:
+            self._con = None
+            self.inherit = False
+            self._threadlocal = threading.local()
+            self._thread_handles = []
+            # values cached by the parent would be handed out twice
+            self._seqcache = {}
+            self._uselock = threading.RLock()
+            if self.keepalive_interval:
+                # threads do not survive fork()
+                self.start_keepalive(self.keepalive_interval)
+        return self._con
+
+    def is_connected(self):
+        """ Returns whether a database connection has been opened by this process.
+
+            Returns
+            -------
+            bool
+        """
+        return self._current_con() is not None
+
+    def for_thread(self):
+        """ Return a handle for use by the calling thread.
+
+            The first call from a thread other than the one that created this
+            handle creates a new handle from the same configuration (and pool,
+            if any), without re-reading the services file; later calls from that
+            thread return the same handle.  The creating thread gets this handle.
+            Handles created for threads are closed when this handle is closed.
+
+            Returns
+            -------
+            DesDbi
+        """
+        if threading.get_ident() == self._owner:
+            return self
+        dbh = getattr(self._threadlocal, 'dbh', None)
+        if dbh is None:
+            dbh = copy.copy(self)
+            dbh._con = None
+            dbh.inherit = False
+            dbh._owner = threading.get_ident()
+            dbh._threadlocal = threading.local()
+            dbh._thread_handles = []
+            dbh.last_alive = None
+            dbh.last_used = None
+            dbh._uselock = threading.RLock()
+            dbh.keepalive_interval = None
+            dbh._keepalive_stop = None
+            dbh._prepared = collections.OrderedDict()
+            dbh._seqcache = {}
+            self._threadlocal.dbh = dbh
+            self._thread_handles.append(dbh)
+        return dbh
+
+    def _dialect(self, name):
+        """ Return the named dialect helper, from the dialect class if possible.
+
+            Helpers implemented as static methods of the dialect class do not
+            need a session, so a lazy handle answers them without connecting.
+
+            Parameters
+            ----------
+            name : str
+                The name of the helper method.
+
+            Returns
+            -------
+            callable
+        """
+        helper = inspect.getattr_static(self.dialectClass, name, None)
+        if self._current_con() is None and isinstance(helper, staticmethod):
+            return getattr(self.dialectClass, name)
+        return getattr(self.con, name)
+
     def connect(self):
         """ Connect to the database, retrying if requested.
         """
@@ -150,13 +580,19 @@ class DesDbi:
         if self.retry:
             MAXTRIES = 5
         TRY_DELAY = 10 # seconds
+        if self.conClass is None:
+            self.conClass = get_connection_class(self.type)
         trycnt = 0
         done = False
         lasterr = ""
         while not done and trycnt < MAXTRIES:
             trycnt += 1
             try:
-                self.con = self.conClass(self.configdict)
+                if self.pool is not None:
+                    self.con = self.pool.acquire()
+                else:
+                    self.con = self.conClass(self.configdict)
+                self.last_alive = time.time()
                 done = True
             except Exception as e:
                 lasterr = str(e).strip()
@@ -177,13 +613,39 @@ class DesDbi:
         if trycnt > 1: # only print success message if we've printed failure message
             print("Successfully connected to database after retrying.")
 
-    def reconnect(self):
+    def reconnect(self, maxage=None, force=False):
         """ Reconnect to the database (but ony if the connection is no longer live).
+
+            Parameters
+            ----------
+            maxage : float, optional
+                Trust the connection without pinging it if it was verified alive,
+                e.g. by the keepalive thread, within this many seconds. Default
+                is None, always ping.
+
+            force : bool, optional
+                Reconnect without pinging, e.g. after an error which showed the
+                connection to be broken. Default is False.
         """
-        if not self.ping():
-            self.connect()
-        else:
-            print('Connection still good, not reconnecting')
+        if not force and maxage and self.last_alive is not None and \
+                time.time() - self.last_alive < maxage:
+            print('Connection recently verified, not reconnecting')
+            return
+        with self._uselock:
+            if force or not self.ping():
+                self._close_prepared()
+                con = self._current_con()
+                if con is not None:
+                    if self.pool is not None:
+                        self.pool.release(con, discard=True)
+                    elif force:
+                        try:
+                            con.close()
+                        except Exception as err:
+                            print(f"Could not close the old connection: {str(err).strip()}")
+                self.connect()
+            else:
+                print('Connection still good, not reconnecting')
 
     def autocommit(self, state=None):
         """ Return and optionally set autocommit mode.
@@ -208,24 +670,93 @@ class DesDbi:
 
     def close(self):
         """ Close the current connection, disabling any open cursors.
+
+            A pooled connection is returned to its pool instead.
         """
-        return self.con.close()
+        self.stop_keepalive()
+        handles, self._thread_handles = self._thread_handles, []
+        self._threadlocal = threading.local()
+        for dbh in handles:
+            dbh.close()
+        with self._uselock:
+            self._close_prepared()
+            con = self._current_con()
+            if con is None:
+                return None
+            # forget the session first, so that it is neither released twice
+            # nor used once it belongs to another borrower
+            self._con = None
+            if self.pool is not None:
+                return self.pool.release(con)
+            return con.close()
+
+    def prepare(self, sql):
+        """ Return a handle on which a statement stays prepared between executions.
+
+            Handles are kept per distinct SQL text, so preparing the same
+            statement again returns the same handle and its cursor is reused
+            rather than a new cursor being opened and the statement parsed
+            again.  The stmtcachesize most recently used handles are kept; the
+            cursors of older ones are closed.
+
+                stmt = dbh.prepare('update task set status=:status where id=:id')
+                for tid, status in updates:
+                    stmt.execute({'status': status, 'id': tid})
+
+            Parameters
+            ----------
+            sql : str
+                The SQL statement.
+
+            Returns
+            -------
+            PreparedStatement
+        """
+        stmt = self._prepared.get(sql)
+        if stmt is None:
+            stmt = PreparedStatement(self, sql)
+            self._prepared[sql] = stmt
+            while len(self._prepared) > self.stmtcachesize:
+                _, old = self._prepared.popitem(last=False)
+                old.close()
+        else:
+            self._prepared.move_to_end(sql)
+        return stmt
+
+    def _close_prepared(self):
+        """ Close the cursors of all prepared statements.
+        """
+        prepared, self._prepared = self._prepared, collections.OrderedDict()
+        for stmt in prepared.values():
+            stmt.close()
 
     def commit(self):
         """ Commit any pending transaction.
         """
+        if self._current_con() is None:
+            return None
         return self.con.commit()
 
     def cursor(self, fetchsize=None):
         """ Return a Cursor object for operating on the connection.
 
-            The not yet implemented fetchsize argument would cause PostgreConnection
-            to generate a psycopg2 named cursor configured to fetch the indicated
-            number of rows from the database per request needed to fulfill the
-            requirements of calls to fetchall(), fetchone(), and fetchmany().  It's
-            default behavior is to fetch all rows from the database at once.
+            The fetchsize is the number of rows fetched from the database per
+            round trip to fulfill calls to fetchall(), fetchone() and
+            fetchmany(); on Oracle it sets the arraysize and prefetchrows of the
+            cursor.  Large scans need far fewer round trips with a fetchsize of
+            hundreds or thousands of rows than with the driver's default.
+
+            Parameters
+            ----------
+            fetchsize : int, optional
+                The number of rows per fetch. Default is None, the fetchsize of
+                the handle.
+
+            Returns
+            -------
+            cursor
         """
-        return self.con.cursor(fetchsize)
+        return self.con.cursor(fetchsize or self.fetchsize)
 
     def exec_sql_expression(self, expression):
         """ Execute an SQL expression or expressions.
@@ -275,7 +806,7 @@ class DesDbi:
                 oracle result:   SELECT func1(), func2() FROM DUAL
                 postgres result: SELECT func1(), func2()
         """
-        return self.con.get_expr_exec_format()
+        return self._dialect('get_expr_exec_format')()
 
     def get_column_metadata(self, table_name):
         """ Return a dictionary of 7-item sequences, with lower case column name keys.
@@ -292,6 +823,77 @@ class DesDbi:
             -------
             dict
         """
+        return dict(self._cached_metadata(table_name, 'metadata', self._describe))
+
+    def prefetch_metadata(self, tables):
+        """ Look up the column metadata of many tables with a single query.
+
+            The metadata of all of the tables is read from the data dictionary at
+            once, rather than with one describe per table, and stored in the
+            metadata cache so that later calls to get_column_metadata() and
+            friends need no round trips.  Tables the data dictionary query does
+            not find, e.g. because they are synonyms, are described
+            individually.
+
+            Parameters
+            ----------
+            tables : list
+                The names of the tables.
+
+            Returns
+            -------
+            dict
+                For each table, indexed by lower case table name, a dictionary
+                in the format returned by get_column_metadata().
+        """
+        tables = list(tables)
+        if not tables:
+            return {}
+        found = self.con.get_table_metadata(tables)
+        result = {}
+        for table in tables:
+            meta = found.get(table.lower())
+            if not meta:
+                meta = self._describe(table)
+            if self.metacache is not None:
+                self.metacache.put(table, 'metadata', meta)
+            result[table.lower()] = dict(meta)
+        return result
+
+    def _cached_metadata(self, table_name, kind, lookup):
+        """ Return column metadata from the schema registry or the metadata cache,
+            looking it up on a miss.
+
+            Parameters
+            ----------
+            table_name : str
+                The table whose information needs to be looked up.
+
+            kind : str
+                The kind of metadata, used as part of the cache key.
+
+            lookup : callable
+                Function of the table name that queries the database.
+
+            Returns
+            -------
+            various
+        """
+        if self.schema is not None and kind in self.schema.KINDS and table_name in self.schema:
+            if self.conClass is None:
+                self.conClass = get_connection_class(self.type)
+            return self.schema.lookup(table_name, kind, self.conClass)
+        if self.metacache is None:
+            return lookup(table_name)
+        value = self.metacache.get(table_name, kind)
+        if value is None:
+            value = lookup(table_name)
+            self.metacache.put(table_name, kind, value)
+        return value
+
+    def _describe(self, table_name):
+        """ Query the database for the column descriptions of a table.
+        """
         cursor = self.cursor()
         sqlstr = f'SELECT * FROM {table_name} WHERE 0=1'
         if self.type == 'oracle':
@@ -355,7 +957,26 @@ class DesDbi:
             -------
             dict
         """
-        return self.con.get_column_types(table_name)
+        return dict(self._cached_metadata(table_name, 'types', self._column_types))
+
+    def _column_types(self, table_name):
+        """ Determine the column types of a table, reusing cached column descriptions.
+        """
+        return self.con.get_column_types(table_name, self.get_column_metadata(table_name))
+
+    def invalidate_metadata(self, table_name=None):
+        """ Remove a table, or all tables, from the column metadata cache.
+
+            Call this after altering a table outside of this handle.  Tables
+            dropped with table_drop() are removed automatically.
+
+            Parameters
+            ----------
+            table_name : str, optional
+                The table to forget. Default is None, forget all tables.
+        """
+        if self.metacache is not None:
+            self.metacache.invalidate(table_name)
 
 
     def get_named_bind_string(self, name):
@@ -378,7 +999,7 @@ class DesDbi:
                 oracle result:   :abc
                 postgres result: {abc}
         """
-        return self.con.get_named_bind_string(name)
+        return self._dialect('get_named_bind_string')(name)
 
     def get_positional_bind_string(self, pos=1):
         """ Return a positional bind(substitution) string.
@@ -400,7 +1021,7 @@ class DesDbi:
                 oracle result:   :1
                 postgres result: {}
         """
-        return self.con.get_positional_bind_string(pos)
+        return self._dialect('get_positional_bind_string')(pos)
 
     def get_regex_clause(self, target, pattern, case_sensitive=True):
         """ Return a dialect-specific regular expression matching clause.
@@ -490,7 +1111,7 @@ class DesDbi:
                 oracle result:   REGEXP_LIKE(:1, :1, 'c')
                 postgres result:({} ~ {})
         """
-        return self.con.get_regex_format(case_sensitive)
+        return self._dialect('get_regex_format')(case_sensitive)
 
     def get_seq_next_clause(self, seqname):
         """ Return an SQL expression that extracts the next value from a sequence.
@@ -512,7 +1133,7 @@ class DesDbi:
                 oracle result:   seq1.NEXTVAL
                 postgres result: nextval('seq1')
         """
-        return self.con.get_seq_next_clause(seqname)
+        return self._dialect('get_seq_next_clause')(seqname)
 
     def get_seq_next_value(self, seqname):
         """ Return the next value from the specified sequence.
@@ -534,11 +1155,76 @@ class DesDbi:
                 expression:           get_seq_next_value('seq1')
                 oracle result from:   SELECT seq1.NEXTVAL FROM DUAL
                 postgres result from: SELECT nextval('seq1')
+
+            If a cache has been set up for the sequence with cache_sequence(),
+            the value is taken from it.
         """
+        cache = self._seqcache.get(seqname.upper())
+        if cache is not None:
+            if not cache['values']:
+                cache['values'].extend(self.get_seq_next_values(seqname, cache['blocksize']))
+            return cache['values'].popleft()
         expr = self.get_seq_next_clause(seqname)
         return self.exec_sql_expression(expr)[0]
 
-    def insert_many(self, table, columns, rows):
+    def get_seq_next_values(self, seqname, n):
+        """ Return the next n values from the specified sequence.
+
+            All of the values are fetched in a single round trip.
+
+            Parameters
+            ----------
+            seqname : str
+                The sequence to get the values from.
+
+            n : int
+                The number of values.
+
+            Returns
+            -------
+            list
+                The values in increasing order.  As with any sequence, they
+                need not be contiguous.
+
+            Examples:
+                expression:           get_seq_next_values('seq1', 3)
+                oracle result from:   SELECT seq1.NEXTVAL FROM DUAL CONNECT BY LEVEL <= 3
+        """
+        if n <= 0:
+            return []
+        return self.con.get_seq_next_values(seqname, n)
+
+    def cache_sequence(self, seqname, blocksize=100):
+        """ Have get_seq_next_value() take values of a sequence from a client
+            side cache, refilled blocksize values at a time.
+
+            A loop registering N files then needs about N / blocksize round
+            trips for its ids instead of N.  Values still in the cache when the
+            handle is discarded are never used, leaving gaps in the sequence,
+            and values handed out by different sessions are interleaved rather
+            than increasing in the order they were used.  The cache belongs to
+            this handle; handles for other threads and forked processes start
+            without one.
+
+            Parameters
+            ----------
+            seqname : str
+                The name of the sequence.
+
+            blocksize : int, optional
+                The number of values fetched per round trip. Default is 100;
+                None or 0 removes the cache and discards its values.
+        """
+        if not blocksize:
+            self._seqcache.pop(seqname.upper(), None)
+            return
+        cache = self._seqcache.setdefault(seqname.upper(),
+                                          {'blocksize': blocksize, 'values': collections.deque()})
+        cache['blocksize'] = blocksize
+
+    def insert_many(self, table, columns, rows, batchsize=10000, batchbytes=None,
+                    commit_every=None, inputsizes=False, batcherrors=False, on_error=None,
+                    direct=False, returning=None):
         """ Insert a sequence of rows into the indicated database table.
 
             If each row in rows is a sequence, the values in each row must be in
@@ -547,6 +1233,10 @@ class DesDbi:
             columns can be any iterable that returns the column names and the set
             of keys for each row must match the set of column names.
 
+            Rows may come from any iterable, including a generator, and are sent
+            to the database in batches, so only one batch is held in memory at a
+            time.
+
             Parameters
             ----------
             table : str
@@ -555,12 +1245,317 @@ class DesDbi:
             columns : list
                 Names of the columns to be inserted.
 
-            rows : array like
-                A sequence of rows to insert.
+            rows : iterable
+                The rows to insert.
+
+            batchsize : int, optional
+                The maximum number of rows sent per round trip. Default is 10000.
+
+            batchbytes : int, optional
+                Also end a batch once the estimated size of its bind values
+                reaches this many bytes. Default is None, no limit.
+
+            commit_every : int, optional
+                Commit after every this many batches, and after the last one.
+                Default is None, leave committing to the caller.
+
+            inputsizes : bool, optional
+                Whether to size the bind buffers from the column metadata, see
+                prepare_insert(). Only use this if the values match the column
+                types, e.g. no dates or numbers given as strings. Default is
+                False, the driver sizes the binds from the values.
+
+            batcherrors : bool, optional
+                Whether rows which fail to insert should be reported rather than
+                raise an exception.  The other rows of the batch are inserted in
+                the same round trip, and are committed as usual. Default is False.
+
+            on_error : str, optional
+                What to do when a batch fails without batcherrors. 'raise' (or
+                None) raises the exception.  'bisect' rolls the batch back to a
+                savepoint, splits it in halves and retries each half the same
+                way until the failing rows are isolated and reported as for
+                batcherrors, so a few bad rows cost a few statements each
+                rather than one statement per row.  Bisecting needs autocommit
+                to be off, and cannot be combined with batcherrors. Default is
+                None.
+
+            direct : bool, optional
+                Whether to load with direct-path inserts (APPEND_VALUES on
+                Oracle), which skip most undo and redo generation, for one-off
+                loads into new or staging tables.  A direct-path insert must be
+                committed before the table can be used again, so every batch
+                is committed.  Oracle ignores the hint on tables with triggers,
+                so for these a warning is issued and conventional inserts are
+                used. Cannot be combined with on_error='bisect'. Default is
+                False.
+
+            returning : list, optional
+                Columns whose values, e.g. set by triggers or defaults, are
+                returned for every row inserted, with RETURNING ... INTO and
+                array bound output variables, so no query is needed to read
+                them back. Cannot be combined with direct or on_error='bisect'.
+                Default is None.
+
+            Returns
+            -------
+            dict
+                The number of rows inserted, the number of batches, statements
+                executed and commits, the time taken in seconds and the errors
+                of rows which failed in batcherrors or bisect mode as a list of
+                (row index, error message) tuples, the index counting from 0
+                over all of the rows given.  With returning, also 'returning',
+                a dictionary of the returned values for each row given, None
+                for rows which failed.
         """
-        if not rows:
-            return
-        if hasattr(rows[0], 'keys'):
+        if on_error not in (None, 'raise', 'bisect'):
+            raise ValueError(f'Unknown on_error mode: {on_error}')
+        if direct and on_error == 'bisect':
+            raise ValueError('Direct-path inserts cannot be bisected')
+        if batcherrors and on_error == 'bisect':
+            raise ValueError('batcherrors and on_error=\'bisect\' are alternatives, give only one')
+        if on_error == 'bisect' and self.autocommit():
+            raise ValueError('Bisecting needs autocommit to be off, so that failed batches can be '
+                             'rolled back to a savepoint')
+        if returning and (direct or on_error == 'bisect'):
+            raise ValueError('Returned values cannot be collected from direct-path or bisected inserts')
+        start = time.time()
+        summary = {'rows': 0, 'batches': 0, 'statements': 0, 'commits': 0, 'seconds': 0.0,
+                   'errors': []}
+        if returning:
+            returning = list(returning)
+            summary['returning'] = []
+        seen = 0
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            return summary
+        if direct:
+            triggers = self.get_table_triggers(table)
+            if triggers:
+                warnings.warn(f"Table {table} has triggers ({', '.join(triggers)}), "
+                              "using conventional inserts", RuntimeWarning, stacklevel=2)
+                direct = False
+            else:
+                commit_every = 1
+        named = hasattr(first, 'keys')
+        if returning:
+            # the output variables are bound by name
+            columns = list(columns)
+        stmt = self.prepare_insert(table, columns, named=named or bool(returning),
+                                   inputsizes=inputsizes, direct=direct, returning=returning)
+
+        def bisect(batch, offset):
+            self.savepoint('desdbi_insert_many')
+            summary['statements'] += 1
+            try:
+                stmt.executemany(batch)
+                return len(batch)
+            except Exception as err:
+                self.rollback('desdbi_insert_many')
+                if len(batch) == 1:
+                    summary['errors'].append((offset, str(err).strip()))
+                    return 0
+                half = len(batch) // 2
+                return bisect(batch[:half], offset) + bisect(batch[half:], offset + half)
+
+        def flush(batch):
+            nonlocal seen
+            outvars = None
+            if returning:
+                if not named:
+                    batch = [dict(zip(columns, row)) for row in batch]
+                outvars = self._returning_vars(stmt.cursor, table, returning, len(batch))
+            if batcherrors:
+                summary['statements'] += 1
+                curs = stmt.executemany(batch, outvars=outvars, batcherrors=True,
+                                        arraydmlrowcounts=True)
+                for err in curs.getbatcherrors():
+                    summary['errors'].append((seen + err.offset, err.message))
+                summary['rows'] += sum(curs.getarraydmlrowcounts())
+            elif on_error == 'bisect':
+                summary['rows'] += bisect(batch, seen)
+            else:
+                summary['statements'] += 1
+                stmt.executemany(batch, outvars=outvars)
+                summary['rows'] += len(batch)
+            if returning:
+                for i in range(len(batch)):
+                    values = self._returned(returning, outvars, i)
+                    summary['returning'].append(values[0] if values else None)
+            seen += len(batch)
+            summary['batches'] += 1
+            if commit_every and summary['batches'] % commit_every == 0:
+                self.commit()
+                summary['commits'] += 1
+
+        batch = [first]
+        nbytes = _bind_bytes(first) if batchbytes else 0
+        for row in rows:
+            if len(batch) >= batchsize or (batchbytes and nbytes >= batchbytes):
+                flush(batch)
+                batch = []
+                nbytes = 0
+            batch.append(row)
+            if batchbytes:
+                nbytes += _bind_bytes(row)
+        flush(batch)
+        if commit_every and summary['batches'] % commit_every != 0:
+            self.commit()
+            summary['commits'] += 1
+
+        summary['seconds'] = time.time() - start
+        return summary
+
+    def insert_columns(self, table, arrays, batchsize=10000, **kwargs):
+        """ Insert columnar data into the indicated database table.
+
+            The data are a dictionary of 1-D NumPy arrays (or lists) indexed by
+            column name, a structured array, e.g. a FITS binary table, or a
+            pyarrow Table.  Each batch is converted a column at a time to python
+            values, with masked or null values becoming NULL, so the rows of
+            only one batch exist at any time.  Byte strings, datetime64 and
+            boolean columns are converted according to get_column_types().
+            NumPy and pyarrow are not needed otherwise.
+
+            Parameters
+            ----------
+            table : str
+                Name of the table into which data should be inserted.
+
+            arrays : various
+                The columns to insert.
+
+            batchsize : int, optional
+                The number of rows converted and sent per round trip. Default is
+                10000.
+
+            kwargs
+                Passed to insert_many(), e.g. commit_every or batcherrors.
+
+            Returns
+            -------
+            dict
+                The summary returned by insert_many().
+
+            Raises
+            ------
+            ValueError
+                If the columns are not all the same length or are not columns
+                of the table.
+        """
+        names, nrows, values = columnar.column_source(arrays)
+        types = self.get_column_types(table)
+        unknown = [name for name in names if name.lower() not in types]
+        if unknown:
+            raise ValueError(f"Columns not in table {table}: {', '.join(unknown)}")
+        pytypes = [types[name.lower()] for name in names]
+
+        def rows():
+            for start in range(0, nrows, batchsize):
+                stop = min(start + batchsize, nrows)
+                cols = [values(name, start, stop, pytype) for name, pytype in zip(names, pytypes)]
+                yield from zip(*cols)
+
+        return self.insert_many(table, names, rows(), batchsize=batchsize, **kwargs)
+
+    @contextlib.contextmanager
+    def stage_keys(self, gtt, columns, rows, batchsize=10000):
+        """ Load a list of keys into a global temporary table for the duration
+            of a with block, so that queries can join against it instead of
+            using long IN lists.
+
+                with dbh.stage_keys('gtt_filename', 'filename', names) as gtt:
+                    curs.execute(f'SELECT d.filename, d.filesize FROM desfile d, '
+                                 f'{gtt} g WHERE d.filename = g.filename')
+
+            The keys are array bound with insert_many(), so even millions of
+            them take only a few round trips.  The table is emptied when the
+            block is left, or if loading the keys fails; it must not be committed within the block, as
+            commits empty the DES global temporary tables.
+
+            Parameters
+            ----------
+            gtt : str
+                The name of the global temporary table, e.g. 'gtt_id' or
+                'gtt_filename'.
+
+            columns : str or list
+                The column, or columns, of the table to load.
+
+            rows : iterable
+                The keys; single values if columns is a str, otherwise sequences
+                in the order of columns.
+
+            batchsize : int, optional
+                The number of keys sent per round trip. Default is 10000.
+
+            Returns
+            -------
+            str
+                The name of the table, as the target of the with statement.
+        """
+        if isinstance(columns, str):
+            columns = [columns]
+            rows = ((key,) for key in rows)
+        done = False
+        try:
+            self.insert_many(gtt, columns, rows, batchsize=batchsize)
+            yield gtt
+            done = True
+        finally:
+            try:
+                curs = self.cursor()
+                try:
+                    curs.execute(f'DELETE FROM {gtt}')
+                finally:
+                    curs.close()
+            except Exception as err:
+                # don't hide the error which ended the block
+                if done:
+                    raise
+                print(f"Could not empty {gtt}: {str(err).strip()}")
+
+    def prepare_insert(self, table, columns, named=False, inputsizes=False, direct=False,
+                       returning=None):
+        """ Return a prepared statement which inserts rows into a table.
+
+            With inputsizes, the bind buffers are sized from the metadata of the
+            table's columns, which is looked up once and cached, so every
+            execution binds with buffers large enough for any value the column
+            can hold.  The binds then have the types of the columns, so values
+            must match them, e.g. dates must be datetimes rather than strings.
+
+            Parameters
+            ----------
+            table : str
+                Name of the table into which data should be inserted.
+
+            columns : list
+                Names of the columns to be inserted.
+
+            named : bool, optional
+                Whether rows will be mappings of column name to value rather than
+                sequences in the order of columns. Default is False.
+
+            inputsizes : bool, optional
+                Whether to size the bind buffers from the column metadata.
+                Default is False.
+
+            direct : bool, optional
+                Whether to insert with the direct-path hint of the dialect, if
+                it has one, see insert_many(). Default is False.
+
+            returning : list, optional
+                Columns to return into output variables bound as r_<column>,
+                see insert_many(); requires named. Default is None.
+
+            Returns
+            -------
+            PreparedStatement
+        """
+        columns = list(columns)
+        if named:
             vals = ','.join([self.get_named_bind_string(c) for c in columns])
         else:
             bindStr = self.get_positional_bind_string()
@@ -568,13 +1563,86 @@ class DesDbi:
 
         colStr = ','.join(columns)
 
-        stmt = f'INSERT INTO {table}({colStr}) VALUES({vals})'
+        hint = self._dialect('get_direct_insert_hint')() if direct else ''
+        if hint:
+            hint += ' '
+        sql = f'INSERT {hint}INTO {table}({colStr}) VALUES({vals})'
+        if returning:
+            sql += self._dialect('get_returning_clause')(returning)
+        stmt = self.prepare(sql)
+        if inputsizes and stmt.inputsizes is None:
+            sizes = self.get_input_sizes(table)
+            if named:
+                stmt.setinputsizes({c: sizes.get(c.lower()) for c in columns})
+            else:
+                stmt.setinputsizes([sizes.get(c.lower()) for c in columns])
+        elif not inputsizes:
+            stmt.setinputsizes(None)
+        return stmt
 
-        curs = self.cursor()
-        try:
-            curs.executemany(stmt, rows)
-        finally:
-            curs.close()
+    def get_table_triggers(self, table_name):
+        """ Return the names of the enabled triggers on a table.
+
+            Parameters
+            ----------
+            table_name : str
+                The table whose information needs to be looked up.
+
+            Returns
+            -------
+            list
+        """
+        return list(self._cached_metadata(table_name, 'triggers',
+                                          lambda table: self.con.get_table_triggers(table)))
+
+    def get_input_sizes(self, table_name):
+        """ Return the bind types and sizes for the columns of a table.
+
+            Parameters
+            ----------
+            table_name : str
+                The table whose information needs to be looked up.
+
+            Returns
+            -------
+            dict
+                Values for Cursor.setinputsizes indexed by lower case column
+                name; None where the driver sizes the bind itself.
+        """
+        return dict(self._cached_metadata(table_name, 'inputsizes', self._input_sizes))
+
+    def _input_sizes(self, table_name):
+        """ Determine the bind sizes of a table, reusing cached column descriptions.
+        """
+        return self.con.get_input_sizes(self.get_column_metadata(table_name))
+
+    def _returning_vars(self, curs, table, returning, arraysize=1):
+        """ Create the output variables for a RETURNING clause on a cursor, typed
+            from the column metadata, indexed by bind name.
+        """
+        types = self.get_column_types(table)
+        lengths = self.get_column_lengths(table)
+        meta = self.get_column_metadata(table)
+        outvars = {}
+        for col in returning:
+            pytype = types.get(col.lower()) or str
+            desc = meta.get(col.lower())
+            if pytype is bytearray:
+                pytype = bytes
+            elif pytype is float and desc is not None and desc[defs.COL_SCALE] == 0:
+                # integral NUMBER(p) columns, e.g. generated ids, come back as ints
+                pytype = int
+            size = (lengths.get(col.lower()) or 0) if pytype in (str, bytes) else 0
+            outvars['r_' + col] = curs.var(pytype, size, arraysize=arraysize)
+        return outvars
+
+    @staticmethod
+    def _returned(returning, outvars, pos=0):
+        """ Return the values returned into output variables by one execution,
+            or one row of an array bind, as a dictionary per row affected.
+        """
+        values = [outvars['r_' + col].getvalue(pos) or [] for col in returning]
+        return [dict(zip(returning, row)) for row in zip(*values)]
 
     def insert_many_indiv(self, table, columns, rows):
         """ Insert a sequence of rows into the indicated database table.
@@ -622,6 +1690,62 @@ class DesDbi:
 
         curs.close()
 
+    @staticmethod
+    def build_query(from_, cols='*', where=None, orderby=None):
+        """ Construct the SELECT statement issued by query_simple().
+
+            Parameters
+            ----------
+            from_ : str
+                a string containing the name of a table or view or some
+                other from expression
+
+            cols : various, optional
+                The columns to retrieve; can be a sequence of column names or
+                expressions or a string containing them. Default is '*'
+
+            where : various, optional
+                WHERE expression; can be a string containing the where clause
+                minus "WHERE " or a sequence of expressions to be joined by AND.
+                Default is None.
+
+            orderby : various, optional
+                ORDER BY expression; can be a string containing an ORDER BY
+                expression or a sequence of such expressions. Default is None.
+
+            Returns
+            -------
+            str
+                The SQL statement.
+        """
+        if not from_:
+            raise TypeError('A table name or other from expression is '
+                            'required.')
+
+        if isinstance(cols, (list, set, dict)) and cols:
+            colstr = ','.join(cols)
+        elif cols:
+            colstr = cols
+        else:
+            raise TypeError('A non-empty sequence of column names or '
+                            'expressions or a string of such is required.')
+
+        if isinstance(where, (list, set, dict)) and where:
+            where_str = ' WHERE ' + ' AND '.join(where)
+        elif where:
+            where_str = ' WHERE ' + where
+        else:
+            where_str = ''
+
+        if isinstance(orderby, (list, set, dict)) and orderby:
+            ord_str = ' ORDER BY ' + ','.join(orderby)
+        elif orderby:
+            ord_str = ' ORDER BY ' + orderby
+        else:
+            ord_str = ''
+
+        return f"SELECT {colstr} FROM {from_}{where_str}{ord_str}"
+
     def query_simple(self, from_, cols='*', where=None, orderby=None,
                      params=None, rowtype=dict):
         """ Issue a simple query and return results.
@@ -683,55 +1807,162 @@ class DesDbi:
 
         """
 
-        if not from_:
-            raise TypeError('A table name or other from expression is '
-                            'required.')
+        stmt = self.build_query(from_, cols, where, orderby)
 
-        if isinstance(cols, (list, set, dict)) and cols:
-            colstr = ','.join(cols)
-        elif cols:
-            colstr = cols
-        else:
-            raise TypeError('A non-empty sequence of column names or '
-                            'expressions or a string of such is required.')
+        curs = self.cursor()
+        try:
+            if params:
+                curs.execute(stmt, params)
+            else:
+                curs.execute(stmt)
 
-        if isinstance(where, (list, set, dict)) and where:
-            where_str = ' WHERE ' + ' AND '.join(where)
-        elif where:
-            where_str = ' WHERE ' + where
-        else:
-            where_str = ''
+            rows = curs.fetchall()
+            rcols = [desc[0].lower() for desc in curs.description]
 
-        if isinstance(orderby, (list, set, dict)) and orderby:
-            ord_str = ' ORDER BY ' + ','.join(orderby)
-        elif orderby:
-            ord_str = ' ORDER BY ' + orderby
-        else:
-            ord_str = ''
+        finally:
+            curs.close()
+
+        return self.convert_rows(rows, rcols, rowtype)
+
+    @staticmethod
+    def convert_rows(rows, rcols, rowtype=dict):
+        """ Convert fetched rows to the rowtype requested of query_simple().
+
+            Parameters
+            ----------
+            rows : list
+                The rows as returned by the cursor.
+
+            rcols : list
+                The lower case column names of the rows.
+
+            rowtype : type
+                The type of row to return, see query_simple(). Default is dict.
+
+            Returns
+            -------
+            list
+                The rows, each of the specified rowtype.
+        """
+        if rowtype == dict:
+            return [{col:val for col, val in zip(rcols, row)} for row in rows]
+        if rows and isinstance(rows[0], rowtype):
+            return rows
+        return [rowtype(row) for row in rows]
+
+    def iter_query(self, from_, cols='*', where=None, orderby=None, params=None,
+                   rowtype=dict, arraysize=None, prefetchrows=None, batches=False):
+        """ Issue a simple query and yield its results as they are fetched.
+
+            Takes the same arguments as query_simple(), but rather than
+            fetching every row before returning, the rows are fetched arraysize
+            at a time as they are consumed, so memory use does not grow with
+            the size of the result and the first rows are available as soon as
+            the first fetch completes.  The query is executed when the first
+            row is requested, and the cursor is closed when the results are
+            exhausted or the generator is closed.
+
+            Parameters
+            ----------
+            from_ : str
+                a string containing the name of a table or view or some
+                other from expression
+
+            cols : various, optional
+                The columns to retrieve, see query_simple(). Default is '*'
+
+            where : various, optional
+                WHERE expression, see query_simple(). Default is None.
+
+            orderby : various, optional
+                ORDER BY expression, see query_simple(). Default is None.
+
+            params : array like, optional
+                Bind parameters for the query. Default is None.
+
+            rowtype : type
+                The type of row to yield, see query_simple(). Default is dict.
 
-        stmt = f"SELECT {colstr} FROM {from_}{where_str}{ord_str}"
+            arraysize : int, optional
+                The number of rows fetched per round trip. Default is None, the
+                fetchsize of the handle if it has one, otherwise chosen from
+                the width of the rows of from_, when it is a table, so that
+                each fetch is about a megabyte.
+
+            prefetchrows : int, optional
+                The number of rows returned by the round trip executing the
+                query, on drivers supporting it (cx_Oracle 8 and later);
+                ignored by others. Default is None, the driver's default.
+
+            batches : bool, optional
+                Whether to yield a list of rows per fetch rather than single
+                rows. Default is False.
+
+            Yields
+            ------
+            various
+                The rows, or lists of rows, of the query.
+
+            Example:
+                for row in dbh.iter_query('coadd_object', ['coadd_object_id', 'ra', 'dec'],
+                                          ['tilename = :1'], params=('DES0001+0001',)):
+                    ...
+        """
+        stmt = self.build_query(from_, cols, where, orderby)
+        if arraysize is None:
+            arraysize = self.fetchsize or self._fetch_size(from_, cols)
 
         curs = self.cursor()
         try:
+            curs.arraysize = arraysize
+            if prefetchrows is not None and hasattr(curs, 'prefetchrows'):
+                curs.prefetchrows = prefetchrows
             if params:
                 curs.execute(stmt, params)
             else:
                 curs.execute(stmt)
-
-            rows = curs.fetchall()
             rcols = [desc[0].lower() for desc in curs.description]
 
+            while True:
+                rows = curs.fetchmany(arraysize)
+                if not rows:
+                    break
+                rows = self.convert_rows(rows, rcols, rowtype)
+                if batches:
+                    yield rows
+                else:
+                    yield from rows
         finally:
             curs.close()
 
-        if rowtype == dict:
-            res = [{col:val for col, val in zip(rcols, row)} for row in rows]
-        elif rows and isinstance(rows[0], rowtype):
-            res = rows
-        else:
-            res = [rowtype(row) for row in rows]
+    def _fetch_size(self, from_, cols='*'):
+        """ Choose the number of rows to fetch per round trip from the width of
+            the selected columns of a table.
 
-        return res
+            Columns which are not in the table metadata, e.g. expressions, and
+            from expressions which are not a single table count as 8 bytes.
+        """
+        width = 0
+        table = from_.strip()
+        meta = {}
+        if len(table.split()) == 1 and ',' not in table and '(' not in table:
+            try:
+                meta = self.get_column_metadata(table)
+            except Exception:
+                # a view or synonym which cannot be described, use the defaults
+                meta = {}
+        if isinstance(cols, str):
+            if cols.strip() == '*':
+                names = list(meta.keys()) or ['*']
+            else:
+                names = cols.split(',')
+        else:
+            names = list(cols)
+        for name in names:
+            desc = meta.get(name.strip().lower())
+            length = desc[defs.COL_LENGTH] if desc is not None else None
+            width += length if isinstance(length, int) and length > 0 else 8
+        return max(defs.FETCH_MIN_ROWS, min(defs.FETCH_MAX_ROWS, defs.FETCH_BYTES // width))
 
     #def is_postgres(self):
     #    """ Returns whether or not the current connection is a PostgreSql
@@ -751,12 +1982,42 @@ class DesDbi:
         """
         return self.type == 'oracle'
 
-    def rollback(self):
-        """ Rollback the current transaction.
-        """
+    def rollback(self, savepoint=None):
+        """ Rollback the current transaction, or to a savepoint within it.
 
+            Parameters
+            ----------
+            savepoint : str, optional
+                The name of a savepoint set by savepoint(). Default is None,
+                rollback the whole transaction.
+        """
+        if self._current_con() is None:
+            return None
+        if savepoint is not None:
+            curs = self.cursor()
+            try:
+                curs.execute(f'ROLLBACK TO SAVEPOINT {savepoint}')
+            finally:
+                curs.close()
+            return None
         return self.con.rollback()
 
+    def savepoint(self, name):
+        """ Mark a savepoint in the current transaction, see rollback().
+
+            Setting a savepoint with the name of an earlier one moves it.
+
+            Parameters
+            ----------
+            name : str
+                The name of the savepoint.
+        """
+        curs = self.cursor()
+        try:
+            curs.execute(f'SAVEPOINT {name}')
+        finally:
+            curs.close()
+
     def sequence_drop(self, seq_name):
         """ Drop sequence; do not generate error if it doesn't exist.
 
@@ -781,6 +2042,7 @@ class DesDbi:
                 The name of the table to drop.
         """
         self.con.table_drop(table)
+        self.invalidate_metadata(table)
 
     def from_dual(self):
         """ Get the appropriate dual expression.
@@ -789,7 +2051,7 @@ class DesDbi:
             -------
             str
         """
-        return self.con.from_dual()
+        return self._dialect('from_dual')()
 
     def which_services_file(self):
         """ Returns which services file is being used.
@@ -833,7 +2095,7 @@ class DesDbi:
             -------
             str
         """
-        return self.con.get_current_timestamp_str()
+        return self._dialect('get_current_timestamp_str')()
 
     def query_results_dict(self, sql, tkey):
         """ doc
@@ -852,7 +2114,7 @@ class DesDbi:
 
 
 
-    def basic_insert_row(self, table, row):
+    def basic_insert_row(self, table, row, returning=None):
         """ Insert a row into the table
 
             Parameters
@@ -862,6 +2124,16 @@ class DesDbi:
 
             row : dict
                 Dictionary of the columns and the data to insert.
+
+            returning : list, optional
+                Columns whose values, e.g. an id set by a trigger, should be
+                returned by the insert itself. Default is None.
+
+            Returns
+            -------
+            dict
+                The returned values indexed by column name, if returning was
+                given; otherwise None.
         """
         ctstr = self.get_current_timestamp_str()
 
@@ -876,11 +2148,18 @@ class DesDbi:
                 params[col] = row[col]
 
         sql = f"insert into {table}({','.join(cols)}) values({','.join(namedbind)})"
+        if returning:
+            returning = list(returning)
+            sql += self._dialect('get_returning_clause')(returning)
 
-
-        curs = self.cursor()
+        # the statement text depends only on the table and the set of columns,
+        # so repeated inserts into a table reuse the prepared statement
+        outvars = None
         try:
-            curs.execute(sql, params)
+            stmt = self.prepare(sql)
+            if returning:
+                outvars = self._returning_vars(stmt.cursor, table, returning)
+            stmt.execute(params, outvars)
         except:
             (_type, value, _) = sys.exc_info()
             print("******************************")
@@ -889,7 +2168,11 @@ class DesDbi:
             print(f"params> {params}\n")
             raise
 
-    def basic_update_row(self, table, updatevals, wherevals):
+        if returning:
+            return self._returned(returning, outvars)[0]
+        return None
+
+    def basic_update_row(self, table, updatevals, wherevals, returning=None):
         """ Update a row in a table
 
             Parameters
@@ -902,6 +2185,16 @@ class DesDbi:
 
             wherevals : dict
                 Dictionary of column names and values to use in the where clause
+
+            returning : list, optional
+                Columns whose values after the update should be returned by the
+                update itself. Default is None.
+
+            Returns
+            -------
+            list
+                A dictionary of the returned values, indexed by column name, for
+                each row updated, if returning was given; otherwise None.
         """
 
         ctstr = self.get_current_timestamp_str()
@@ -930,10 +2223,16 @@ class DesDbi:
 
 
         sql = f"update {table} set {','.join(upclause)} where {' and '.join(whclause)}"
+        if returning:
+            returning = list(returning)
+            sql += self._dialect('get_returning_clause')(returning)
 
-        curs = self.cursor()
+        stmt = self.prepare(sql)
+        outvars = None
         try:
-            curs.execute(sql, params)
+            if returning:
+                outvars = self._returning_vars(stmt.cursor, table, returning)
+            stmt.execute(params, outvars)
         except:
             (_type, value, _) = sys.exc_info()
             print("******************************")
@@ -942,13 +2241,275 @@ class DesDbi:
             print(f"params> {params}\n")
             raise
 
-        if curs.rowcount == 0:
+        if stmt.rowcount == 0:
             print("******************************")
             print(f"sql> {sql}\n")
             print(f"params> {params}\n")
             raise Exception(f"Error: 0 rows updated in table {table}")
 
-        curs.close()
+        if returning:
+            return self._returned(returning, outvars)
+        return None
+
+    def update_many(self, table, set_cols, where_cols, rows, batchsize=10000,
+                    fail_on_zero=False, returning=None):
+        """ Update many rows of a table with a single statement per batch.
+
+            Each row gives the new values of set_cols and the values of
+            where_cols identifying the rows to update.  As in
+            basic_update_row(), a value equal to get_current_timestamp_str() is
+            put in the statement rather than bound, and a None where value
+            matches NULL; rows which differ in this respect are run as
+            separate statements.
+
+            Parameters
+            ----------
+            table : str
+                The name of the table to update.
+
+            set_cols : list
+                The names of the columns to update.
+
+            where_cols : list
+                The names of the columns used in the where clause.
+
+            rows : iterable
+                The rows, each a dictionary indexed by column name or a
+                sequence of the set_cols values followed by the where_cols
+                values.
+
+            batchsize : int, optional
+                The maximum number of rows sent per round trip. Default is 10000.
+
+            fail_on_zero : bool, optional
+                Whether to raise an exception, after the batch has been run, if
+                any row updated nothing. Default is False.
+
+            returning : list, optional
+                Columns whose values after the update should be returned, with
+                RETURNING ... INTO and array bound output variables. Default is
+                None.
+
+            Returns
+            -------
+            list
+                The number of rows updated by each row given or, with returning,
+                for each row given a list of the values returned for the rows
+                it updated, as dictionaries indexed by column name.
+        """
+        return self._dml_many(table, list(set_cols), list(where_cols), rows, batchsize,
+                              fail_on_zero, list(returning) if returning else None)
+
+    def delete_many(self, table, where_cols, rows, batchsize=10000, fail_on_zero=False):
+        """ Delete many sets of rows from a table with a single statement per batch.
+
+            Parameters
+            ----------
+            table : str
+                The name of the table.
+
+            where_cols : list
+                The names of the columns used in the where clause.
+
+            rows : iterable
+                The rows, each a dictionary indexed by column name or a
+                sequence of the where_cols values.  Values are treated as in
+                update_many().
+
+            batchsize : int, optional
+                The maximum number of rows sent per round trip. Default is 10000.
+
+            fail_on_zero : bool, optional
+                Whether to raise an exception, after the batch has been run, if
+                any row deleted nothing. Default is False.
+
+            Returns
+            -------
+            list
+                The number of rows deleted by each row given.
+        """
+        return self._dml_many(table, [], list(where_cols), rows, batchsize, fail_on_zero)
+
+    def upsert_many(self, table, key_cols, cols, rows, batchsize=10000, stage=None):
+        """ Insert rows into a table, or update the rows which have the same keys.
+
+            Each batch of rows is array bound to a statement updating existing
+            rows and then, for the rows which matched nothing, to one inserting
+            them (on Oracle, both are MERGE statements).  For very large loads
+            the rows can instead be staged through a global temporary table
+            with the same columns and merged with a single statement per batch.
+            A key given more than once in a batch is applied once, with the
+            last of its rows, and counted as an insert or update followed by
+            updates.
+
+            Parameters
+            ----------
+            table : str
+                The name of the table.
+
+            key_cols : list
+                The columns which identify a row; on the sqlite test database
+                they must have a unique index.
+
+            cols : list
+                All of the columns given, including the key columns.
+
+            rows : iterable
+                The rows, each a dictionary indexed by column name or a
+                sequence in the order of cols.
+
+            batchsize : int, optional
+                The maximum number of rows sent per round trip. Default is 10000.
+
+            stage : str, optional
+                The name of the temporary table to stage rows in. Default is
+                None, bind the rows directly.
+
+            Returns
+            -------
+            dict
+                The number of rows inserted and updated.
+        """
+        key_cols = list(key_cols)
+        cols = list(cols)
+        if not key_cols or not set(key_cols) <= set(cols):
+            raise ValueError('The key columns must be among the columns')
+        result = {'inserted': 0, 'updated': 0}
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batchsize:
+                self._upsert_batch(table, key_cols, cols, batch, stage, result)
+                batch = []
+        if batch:
+            self._upsert_batch(table, key_cols, cols, batch, stage, result)
+        return result
+
+    def _upsert_batch(self, table, key_cols, cols, batch, stage, result):
+        """ Upsert one batch of upsert_many(), adding to the counts in result.
+        """
+        params = {}
+        for row in batch:
+            if not hasattr(row, 'keys'):
+                row = dict(zip(cols, row))
+            key = tuple(row[c] for c in key_cols)
+            if key in params:
+                # the later row updates the one it repeats
+                result['updated'] += 1
+            params[key] = {c: row[c] for c in cols}
+        params = list(params.values())
+
+        if stage is not None:
+            self.insert_many(stage, cols, params)
+            on = ' AND '.join(f't.{c} = s.{c}' for c in key_cols)
+            curs = self.cursor()
+            try:
+                curs.execute(f'SELECT COUNT(*) FROM {stage} s WHERE EXISTS '
+                             f'(SELECT 1 FROM {table} t WHERE {on})')
+                matched = curs.fetchone()[0]
+                curs.execute(self._dialect('get_merge_statement')(table, stage, key_cols, cols))
+                merged = curs.rowcount
+                curs.execute(f'DELETE FROM {stage}')
+            finally:
+                curs.close()
+            if len(key_cols) < len(cols):
+                result['updated'] += matched
+                result['inserted'] += merged - matched
+            else:
+                result['inserted'] += merged
+            return
+
+        update, insert = self._dialect('get_upsert_statements')(table, key_cols, cols)
+        if update is not None:
+            curs = self.prepare(update).executemany(params, arraydmlrowcounts=True)
+            counts = curs.getarraydmlrowcounts()
+            result['updated'] += sum(counts)
+            params = [p for p, count in zip(params, counts) if not count]
+        if params:
+            curs = self.prepare(insert).executemany(params, arraydmlrowcounts=True)
+            result['inserted'] += sum(curs.getarraydmlrowcounts())
+
+    def _dml_many(self, table, set_cols, where_cols, rows, batchsize, fail_on_zero,
+                  returning=None):
+        """ Run update_many() or delete_many(), which is chosen by whether there
+            are set_cols.
+        """
+        counts = []
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batchsize:
+                counts.extend(self._dml_batch(table, set_cols, where_cols, batch, fail_on_zero,
+                                              len(counts), returning))
+                batch = []
+        if batch:
+            counts.extend(self._dml_batch(table, set_cols, where_cols, batch, fail_on_zero,
+                                          len(counts), returning))
+        return counts
+
+    def _dml_batch(self, table, set_cols, where_cols, batch, fail_on_zero, offset,
+                   returning=None):
+        """ Run one batch of update_many() or delete_many() and return its row
+            counts, or with returning the returned values.
+        """
+        ctstr = self.get_current_timestamp_str()
+        groups = collections.OrderedDict()
+        for i, row in enumerate(batch):
+            if not hasattr(row, 'keys'):
+                row = dict(zip(set_cols + where_cols, row))
+            ctset = tuple(c for c in set_cols if row[c] == ctstr)
+            ctwhere = tuple(c for c in where_cols if row[c] == ctstr)
+            nullwhere = tuple(c for c in where_cols if row[c] is None)
+            params = {'u_' + c: row[c] for c in set_cols if c not in ctset}
+            params.update({'w_' + c: row[c] for c in where_cols
+                           if c not in ctwhere and c not in nullwhere})
+            groups.setdefault((ctset, ctwhere, nullwhere), []).append((i, params))
+
+        counts = [0] * len(batch)
+        returned = [[] for _ in batch]
+        for (ctset, ctwhere, nullwhere), members in groups.items():
+            whclause = []
+            for c in where_cols:
+                if c in ctwhere:
+                    whclause.append(f"{c}={ctstr}")
+                elif c in nullwhere:
+                    whclause.append(f"{c} is NULL")
+                else:
+                    whclause.append(f"{c}={self.get_named_bind_string('w_' + c)}")
+            if set_cols:
+                upclause = [f"{c}={ctstr}" if c in ctset else
+                            f"{c}={self.get_named_bind_string('u_' + c)}" for c in set_cols]
+                sql = f"update {table} set {','.join(upclause)} where {' and '.join(whclause)}"
+            else:
+                sql = f"delete from {table} where {' and '.join(whclause)}"
+            if returning:
+                sql += self._dialect('get_returning_clause')(returning)
+
+            params = [p for _, p in members]
+            outvars = None
+            try:
+                stmt = self.prepare(sql)
+                if returning:
+                    outvars = self._returning_vars(stmt.cursor, table, returning, len(params))
+                curs = stmt.executemany(params, outvars=outvars, arraydmlrowcounts=True)
+            except:
+                (_type, value, _) = sys.exc_info()
+                print("******************************")
+                print("Error:", _type, value)
+                print(f"sql> {sql}\n")
+                raise
+            for j, ((i, _), count) in enumerate(zip(members, curs.getarraydmlrowcounts())):
+                counts[i] = count
+                if returning:
+                    returned[i] = self._returned(returning, outvars, j)
+
+        if fail_on_zero and 0 in counts:
+            zero = [offset + i for i, count in enumerate(counts) if count == 0]
+            verb = 'updated' if set_cols else 'deleted'
+            print("******************************")
+            print(f"rows> {zero}\n")
+            raise Exception(f"Error: 0 rows {verb} in table {table}")
+        return returned if returning else counts
 
     def ping(self):
         """ Determine if the database connection is still live.
@@ -956,6 +2517,97 @@ class DesDbi:
             Returns
             -------
             bool
-                Whether the connection is still live.
+                Whether the connection is still live; False if the handle is
+                not connected.
         """
-        return self.con.ping()
+        with self._uselock:
+            con = self._current_con()
+            if con is None:
+                return False
+            self.last_used = time.time()
+            alive = con.ping()
+        if alive:
+            self.last_alive = time.time()
+        return alive
+
+    def start_keepalive(self, interval=300):
+        """ Start a background thread that keeps the connection verified alive.
+
+            The thread pings the connection once it has been idle, neither used
+            nor verified alive, for interval seconds, so that
+            reconnect(maxage=interval) can skip its own round trip.  It never opens a connection, does not ping
+            while the handle is executing a prepared statement, pinging or
+            closing, and reports a connection found dead.  The thread shares
+            the connection with the caller, so an Oracle connection must be
+            threaded; a handle created with keepalive is.  The thread stops
+            when the handle is closed or garbage collected.
+
+            Parameters
+            ----------
+            interval : float, optional
+                The number of seconds between liveness checks. Default is 300.
+
+            Raises
+            ------
+            ValueError
+                If the handle has an open Oracle connection which is not
+                threaded.
+        """
+        if self.type == 'oracle' and self.pool is None and not self.configdict.get('threaded'):
+            if self._current_con() is not None:
+                raise ValueError('A keepalive needs a threaded connection, '
+                                 'open the handle with threaded=True')
+            self.configdict['threaded'] = True
+        self.stop_keepalive()
+        self.keepalive_interval = interval
+        self._keepalive_stop = threading.Event()
+        thread = threading.Thread(target=_keepalive, name='DesDbi-keepalive',
+                                  args=(weakref.ref(self), interval, self._keepalive_stop))
+        thread.daemon = True
+        thread.start()
+
+    def stop_keepalive(self):
+        """ Stop the background keepalive thread, if one is running.
+        """
+        if self._keepalive_stop is not None:
+            self._keepalive_stop.set()
+            self._keepalive_stop = None
+        self.keepalive_interval = None
+
+def _keepalive(dbhref, interval, stop):
+    """ Body of the keepalive thread started by DesDbi.start_keepalive.
+
+        Parameters
+        ----------
+        dbhref : weakref.ref
+            Reference to the DesDbi handle, so the thread does not keep it alive.
+
+        interval : float
+            The number of seconds between liveness checks.
+
+        stop : threading.Event
+            Event set when the thread should exit.
+    """
+    wait = interval
+    while not stop.wait(wait):
+        dbh = dbhref()
+        if dbh is None:
+            return
+        last = max(dbh.last_alive or 0, dbh.last_used or 0)
+        # a lazy handle which never connected is left alone, and a handle in
+        # use is skipped, as it is evidently alive
+        if (dbh._current_con() is not None and time.time() - last >= interval
+                and dbh._uselock.acquire(blocking=False)):
+            try:
+                if not dbh.ping():
+                    print(f"{time.strftime('%x %X')}: keepalive found the database connection dead: {dbh}")
+            except Exception as err:
+                print(f"{time.strftime('%x %X')}: keepalive ping failed: {str(err).strip()}")
+            finally:
+                dbh._uselock.release()
+        # sleep until the connection next becomes due for a check
+        last = max(dbh.last_alive or 0, dbh.last_used or 0)
+        wait = interval
+        if last + interval > time.time():
+            wait = last + interval - time.time()
+        del dbh
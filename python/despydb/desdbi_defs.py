@@ -13,3 +13,9 @@ COL_LENGTH = 3
 COL_PRECISION = 4
 COL_SCALE = 5
 COL_NULLOK = 6
+
+# Bounds on the number of rows fetched per round trip when it is chosen from
+# the width of the rows, so that each fetch transfers about FETCH_BYTES.
+FETCH_BYTES = 1 << 20
+FETCH_MIN_ROWS = 100
+FETCH_MAX_ROWS = 10000
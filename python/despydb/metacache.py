@@ -0,0 +1,140 @@
+"""
+    Provide a cache of table column metadata.
+
+    Classes:
+        ColumnMetadataCache - Holds the column descriptions of tables, as used by
+                              DesDbi.get_column_metadata() and friends, with an
+                              optional time to live, explicit invalidation and
+                              hit/miss counters.  A cache may belong to a single
+                              DesDbi handle or be shared by all handles of the
+                              process connected to the same database.
+
+    Developed at:
+    The National Center for Supercomputing Applications(NCSA).
+
+    Copyright(C) 2026 Board of Trustees of the University of Illinois.
+    All rights reserved.
+
+"""
+
+import threading
+import time
+
+class ColumnMetadataCache:
+    """ Cache of column metadata, indexed by table name and kind of metadata.
+
+        The kinds used by DesDbi are 'metadata' (the column description
+        sequences) and 'types' (the python types of the columns).  Table names
+        are not case sensitive.  Cached values are shared with the caller and
+        must not be modified.
+
+        Parameters
+        ----------
+        ttl : float, optional
+            The number of seconds an entry is valid for. Default is None, entries
+            never expire.
+    """
+
+    _shared = {}
+    _sharedlock = threading.Lock()
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, key, ttl=None):
+        """ Return the process-wide cache for a database, creating it if needed.
+
+            Parameters
+            ----------
+            key : hashable
+                Identifies the database (and schema) the metadata belongs to.
+
+            ttl : float, optional
+                The time to live used if the cache is created. Default is None.
+
+            Returns
+            -------
+            ColumnMetadataCache
+        """
+        with cls._sharedlock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(ttl)
+            return cls._shared[key]
+
+    def get(self, table, kind):
+        """ Return cached metadata, or None if it is not cached or has expired.
+
+            Parameters
+            ----------
+            table : str
+                The name of the table.
+
+            kind : str
+                The kind of metadata.
+
+            Returns
+            -------
+            various
+        """
+        key = (table.lower(), kind)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.time() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def put(self, table, kind, value):
+        """ Store metadata in the cache.
+
+            Parameters
+            ----------
+            table : str
+                The name of the table.
+
+            kind : str
+                The kind of metadata.
+
+            value : various
+                The metadata.
+        """
+        with self._lock:
+            self._entries[(table.lower(), kind)] = (time.time(), value)
+
+    def invalidate(self, table=None):
+        """ Remove the metadata of a table, or of all tables, from the cache.
+
+            Parameters
+            ----------
+            table : str, optional
+                The name of the table. Default is None, clear the whole cache.
+        """
+        with self._lock:
+            if table is None:
+                self._entries.clear()
+            else:
+                table = table.lower()
+                for key in [k for k in self._entries if k[0] == table]:
+                    del self._entries[key]
+
+    def stats(self):
+        """ Return the usage statistics of the cache.
+
+            Returns
+            -------
+            dict
+                The number of hits, misses and cached entries.
+        """
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'entries': len(self._entries)}
@@ -29,21 +29,36 @@ import socket
 import cx_Oracle
 
 import despydb.errors as errors
+import despydb.oradialect as oradialect
 
 import despymisc.miscutils as miscutils
 
-# Construct a name for the v$session module column to allow database auditing.
+_MODULE_NAME = None
 
-import __main__
-try:
-    _MODULE_NAME = __main__.__file__
-except AttributeError:
-    _MODULE_NAME = "unavailable"
+def _module_name():
+    """ Construct a name for the v$session module column to allow database auditing.
 
-if _MODULE_NAME.rfind('/') > -1:
-    _MODULE_NAME = _MODULE_NAME[_MODULE_NAME.rfind('/') + 1:]
-_MODULE_NAME += '@' + socket.getfqdn()
-_MODULE_NAME = _MODULE_NAME[:48]
+        The name includes the fully qualified host name, which may need a DNS
+        lookup, so it is built on first use rather than at import time and then
+        reused.
+
+        Returns
+        -------
+        str
+    """
+    global _MODULE_NAME
+    if _MODULE_NAME is None:
+        import __main__
+        try:
+            name = __main__.__file__
+        except AttributeError:
+            name = "unavailable"
+
+        if name.rfind('/') > -1:
+            name = name[name.rfind('/') + 1:]
+        name += '@' + socket.getfqdn()
+        _MODULE_NAME = name[:48]
+    return _MODULE_NAME
 
 # No need to rebuild this mapping every time it is used, so make it a global
 # module object.
@@ -71,13 +86,106 @@ _TYPE_MAP = {cx_Oracle.BINARY       : bytearray,
              cx_Oracle.NCHAR        : str
             }
 
+# Map the DATA_TYPE values of the data dictionary to the cx_Oracle types found in
+# cursor descriptions.  Types with parameters, such as TIMESTAMP(6), are looked up
+# by the part before the parenthesis.
+_DATA_TYPE_MAP = {'BINARY_DOUBLE': cx_Oracle.NATIVE_FLOAT,
+                  'BINARY_FLOAT' : cx_Oracle.NATIVE_FLOAT,
+                  'BLOB'         : cx_Oracle.BLOB,
+                  'CHAR'         : cx_Oracle.FIXED_CHAR,
+                  'CLOB'         : cx_Oracle.CLOB,
+                  'DATE'         : cx_Oracle.DATETIME,
+                  'FLOAT'        : cx_Oracle.NUMBER,
+                  'INTERVAL'     : cx_Oracle.INTERVAL,
+                  'LONG'         : cx_Oracle.LONG_STRING,
+                  'LONG RAW'     : cx_Oracle.LONG_BINARY,
+                  'NCHAR'        : cx_Oracle.FIXED_NCHAR,
+                  'NCLOB'        : cx_Oracle.NCLOB,
+                  'NUMBER'       : cx_Oracle.NUMBER,
+                  'NVARCHAR2'    : cx_Oracle.STRING,
+                  'RAW'          : cx_Oracle.BINARY,
+                  'ROWID'        : cx_Oracle.ROWID,
+                  'TIMESTAMP'    : cx_Oracle.TIMESTAMP,
+                  'VARCHAR2'     : cx_Oracle.STRING,
+                  # ANSI names which may appear in DDL, but not the data dictionary
+                  'DECIMAL'      : cx_Oracle.NUMBER,
+                  'DOUBLE'       : cx_Oracle.NUMBER,
+                  'INT'          : cx_Oracle.NUMBER,
+                  'INTEGER'      : cx_Oracle.NUMBER,
+                  'NUMERIC'      : cx_Oracle.NUMBER,
+                  'REAL'         : cx_Oracle.NUMBER,
+                  'SMALLINT'     : cx_Oracle.NUMBER,
+                  'VARCHAR'      : cx_Oracle.STRING
+                 }
+
+# The DATA_LENGTH the data dictionary reports for the types of fixed length
+_DATA_LENGTHS = {'BINARY_DOUBLE': 8,
+                 'BINARY_FLOAT' : 4,
+                 'DATE'         : 7,
+                 'TIMESTAMP'    : 11
+                }
+# Types which the data dictionary reports as NUMBER(38)
+_INTEGER_TYPES = ('INT', 'INTEGER', 'SMALLINT')
+
+# Oracle limits the number of expressions in an IN list.
+_MAX_IN_LIST = 1000
+
 # Define some symbolic names for oracle error codes to make it clearer what
 # the error codes mean.
 
 _ORA_NO_TABLE_VIEW = 942    # table or view does not exist
 _ORA_NO_SEQUENCE = 2289   # sequence does not exist
 
-class OracleConnection(cx_Oracle.Connection):
+def _connect_args(access_data):
+    """ Build the cx_Oracle connection arguments from the service access data.
+
+        Parameters
+        ----------
+        access_data : dict
+            Dictionary of the connection parameters, see OracleConnection.
+
+        Returns
+        -------
+        tuple
+            The user name, the password and a dictionary of the remaining
+            keyword arguments for cx_Oracle.
+
+        Raises
+        ------
+        errors.MissingDBId
+            If neither a sid nor a name is given.
+    """
+    cx_args = {}
+    user = access_data['user']
+    pswd = access_data['passwd']
+
+    kwargs = {'host': access_data['server'], 'port': access_data['port']}
+
+    # Take SID first as specified by DESDM-3.
+    if access_data.get('sid', None):
+        kwargs['sid'] = access_data['sid']
+    elif access_data.get('name', None):
+        kwargs['service_name'] = access_data['name']
+    else:
+        raise errors.MissingDBId()
+    if access_data.get('service', None):
+        kwargs['service'] = access_data['service']
+    if 'sid' in kwargs:
+        cdt = f"(SID={kwargs['sid']})"
+    else:
+        cdt = f"(SERVICE_NAME={kwargs['service_name']})"
+    if 'service' in kwargs:
+        cdt += f"(SERVER={kwargs['service']})"
+        cx_args['cclass'] = 'DESDM'
+        cx_args['purity'] = cx_Oracle.ATTR_PURITY_SELF
+    dsn = f"(DESCRIPTION=(ADDRESS=(PROTOCOL=TCP)(HOST={kwargs['host']})(PORT={kwargs['port']}))(CONNECT_DATA={cdt}))"
+    if access_data.get('threaded', None):
+        cx_args['threaded'] = True
+
+    cx_args['dsn'] = dsn
+    return user, pswd, cx_args
+
+class OracleConnection(oradialect.OracleDialect, cx_Oracle.Connection):
     """ Provide cx_Oracle-specific implementations of canonical database methods.
         Connect the OracleConnection instance to the database identified in
         access_data.
@@ -95,64 +203,100 @@ class OracleConnection(cx_Oracle.Connection):
             * sid or name - the identity of the database to use
             * service - (optional) a special service to use
             * threaded - (optional) whether to create a thread safe connection
+            * stmtcachesize - (optional) the number of statements in the client
+              statement cache
 
         runningTest : bool, optional
             Only used when running tests ans actual connections are not made
 
-    """
+        pool : cx_Oracle.SessionPool, optional
+            A session pool, as returned by create_pool, to check the session
+            out of instead of opening a new one. Default is None.
 
-    def __init__(self, access_data):
-        cx_args = {}
-        user = access_data['user']
-        pswd = access_data['passwd']
+    """
 
-        kwargs = {'host': access_data['server'], 'port': access_data['port']}
+    def __init__(self, access_data, pool=None):
+        user, pswd, cx_args = _connect_args(access_data)
 
-        # Take SID first as specified by DESDM-3.
-        if access_data.get('sid', None):
-            kwargs['sid'] = access_data['sid']
-        elif access_data.get('name', None):
-            kwargs['service_name'] = access_data['name']
-        else:
-            raise errors.MissingDBId()
-        if access_data.get('service', None):
-            kwargs['service'] = access_data['service']
-        if 'sid' in kwargs:
-            cdt = f"(SID={kwargs['sid']})"
+        if pool is not None:
+            # Check a session out of the pool rather than logging on.  The
+            # DRCP connection class and purity still apply to pooled sessions.
+            cx_args = {k: v for k, v in cx_args.items() if k in ('cclass', 'purity')}
+            miscutils.fwdebug(3, "CXORACLE_DEBUG", f"pooled connection {cx_args}")
+            cx_Oracle.Connection.__init__(self, pool=pool, **cx_args)
         else:
-            cdt = f"(SERVICE_NAME={kwargs['service_name']})"
-        if 'service' in kwargs:
-            cdt += f"(SERVER={kwargs['service']})"
-            cx_args['cclass'] = 'DESDM'
-            cx_args['purity'] = cx_Oracle.ATTR_PURITY_SELF
-        dsn = f"(DESCRIPTION=(ADDRESS=(PROTOCOL=TCP)(HOST={kwargs['host']})(PORT={kwargs['port']}))(CONNECT_DATA={cdt}))"
-        if access_data.get('threaded', None):
-            cx_args['threaded'] = True
+            #miscutils.fwdebug(3, "CXORACLE_DEBUG", "dsn = %s" % dsn)
+            miscutils.fwdebug(3, "CXORACLE_DEBUG", str(cx_args))
+            cx_Oracle.Connection.__init__(self, user=user, password=pswd, **cx_args)
+
+        self.module = _module_name()
+        if access_data.get('stmtcachesize', None):
+            self.stmtcachesize = int(access_data['stmtcachesize'])
 
-        cx_args['dsn'] = dsn
+    @staticmethod
+    def create_pool(access_data, minsess=1, maxsess=8, increment=1, timeout=60):
+        """ Create a cx_Oracle SessionPool for the database identified in access_data.
 
-        #miscutils.fwdebug(3, "CXORACLE_DEBUG", "dsn = %s" % dsn)
-        miscutils.fwdebug(3, "CXORACLE_DEBUG", str(cx_args))
-        cx_Oracle.Connection.__init__(self, user=user, password=pswd, **cx_args)
+            Sessions are checked out of the returned pool by passing it as the
+            pool argument when constructing an OracleConnection.
+
+            Parameters
+            ----------
+            access_data : dict
+                Dictionary of the connection parameters, see the class
+                documentation.
 
-        self.module = _MODULE_NAME
+            minsess : int, optional
+                The minimum number of sessions kept open. Default is 1.
+
+            maxsess : int, optional
+                The maximum number of sessions the pool may open. Default is 8.
+
+            increment : int, optional
+                The number of sessions opened when the pool needs to grow.
+                Default is 1.
+
+            timeout : float, optional
+                The number of seconds to wait for a free session before giving
+                up. Default is 60.
+
+            Returns
+            -------
+            cx_Oracle.SessionPool
+        """
+        user, pswd, cx_args = _connect_args(access_data)
+        miscutils.fwdebug(3, "CXORACLE_DEBUG", f"session pool {minsess}/{maxsess}/{increment}")
+        return cx_Oracle.SessionPool(user=user, password=pswd, dsn=cx_args['dsn'],
+                                     min=minsess, max=maxsess, increment=increment,
+                                     threaded=True,
+                                     getmode=cx_Oracle.SPOOL_ATTRVAL_TIMEDWAIT,
+                                     wait_timeout=int(timeout * 1000))
 
     def cursor(self, fetchsize=None):
         """ Return a cx_Oracle Cursor object for operating on the connection.
 
-            The fetchsize argument is ignored, but retained for compatibility
-            with other connection types.
+            Parameters
+            ----------
+            fetchsize : int, optional
+                The number of rows fetched per round trip, which becomes the
+                arraysize of the cursor and, with cx_Oracle 8 or later, also
+                its prefetchrows, so that the round trip executing a query
+                already returns the first fetch. Default is None, the driver's
+                defaults.
 
             Returns
             -------
             cx_Oracle.cursor
                 Cursor for use with the database.
         """
-        #pylint: disable=unused-argument
-        # cx_Oracle doesn't implement/need named cursors, so ignore fetchsize.
-        return cx_Oracle.Connection.cursor(self)
-
-    def get_column_types(self, table_name):
+        curs = cx_Oracle.Connection.cursor(self)
+        if fetchsize:
+            curs.arraysize = fetchsize
+            if hasattr(curs, 'prefetchrows'):
+                curs.prefetchrows = fetchsize
+        return curs
+
+    def get_column_types(self, table_name, metadata=None):
         """ Return a dictionary of python types indexed by column name for a table.
 
             Parameters
@@ -160,12 +304,19 @@ class OracleConnection(cx_Oracle.Connection):
             table_name : str
                 The name of the table for which the column data are retrieved.
 
+            metadata : dict, optional
+                Column descriptions of the table, as returned by
+                DesDbi.get_column_metadata, from which to take the types instead
+                of querying the database. Default is None.
+
             Returns
             -------
             dict
                 Dictionary of column names and their data type as the key/value
                 pairs.
         """
+        if metadata is not None:
+            return {name: _TYPE_MAP[d[1]] for name, d in metadata.items()}
 
         curs = self.cursor()
         curs.execute(f'SELECT * FROM {table_name} WHERE 0=1')
@@ -176,95 +327,225 @@ class OracleConnection(cx_Oracle.Connection):
 
         return types
 
-    def get_expr_exec_format(self):
-        """ Return a format string for a statement to execute SQL expressions.
+    def get_input_sizes(self, metadata):
+        """ Return the bind variable types and sizes for the columns of a table.
+
+            Character columns are bound with buffers as long as the column, and
+            numeric and date columns as their type, so that an array bind is not
+            reallocated when a later row has a longer string or a None where
+            the first row had a value.  Other columns are left to the driver.
+
+            Parameters
+            ----------
+            metadata : dict
+                Column descriptions, as returned by DesDbi.get_column_metadata.
 
             Returns
             -------
-            str
-                The format string.
+            dict
+                The values for Cursor.setinputsizes, indexed by lower case
+                column name; None for columns the driver should size itself.
         """
-
-        return 'SELECT {} FROM DUAL'
-
-    def get_named_bind_string(self, name):
-        """ Return a named bind(substitution) string for name with cx_Oracle.
+        sizes = {}
+        for name, desc in metadata.items():
+            ctype = desc[1]
+            pytype = _TYPE_MAP.get(ctype, ctype)
+            # compared by identity, as the STRING API type equals DB_TYPE_LONG
+            if pytype is str and ctype is not cx_Oracle.CLOB and ctype is not cx_Oracle.LONG_STRING:
+                sizes[name] = desc[3] or desc[2] or None
+            elif pytype is float or pytype is int:
+                sizes[name] = cx_Oracle.NUMBER
+            elif pytype is datetime.datetime:
+                sizes[name] = ctype if ctype in (cx_Oracle.DATETIME, cx_Oracle.TIMESTAMP) \
+                    else cx_Oracle.TIMESTAMP
+            else:
+                sizes[name] = None
+        return sizes
+
+    @staticmethod
+    def describe_column(name, data_type, data_length=None, char_length=None,
+                        precision=None, scale=None, nullable=True):
+        """ Return the cursor.description entry of a column defined in the data
+            dictionary or in DDL.
 
             Parameters
             ----------
             name : str
-                The name to use as the binding.
+                The name of the column.
+
+            data_type : str
+                The SQL type of the column, e.g. 'VARCHAR2' or 'TIMESTAMP(6)'.
+
+            data_length : int, optional
+                The length of the column in bytes. Default is None, the length
+                Oracle uses for the type, if fixed.
+
+            char_length : int, optional
+                The length of a character column in characters. Default is
+                None, data_length.
+
+            precision, scale : int, optional
+                The precision and scale of a numeric column. Default is None.
+
+            nullable : bool, optional
+                Whether the column may be null. Default is True.
 
             Returns
             -------
-            str
-                The properly formatted binding string.
+            tuple
+                The 7-item sequence in the format of cursor.description.
         """
+        base = data_type.split('(')[0].strip().upper()
+        otype = _DATA_TYPE_MAP.get(base, cx_Oracle.STRING)
+        if data_length is None:
+            data_length = 22 if otype is cx_Oracle.NUMBER else _DATA_LENGTHS.get(base)
+        if base in _INTEGER_TYPES and precision is None:
+            precision, scale = 38, 0
+        elif otype is cx_Oracle.NUMBER and precision is None:
+            # as reported by cursor.description for an unconstrained NUMBER
+            precision, scale = 0, -127
+        if otype in (cx_Oracle.STRING, cx_Oracle.FIXED_CHAR, cx_Oracle.FIXED_NCHAR):
+            dsize = char_length or data_length
+        else:
+            dsize = None
+        return (name, otype, dsize, data_length, precision, scale, nullable)
 
-        return ":" + name
-
-    def get_positional_bind_string(self, pos=1):
-        """ Return a positional bind(substitution) string for cx_Oracle.
+    @staticmethod
+    def get_python_type(data_type):
+        """ Return the python type of the values of a column of an SQL type.
 
             Parameters
             ----------
-            pos : int, optional
-                The position number to use in the binding, default is 1
+            data_type : str
+                The SQL type of the column, e.g. 'VARCHAR2' or 'TIMESTAMP(6)'.
 
             Returns
             -------
-            str
-                The properly formatted binding string.
+            type
         """
+        base = data_type.split('(')[0].strip().upper()
+        return _TYPE_MAP[_DATA_TYPE_MAP.get(base, cx_Oracle.STRING)]
 
-        return f":{pos:d}"
+    def get_table_metadata(self, tables):
+        """ Return the column descriptions of several tables from the data dictionary.
 
-    def get_regex_format(self, case_sensitive=True):
-        """ Return a format string for constructing a regular expression clause.
+            All of the tables are described by a single query of ALL_TAB_COLUMNS
+            (one per schema and per 1000 tables).  Table names may be qualified
+            with a schema; others are looked up in the current schema.  Tables
+            not found, such as those reached through synonyms, are left out of
+            the result.
 
             Parameters
             ----------
-            case_sensitive : bool, optional
-                Whenther or not the regex is to be case sensitive (True), or not (False).
-                Default is True, None can be used to let the DB decide what to use.
+            tables : list
+                The names of the tables.
 
             Returns
             -------
-            str
-                Format string for a regular expression
+            dict
+                For each table found, indexed by lower case table name, a
+                dictionary of 7-item sequences in the format of
+                cursor.description, indexed by lower case column name.
+        """
+        return {table: {col[0].lower(): self.describe_column(*col) for col in columns}
+                for table, columns in self.get_table_columns(tables).items()}
+
+    def get_table_columns(self, tables):
+        """ Return the column definitions of several tables from the data dictionary.
+
+            Parameters
+            ----------
+            tables : list
+                The names of the tables, see get_table_metadata().
 
-            Raises
-            ------
-            errors.UnknownCaseSensitiveError
-                If an unknown value for case_sensitive is given.
+            Returns
+            -------
+            dict
+                For each table found, indexed by lower case table name, a list,
+                in column order, of tuples of the column name, data type, data
+                length, character length, precision, scale and nullability,
+                the arguments of describe_column().
         """
+        byowner = {}
+        for table in tables:
+            owner, _, name = table.upper().rpartition('.')
+            byowner.setdefault(owner, []).append(name)
 
-        if case_sensitive is True:
-            param = ", 'c'"
-        elif case_sensitive is False:
-            param = ", 'i'"
-        elif case_sensitive is None:
-            param = '' # Leave it up to the database to decide
-        else:
-            raise errors.UnknownCaseSensitiveError(value=case_sensitive)
+        result = {}
+        curs = self.cursor()
+        try:
+            for owner, names in byowner.items():
+                for i in range(0, len(names), _MAX_IN_LIST):
+                    params = {f't{n}': name for n, name in enumerate(names[i:i + _MAX_IN_LIST])}
+                    inlist = ','.join(':' + key for key in params)
+                    if owner:
+                        params['owner'] = owner
+                        ownerexpr = ':owner'
+                    else:
+                        ownerexpr = "SYS_CONTEXT('USERENV', 'CURRENT_SCHEMA')"
+                    sql = ('SELECT table_name, column_name, data_type, data_length, char_length, '
+                           'data_precision, data_scale, nullable FROM all_tab_columns '
+                           f'WHERE owner = {ownerexpr} AND table_name IN ({inlist}) '
+                           'ORDER BY table_name, column_id')
+                    curs.execute(sql, params)
+                    for (tname, cname, dtype, dlen, clen, prec, scale, nullable) in curs:
+                        key = f'{owner}.{tname}' if owner else tname
+                        result.setdefault(key.lower(), []).append(
+                            (cname, dtype, dlen, clen, prec, scale, nullable == 'Y'))
+        finally:
+            curs.close()
+        return result
 
-        return "REGEXP_LIKE(%%(target)s, %%(pattern)s%s)" % param
+    def get_table_triggers(self, table_name):
+        """ Return the names of the enabled triggers on a table.
 
-    def get_seq_next_clause(self, seqname):
-        """ Return an SQL expression that extracts the next value from a sequence.
+            Parameters
+            ----------
+            table_name : str
+                The name of the table, optionally qualified with a schema.
+
+            Returns
+            -------
+            list
+        """
+        owner, _, name = table_name.upper().rpartition('.')
+        params = {'name': name}
+        if owner:
+            params['owner'] = owner
+            ownerexpr = ':owner'
+        else:
+            ownerexpr = "SYS_CONTEXT('USERENV', 'CURRENT_SCHEMA')"
+        curs = self.cursor()
+        try:
+            curs.execute('SELECT trigger_name FROM all_triggers WHERE table_name = :name '
+                         f"AND table_owner = {ownerexpr} AND status = 'ENABLED'", params)
+            return [row[0] for row in curs]
+        finally:
+            curs.close()
+
+    def get_seq_next_values(self, seqname, n):
+        """ Return the next n values of a sequence in a single round trip.
 
             Parameters
             ----------
             seqname : str
-                The name of the sequence to get the next value for.
+                The name of the sequence.
+
+            n : int
+                The number of values.
 
             Returns
             -------
-            str
-                Expression to obtain the next sequence value.
+            list
+                The values, in increasing order; they need not be contiguous.
         """
-
-        return seqname + '.NEXTVAL'
+        curs = self.cursor()
+        try:
+            curs.arraysize = max(n, 1)
+            curs.execute(f'SELECT {seqname}.NEXTVAL FROM DUAL CONNECT BY LEVEL <= :n', {'n': n})
+            return sorted(row[0] for row in curs)
+        finally:
+            curs.close()
 
     def sequence_drop(self, seq_name):
         """ Drop sequence; do not generate error if it doesn't exist.
@@ -307,27 +588,6 @@ class OracleConnection(cx_Oracle.Connection):
         finally:
             curs.close()
 
-    def from_dual(self):
-        """ Return the proper format for selecting something from DUAL
-
-            Returns
-            -------
-            str
-                The proper DUAL format.
-        """
-        return "from dual"
-
-    def get_current_timestamp_str(self):
-        """ Returns the Oracle specific method name for getting the current time stamp.
-
-            Returns
-            -------
-            str
-                The method name.
-        """
-        return "SYSTIMESTAMP"
-
-
     def ping(self):
         """ Ping the database to make sure the connection is still alive
 
@@ -337,8 +597,8 @@ class OracleConnection(cx_Oracle.Connection):
                 True if the connection is still alive, False otherwise.
         """
         try:
-            curs = self.cursor()
-            curs.execute('select 1 from dual')
+            # a native round trip, no cursor or statement needed
+            cx_Oracle.Connection.ping(self)
             return True
         except Exception:
             return False
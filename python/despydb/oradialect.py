@@ -0,0 +1,246 @@
+"""
+    Define the Oracle SQL dialect used by DES database access methods
+
+    Classes:
+        OracleDialect - Static implementations of the dialect-specific helper
+                        methods for Oracle.  These need neither cx_Oracle nor a
+                        session, so a DesDbi handle can answer them before it
+                        connects.  OracleConnection inherits them.
+
+    Developed at:
+    The National Center for Supercomputing Applications(NCSA).
+
+    Copyright(C) 2026 Board of Trustees of the University of Illinois.
+    All rights reserved.
+
+"""
+
+import despydb.errors as errors
+
+class OracleDialect:
+    """ Provide the Oracle implementations of the dialect-specific helper methods.
+    """
+    __slots__ = ()
+
+    @staticmethod
+    def get_expr_exec_format():
+        """ Return a format string for a statement to execute SQL expressions.
+
+            Returns
+            -------
+            str
+                The format string.
+        """
+
+        return 'SELECT {} FROM DUAL'
+
+    @staticmethod
+    def get_named_bind_string(name):
+        """ Return a named bind(substitution) string for name with cx_Oracle.
+
+            Parameters
+            ----------
+            name : str
+                The name to use as the binding.
+
+            Returns
+            -------
+            str
+                The properly formatted binding string.
+        """
+
+        return ":" + name
+
+    @staticmethod
+    def get_positional_bind_string(pos=1):
+        """ Return a positional bind(substitution) string for cx_Oracle.
+
+            Parameters
+            ----------
+            pos : int, optional
+                The position number to use in the binding, default is 1
+
+            Returns
+            -------
+            str
+                The properly formatted binding string.
+        """
+
+        return f":{pos:d}"
+
+    @staticmethod
+    def get_regex_format(case_sensitive=True):
+        """ Return a format string for constructing a regular expression clause.
+
+            Parameters
+            ----------
+            case_sensitive : bool, optional
+                Whenther or not the regex is to be case sensitive (True), or not (False).
+                Default is True, None can be used to let the DB decide what to use.
+
+            Returns
+            -------
+            str
+                Format string for a regular expression
+
+            Raises
+            ------
+            errors.UnknownCaseSensitiveError
+                If an unknown value for case_sensitive is given.
+        """
+
+        if case_sensitive is True:
+            param = ", 'c'"
+        elif case_sensitive is False:
+            param = ", 'i'"
+        elif case_sensitive is None:
+            param = '' # Leave it up to the database to decide
+        else:
+            raise errors.UnknownCaseSensitiveError(value=case_sensitive)
+
+        return "REGEXP_LIKE(%%(target)s, %%(pattern)s%s)" % param
+
+    @staticmethod
+    def get_seq_next_clause(seqname):
+        """ Return an SQL expression that extracts the next value from a sequence.
+
+            Parameters
+            ----------
+            seqname : str
+                The name of the sequence to get the next value for.
+
+            Returns
+            -------
+            str
+                Expression to obtain the next sequence value.
+        """
+
+        return seqname + '.NEXTVAL'
+
+    @staticmethod
+    def from_dual():
+        """ Return the proper format for selecting something from DUAL
+
+            Returns
+            -------
+            str
+                The proper DUAL format.
+        """
+        return "from dual"
+
+    @staticmethod
+    def get_current_timestamp_str():
+        """ Returns the Oracle specific method name for getting the current time stamp.
+
+            Returns
+            -------
+            str
+                The method name.
+        """
+        return "SYSTIMESTAMP"
+
+    @staticmethod
+    def get_direct_insert_hint():
+        """ Return the hint making an array INSERT use the direct path.
+
+            Returns
+            -------
+            str
+        """
+        return '/*+ APPEND_VALUES */'
+
+    @staticmethod
+    def get_returning_clause(cols):
+        """ Return the clause making a DML statement return column values into
+            output variables, bound by the column names prefixed with r_.
+
+            Parameters
+            ----------
+            cols : list
+                The columns to return.
+
+            Returns
+            -------
+            str
+        """
+        return f" RETURNING {','.join(cols)} INTO {','.join(':r_' + c for c in cols)}"
+
+    @staticmethod
+    def get_upsert_statements(table, key_cols, cols):
+        """ Return the statements DesDbi.upsert_many() runs for each row.
+
+            The first updates the row with the same key values, the second
+            inserts the row if there is none.  Both are MERGE statements
+            selecting the values from DUAL, with named binds named after the
+            columns, so they can be array bound.
+
+            Parameters
+            ----------
+            table : str
+                The name of the table.
+
+            key_cols : list
+                The columns which identify a row.
+
+            cols : list
+                All of the columns given, including the key columns.
+
+            Returns
+            -------
+            tuple
+                The update statement, None if all columns are keys, and the
+                insert statement.
+        """
+        source = ', '.join(f':{c} AS {c}' for c in cols)
+        head = f'MERGE INTO {table} t USING (SELECT {source} FROM DUAL) s ON ({_merge_on(key_cols)})'
+        setcols = [c for c in cols if c not in key_cols]
+        update = None
+        if setcols:
+            update = f'{head} WHEN MATCHED THEN UPDATE SET {_merge_set(setcols)}'
+        insert = f'{head} WHEN NOT MATCHED THEN {_merge_insert(cols)}'
+        return update, insert
+
+    @staticmethod
+    def get_merge_statement(table, source, key_cols, cols):
+        """ Return a statement which upserts all of the rows of one table into another.
+
+            Parameters
+            ----------
+            table : str
+                The name of the table to update.
+
+            source : str
+                The name of the table, typically a global temporary table,
+                holding the new rows.
+
+            key_cols : list
+                The columns which identify a row.
+
+            cols : list
+                All of the columns to copy, including the key columns.
+
+            Returns
+            -------
+            str
+        """
+        sql = f"MERGE INTO {table} t USING (SELECT {', '.join(cols)} FROM {source}) s " \
+              f"ON ({_merge_on(key_cols)})"
+        setcols = [c for c in cols if c not in key_cols]
+        if setcols:
+            sql += f' WHEN MATCHED THEN UPDATE SET {_merge_set(setcols)}'
+        return f'{sql} WHEN NOT MATCHED THEN {_merge_insert(cols)}'
+
+def _merge_on(key_cols):
+    """ Return the ON condition of a MERGE matching target t to source s.
+    """
+    return ' AND '.join(f't.{c} = s.{c}' for c in key_cols)
+
+def _merge_set(setcols):
+    """ Return the SET list of a MERGE update from source s.
+    """
+    return ', '.join(f't.{c} = s.{c}' for c in setcols)
+
+def _merge_insert(cols):
+    """ Return the INSERT clause of a MERGE from source s.
+    """
+    return f"INSERT ({', '.join(cols)}) VALUES ({', '.join('s.' + c for c in cols)})"
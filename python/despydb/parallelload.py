@@ -0,0 +1,267 @@
+"""
+    Provide bulk loading of a table over several database sessions at once.
+
+    Classes:
+        ParallelLoader - Splits rows, or columnar data, into batches which a
+                         number of worker threads, each with its own DesDbi
+                         session, insert and commit concurrently.
+
+    Developed at:
+    The National Center for Supercomputing Applications(NCSA).
+
+    Copyright(C) 2026 Board of Trustees of the University of Illinois.
+    All rights reserved.
+
+"""
+
+import itertools
+import queue
+import threading
+import time
+
+import despydb.desdbi as desdbi
+import despydb.columnar as columnar
+
+class ParallelLoader:
+    """ Load rows into a table through several sessions in parallel.
+
+        The producer, the caller of load() or load_columns(), splits the rows
+        into batches and puts them on a bounded queue, blocking while it is
+        full, so that no more than a few batches per session are held in
+        memory.  Each of nsessions worker threads takes batches off the queue,
+        inserts them with DesDbi.insert_many() on its own session and commits
+        each one.  cx_Oracle releases the GIL during round trips, so the
+        sessions work concurrently.
+
+            loader = ParallelLoader('se_object', cols, desfile, 'db-desoper',
+                                    nsessions=4)
+            stats = loader.load(row_generator)
+
+        With the 'unordered' commit policy each batch is committed as soon as
+        it is inserted.  With 'ordered' a batch is only committed after every
+        earlier batch, so the rows committed are always a prefix of the input
+        and a failed load can be resumed after the last committed batch.  If a
+        batch fails, the remaining batches are discarded, the workers stop and
+        the exception is raised by load(); batches committed before the failure
+        stay committed.
+
+        Parameters
+        ----------
+        table : str
+            Name of the table into which data should be inserted.
+
+        columns : list
+            Names of the columns to be inserted, in the order of the values of
+            each row; not needed for load_columns().
+
+        desfile : str, optional
+            The file to use for the services data, default is None.
+
+        section : str, optional
+            The section of the services file to use. Default is None
+
+        retry : bool, optional
+            Whether to retry when connecting. Default is False.
+
+        nsessions : int, optional
+            The number of worker threads and sessions. Default is 4.
+
+        batchsize : int, optional
+            The number of rows per batch. Default is 10000.
+
+        commit : str, optional
+            The commit policy, 'unordered' or 'ordered'. Default is 'unordered'.
+
+        maxqueue : int, optional
+            The number of batches which may wait for a worker. Default is None,
+            twice the number of sessions.
+
+        pool : DesDbiPool, optional
+            A pool to take the sessions from. Default is None, each worker
+            opens its own connection.
+
+        kwargs
+            Passed to DesDbi.insert_many(), e.g. inputsizes or batcherrors.
+    """
+
+    def __init__(self, table, columns=None, desfile=None, section=None, retry=False, nsessions=4,
+                 batchsize=10000, commit='unordered', maxqueue=None, pool=None, **kwargs):
+        if commit not in ('unordered', 'ordered'):
+            raise ValueError(f'Unknown commit policy: {commit}')
+        if 'commit_every' in kwargs:
+            raise ValueError('Batches are committed by the loader, commit_every cannot be used')
+        self.table = table
+        self.columns = list(columns) if columns is not None else None
+        self.desfile = desfile
+        self.section = section
+        self.retry = retry
+        self.nsessions = nsessions
+        self.batchsize = batchsize
+        self.commit = commit
+        self.maxqueue = maxqueue or 2 * nsessions
+        self.pool = pool
+        self.kwargs = kwargs
+        self._reset()
+
+    def _reset(self):
+        """ Clear the state of the previous load.
+        """
+        self._queue = queue.Queue(self.maxqueue)
+        self._cond = threading.Condition()
+        self._next_commit = 0
+        self._error = None
+        self._stats = {'rows': 0, 'batches': 0, 'errors': [], 'producer_wait': 0.0,
+                       'sessions': [0] * self.nsessions}
+
+    def load(self, rows):
+        """ Insert rows into the table.
+
+            Parameters
+            ----------
+            rows : iterable
+                The rows, as for DesDbi.insert_many().
+
+            Returns
+            -------
+            dict
+                The number of rows and batches loaded, the time taken in
+                seconds, the throughput in rows per second, the time the
+                producer spent waiting for the workers, the number of rows
+                loaded by each session and, with batcherrors, the errors of
+                rows which failed, indexed over all of the rows.
+        """
+        rows = iter(rows)
+
+        def batches():
+            while True:
+                batch = list(itertools.islice(rows, self.batchsize))
+                if not batch:
+                    return
+                yield batch
+        return self._run(self.columns, batches())
+
+    def load_columns(self, arrays):
+        """ Insert columnar data into the table.
+
+            Parameters
+            ----------
+            arrays : various
+                The columns, as for DesDbi.insert_columns(): a dictionary of 1-D
+                arrays, a structured array or a pyarrow Table.
+
+            Returns
+            -------
+            dict
+                The statistics described for load().
+        """
+        names, nrows, values = columnar.column_source(arrays)
+        with desdbi.DesDbi(self.desfile, self.section, self.retry, pool=self.pool) as dbh:
+            types = dbh.get_column_types(self.table)
+        unknown = [name for name in names if name.lower() not in types]
+        if unknown:
+            raise ValueError(f"Columns not in table {self.table}: {', '.join(unknown)}")
+        pytypes = [types[name.lower()] for name in names]
+
+        def batches():
+            for start in range(0, nrows, self.batchsize):
+                stop = min(start + self.batchsize, nrows)
+                cols = [values(name, start, stop, pytype) for name, pytype in zip(names, pytypes)]
+                yield list(zip(*cols))
+        return self._run(names, batches())
+
+    def stats(self):
+        """ Return the statistics of the current or last load, see load().
+
+            Returns
+            -------
+            dict
+        """
+        with self._cond:
+            stats = dict(self._stats, sessions=list(self._stats['sessions']),
+                         errors=list(self._stats['errors']))
+        return stats
+
+    def _run(self, columns, batches):
+        """ Start the workers, feed them the batches and wait for them to finish.
+        """
+        self._reset()
+        start = time.time()
+        workers = [threading.Thread(target=self._work, args=(i, columns), daemon=True,
+                                    name=f'ParallelLoader-{i}')
+                   for i in range(self.nsessions)]
+        for worker in workers:
+            worker.start()
+        offset = 0
+        try:
+            for seq, batch in enumerate(batches):
+                if self._error is not None:
+                    break
+                tstart = time.time()
+                self._queue.put((seq, offset, batch))
+                self._stats['producer_wait'] += time.time() - tstart
+                offset += len(batch)
+        finally:
+            for _ in workers:
+                self._queue.put(None)
+            for worker in workers:
+                worker.join()
+        if self._error is not None:
+            raise self._error
+
+        stats = self.stats()
+        stats['seconds'] = time.time() - start
+        stats['rows_per_second'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+        self._stats.update(seconds=stats['seconds'], rows_per_second=stats['rows_per_second'])
+        return stats
+
+    def _fail(self, err):
+        """ Record the first error and wake any workers waiting to commit.
+        """
+        with self._cond:
+            if self._error is None:
+                self._error = err
+            self._cond.notify_all()
+
+    def _work(self, index, columns):
+        """ Insert and commit batches from the queue until told to stop.
+        """
+        dbh = None
+        try:
+            dbh = desdbi.DesDbi(self.desfile, self.section, self.retry, pool=self.pool)
+        except Exception as err:
+            self._fail(err)
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self._error is not None:
+                # discard the rest of the batches
+                continue
+            seq, offset, batch = item
+            try:
+                res = dbh.insert_many(self.table, columns, batch, batchsize=len(batch),
+                                      **self.kwargs)
+                if self.commit == 'ordered':
+                    with self._cond:
+                        while self._next_commit != seq and self._error is None:
+                            self._cond.wait()
+                        aborted = self._error is not None
+                    if aborted:
+                        dbh.rollback()
+                        continue
+                dbh.commit()
+                with self._cond:
+                    self._next_commit += 1
+                    self._stats['rows'] += res['rows']
+                    self._stats['batches'] += 1
+                    self._stats['sessions'][index] += res['rows']
+                    self._stats['errors'].extend((offset + i, msg) for i, msg in res['errors'])
+                    self._cond.notify_all()
+            except Exception as err:
+                self._fail(err)
+                try:
+                    dbh.rollback()
+                except Exception:
+                    pass
+        if dbh is not None:
+            dbh.close()
@@ -0,0 +1,313 @@
+"""
+    Provide an offline registry of table layouts.
+
+    Classes:
+        SchemaRegistry - Holds the column names, types, lengths and nullability
+                         of tables, loaded from CREATE TABLE statements or from
+                         a JSON snapshot of a live database, so that DesDbi can
+                         answer get_column_names() and friends without querying
+                         the database.
+
+    Developed at:
+    The National Center for Supercomputing Applications(NCSA).
+
+    Copyright(C) 2026 Board of Trustees of the University of Illinois.
+    All rights reserved.
+
+"""
+
+import glob
+import json
+import os
+import re
+
+# types whose sizes in DDL are a precision and scale rather than a length
+_NUMERIC_TYPES = ('DECIMAL', 'NUMBER', 'NUMERIC')
+
+_CREATE_TABLE = re.compile(r'CREATE\s+(?:GLOBAL\s+TEMPORARY\s+)?TABLE\s+("?[\w$#]+"?(?:\."?[\w$#]+"?)?)\s*\(',
+                           re.IGNORECASE)
+_COLUMN = re.compile(r'\s*"?([\w$#]+)"?\s+(\w+)\s*(?:\(\s*(\d+)\s*(?:,\s*(-?\d+)\s*)?\))?(.*)',
+                     re.IGNORECASE | re.DOTALL)
+_CONSTRAINTS = ('CONSTRAINT', 'PRIMARY', 'UNIQUE', 'FOREIGN', 'CHECK')
+
+def _split_columns(body):
+    """ Split the body of a CREATE TABLE statement at the top level commas.
+    """
+    parts = []
+    depth = 0
+    start = 0
+    quote = False
+    for i, char in enumerate(body):
+        if char == "'":
+            quote = not quote
+        elif quote:
+            continue
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(body[start:i])
+            start = i + 1
+    parts.append(body[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+def _table_body(ddl, start):
+    """ Return the text between the parenthesis opened just before start and
+        its matching close.
+    """
+    depth = 1
+    quote = False
+    for i in range(start, len(ddl)):
+        char = ddl[i]
+        if char == "'":
+            quote = not quote
+        elif quote:
+            continue
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                return ddl[start:i]
+    return ddl[start:]
+
+class SchemaRegistry:
+    """ Registry of the column layouts of tables.
+
+        Each table is a sequence of columns, each a dictionary with the keys
+        'name', 'type' (the SQL type, e.g. 'VARCHAR2'), 'length', 'char_length',
+        'precision', 'scale' and 'nullable', as the data dictionary reports
+        them.  Table and column names are not case sensitive.
+
+        A registry is filled from DDL files, from a JSON snapshot written by
+        save_json() or from a live database, e.g.
+
+            registry = SchemaRegistry.from_database(dbh, ['exposure', 'image'])
+            registry.save_json('schema.json')
+            ...
+            dbh = DesDbi(desfile, section, lazy=True, schema='schema.json')
+            cols = dbh.get_column_names('exposure')    # no round trip
+    """
+
+    # the kinds of metadata lookup() provides
+    KINDS = ('metadata', 'types')
+
+    def __init__(self):
+        self._tables = {}
+
+    def __contains__(self, table):
+        return table.lower() in self._tables
+
+    def __len__(self):
+        return len(self._tables)
+
+    def tables(self):
+        """ Return the names of the tables in the registry.
+
+            Returns
+            -------
+            list
+        """
+        return list(self._tables.keys())
+
+    def add_table(self, table, columns):
+        """ Add, or replace, the layout of a table.
+
+            Parameters
+            ----------
+            table : str
+                The name of the table.
+
+            columns : list
+                Dictionaries describing the columns, in table order, with at
+                least a 'name' key.
+        """
+        cols = []
+        for col in columns:
+            cols.append({'name': col['name'].upper(),
+                         'type': col.get('type'),
+                         'length': col.get('length'),
+                         'char_length': col.get('char_length'),
+                         'precision': col.get('precision'),
+                         'scale': col.get('scale'),
+                         'nullable': col.get('nullable', True)})
+        self._tables[table.lower()] = cols
+
+    def lookup(self, table, kind, dialect):
+        """ Return metadata of a table in the forms used by DesDbi.
+
+            The values are those DesDbi.get_column_metadata() and
+            get_column_types() return for the table in a live database.
+
+            Parameters
+            ----------
+            table : str
+                The name of the table.
+
+            kind : str
+                'metadata' for a dictionary of 7-item sequences in the format of
+                cursor.description, or 'types' for a dictionary of python
+                types.  Both are indexed by lower case column name.
+
+            dialect : class
+                The connection class of the database, whose describe_column()
+                and get_python_type() translate the SQL types.
+
+            Returns
+            -------
+            dict
+        """
+        cols = self._tables[table.lower()]
+        if kind == 'types':
+            return {col['name'].lower(): dialect.get_python_type(col['type']) for col in cols}
+        if kind == 'metadata':
+            return {col['name'].lower(): dialect.describe_column(col['name'], col['type'],
+                                                                 col['length'], col['char_length'],
+                                                                 col['precision'], col['scale'],
+                                                                 col['nullable'])
+                    for col in cols}
+        raise ValueError(f'Unknown kind of metadata: {kind}')
+
+    def load_ddl(self, text):
+        """ Add the tables of all CREATE TABLE statements found in a string.
+
+            Other statements are ignored.  Sizes given in parenthesis become
+            the precision and scale of numeric columns, the precision of
+            FLOAT columns, the fractional seconds (scale) of TIMESTAMP columns
+            and the length of other columns.
+
+            Parameters
+            ----------
+            text : str
+                The DDL.
+
+            Returns
+            -------
+            list
+                The names of the tables added.
+        """
+        added = []
+        for match in _CREATE_TABLE.finditer(text):
+            table = match.group(1).replace('"', '')
+            columns = []
+            for coldef in _split_columns(_table_body(text, match.end())):
+                if coldef.split()[0].upper() in _CONSTRAINTS:
+                    continue
+                cmatch = _COLUMN.match(coldef)
+                if not cmatch:
+                    continue
+                name, sqltype, size, scale, rest = cmatch.groups()
+                sqltype = sqltype.upper()
+                col = {'name': name, 'type': sqltype,
+                       'nullable': not re.search(r'NOT\s+NULL|PRIMARY\s+KEY', rest, re.IGNORECASE)}
+                if size is not None:
+                    if sqltype in _NUMERIC_TYPES:
+                        col['precision'] = int(size)
+                        col['scale'] = int(scale) if scale is not None else 0
+                    elif sqltype == 'FLOAT':
+                        col['precision'] = int(size)
+                    elif sqltype == 'TIMESTAMP':
+                        col['scale'] = int(size)
+                    else:
+                        col['length'] = int(size)
+                columns.append(col)
+            self.add_table(table, columns)
+            added.append(table.lower())
+        return added
+
+    @classmethod
+    def from_ddl(cls, *paths):
+        """ Create a registry from files of CREATE TABLE statements.
+
+            Parameters
+            ----------
+            paths : str
+                Files, or directories whose *.sql files are read.
+
+            Returns
+            -------
+            SchemaRegistry
+        """
+        registry = cls()
+        for path in paths:
+            if os.path.isdir(path):
+                files = sorted(glob.glob(os.path.join(path, '*.sql')))
+            else:
+                files = [path]
+            for fname in files:
+                with open(fname, 'r', encoding='utf-8') as fh:
+                    registry.load_ddl(fh.read())
+        return registry
+
+    @classmethod
+    def from_json(cls, filename):
+        """ Create a registry from a snapshot written by save_json().
+
+            Parameters
+            ----------
+            filename : str
+                The name of the JSON file.
+
+            Returns
+            -------
+            SchemaRegistry
+        """
+        with open(filename, 'r', encoding='utf-8') as fh:
+            data = json.load(fh)
+        registry = cls()
+        for table, columns in data.items():
+            registry.add_table(table, columns)
+        return registry
+
+    @classmethod
+    def from_database(cls, dbh, tables):
+        """ Create a registry from the current layout of tables in a database.
+
+            The tables are looked up in the data dictionary, so tables reached
+            through synonyms cannot be registered.
+
+            Parameters
+            ----------
+            dbh : DesDbi
+                The database handle.
+
+            tables : list
+                The names of the tables.
+
+            Returns
+            -------
+            SchemaRegistry
+
+            Raises
+            ------
+            ValueError
+                If a table is not found.
+        """
+        registry = cls()
+        found = dbh.con.get_table_columns(tables)
+        for table in tables:
+            if table.lower() not in found:
+                raise ValueError(f'Table {table} was not found in the data dictionary')
+            columns = []
+            for (name, sqltype, length, char_length, precision, scale, nullable) in found[table.lower()]:
+                columns.append({'name': name,
+                                'type': sqltype,
+                                'length': length,
+                                'char_length': char_length,
+                                'precision': precision,
+                                'scale': scale,
+                                'nullable': nullable})
+            registry.add_table(table, columns)
+        return registry
+
+    def save_json(self, filename):
+        """ Write the registry to a JSON file which from_json() can read.
+
+            Parameters
+            ----------
+            filename : str
+                The name of the JSON file.
+        """
+        with open(filename, 'w', encoding='utf-8') as fh:
+            json.dump(self._tables, fh, indent=1)
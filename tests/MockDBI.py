@@ -12,6 +12,7 @@ import sqlite3
 
 import datetime
 import time
+import threading
 import socket
 import os
 import inspect
@@ -23,18 +24,25 @@ from dateutil import parser
 
 import despydb.errors as errors
 
-# Construct a name for the v$session module column to allow database auditing.
+_MODULE_NAME = None
 
-import __main__
-try:
-    _MODULE_NAME = __main__.__file__
-except AttributeError:
-    _MODULE_NAME = "unavailable"
+def _module_name():
+    """ Construct a name for the v$session module column to allow database auditing. This is
+        done on first use, rather than at import time, as it may need a DNS lookup.
+    """
+    global _MODULE_NAME
+    if _MODULE_NAME is None:
+        import __main__
+        try:
+            name = __main__.__file__
+        except AttributeError:
+            name = "unavailable"
 
-if _MODULE_NAME.rfind('/') > -1:
-    _MODULE_NAME = _MODULE_NAME[_MODULE_NAME.rfind('/') + 1:]
-_MODULE_NAME += '@' + socket.getfqdn()
-_MODULE_NAME = _MODULE_NAME [:48]
+        if name.rfind('/') > -1:
+            name = name[name.rfind('/') + 1:]
+        name += '@' + socket.getfqdn()
+        _MODULE_NAME = name[:48]
+    return _MODULE_NAME
 
 DB_FILE = 'des_test_db.db'
 # No need to rebuild this mapping every time it is used, so make it a global
@@ -43,6 +51,8 @@ _TYPE_MAP = {'TEXT'      : str,
              'INTEGER'   : int,
              'NUMBER'    : float,
              'REAL'      : float,
+             'FLOAT'     : float,
+             'DOUBLE'    : float,
              'BLOB'      : bytearray,
              'TIMESTAMP' : datetime.datetime,
              'DATE'      : datetime.datetime
@@ -252,11 +262,53 @@ def convert_PROCEDURES(stmt):
         stmt = stmt[:loc] + stmt[loc + 1: end - 1] + stmt[end:]
     return stmt
 
-class Slot(int):
-    """ Class to store an integer value
+_RETURNING_INTO = re.compile(r'(\sRETURNING\s.+?)\s+INTO\s+(:\w+(?:\s*,\s*:\w+)*)\s*$',
+                             re.IGNORECASE | re.DOTALL)
+
+def split_returning(stmt):
+    """ Split the INTO part off an Oracle RETURNING ... INTO clause, which sqlite3 returns as a
+        result set instead.
+
+        Parameters
+        ----------
+        stmt : str
+            The statement.
+
+        Returns
+        -------
+        tuple of the statement without the INTO part and the names of the output variables, or
+        None if there is no RETURNING ... INTO clause.
     """
-    def __init__(self):
-        self.value = None
+    if not stmt:
+        return stmt, None
+    match = _RETURNING_INTO.search(stmt)
+    if match is None:
+        return stmt, None
+    names = [name.strip()[1:] for name in match.group(2).split(',')]
+    return stmt[:match.start()] + match.group(1), names
+
+class MockVar:
+    """ Class to mimic a cx_Oracle variable, used for procedure arguments and for the values
+        returned by RETURNING ... INTO, with one value for each row of an array bind.
+    """
+    def __init__(self, _type=None, size=0, arraysize=1):
+        self.type = _type
+        self.size = size
+        self.values = [None] * arraysize
+
+    @property
+    def value(self):
+        return self.values[0]
+
+    @value.setter
+    def value(self, val):
+        self.values[0] = val
+
+    def getvalue(self, pos=0):
+        return self.values[pos]
+
+    def setvalue(self, pos, val):
+        self.values[pos] = val
 
     def __str__(self):
         return str(self.value)
@@ -264,6 +316,17 @@ class Slot(int):
     def __repr__(self):
         return str(self.value)
 
+class BatchError:
+    """ Class to mimic the errors returned by getbatcherrors.
+    """
+    def __init__(self, offset, message):
+        self.offset = offset
+        self.message = message
+        self.code = 0
+
+    def __str__(self):
+        return self.message
+
 class MockCursor(sqlite3.Cursor):
     """ Class to mock cursor interaction. Can be used just like an oracle cursor. Oracle specific
         commands are interpreted and converted to sqlite versions, although this is not guaranteed.
@@ -287,6 +350,8 @@ class MockCursor(sqlite3.Cursor):
         sqlite3.Cursor.__init__(self, *args, **kwargs)
         self._slot = -1
         self.num = None
+        self._batcherrors = []
+        self._rowcounts = None
 
     def fetchall(self):
         """ Get all results from the last query
@@ -408,10 +473,39 @@ class MockCursor(sqlite3.Cursor):
             if exstmt is None:
                 return None
 
-            return super(MockCursor, self).execute(convert_PROCEDURES(exstmt), params)
-        return super(MockCursor, self).execute(self._stmt, params)
+            exstmt = convert_PROCEDURES(exstmt)
+        else:
+            exstmt = self._stmt
+        exstmt, outnames = split_returning(exstmt)
+        # the connection is shared by all threads, so run one statement at a time
+        with self.connection.lock:
+            if outnames:
+                outvars = self._outvars(outnames, params)
+                super(MockCursor, self).execute(exstmt, params)
+                self._set_returned(outvars, 0)
+                return self
+            return super(MockCursor, self).execute(exstmt, params)
+
+    def _outvars(self, outnames, params=None):
+        """ Return the output variables of a RETURNING ... INTO clause, removing them from the
+            parameters, or taking them from setinputsizes.
+        """
+        outvars = []
+        for name in outnames:
+            if isinstance(params, dict) and name in params:
+                outvars.append(params.pop(name))
+            else:
+                outvars.append(self.inputsizes[name])
+        return outvars
 
-    def executemany(self, stmt, params):
+    def _set_returned(self, outvars, pos):
+        """ Store the rows returned by the last statement in the output variables.
+        """
+        rows = super(MockCursor, self).fetchall()
+        for i, var in enumerate(outvars):
+            var.setvalue(pos, [row[i] for row in rows])
+
+    def executemany(self, stmt, params, batcherrors=False, arraydmlrowcounts=False):
         """ Execute the given query with a range of inputs.
 
             Parameters
@@ -421,6 +515,13 @@ class MockCursor(sqlite3.Cursor):
 
             params : iterable
                 The paremters to substitue in to the query.
+
+            batcherrors : bool
+                Mimic the oracle batch error mode: rows which fail are skipped and reported by
+                getbatcherrors() rather than raising an exception.
+
+            arraydmlrowcounts : bool
+                Record the number of rows affected by each set of inputs, see getarraydmlrowcounts().
         """
         if params:
             if isinstance(params, (tuple, list, set)):
@@ -438,13 +539,54 @@ class MockCursor(sqlite3.Cursor):
                 return None
             #print exstmt
             #print params
-            return super(MockCursor, self).executemany(convert_PROCEDURES(exstmt), params)
-        return super(MockCursor, self).executemany(self._stmt, params)
+            exstmt = convert_PROCEDURES(exstmt)
+        else:
+            exstmt = self._stmt
+        exstmt, outnames = split_returning(exstmt)
+        with self.connection.lock:
+            if batcherrors or arraydmlrowcounts or outnames:
+                outvars = self._outvars(outnames) if outnames else None
+                return self._executemany_rows(exstmt, params, batcherrors, outvars)
+            return super(MockCursor, self).executemany(exstmt, params)
+
+    def _executemany_rows(self, stmt, params, batcherrors, outvars=None):
+        """ Execute the query once per set of inputs, recording the row counts, any returned
+            values and, in batch error mode, the errors.
+        """
+        self._batcherrors = []
+        self._rowcounts = []
+        for i, par in enumerate(params):
+            try:
+                super(MockCursor, self).execute(stmt, par)
+                if outvars:
+                    self._set_returned(outvars, i)
+                self._rowcounts.append(self.rowcount)
+            except sqlite3.DatabaseError as err:
+                if not batcherrors:
+                    raise
+                self._batcherrors.append(BatchError(i, str(err)))
+                self._rowcounts.append(0)
+        return self
+
+    def getbatcherrors(self):
+        """ Return the errors of the last executemany in batch error mode.
+        """
+        return self._batcherrors
 
-    def var(self, _type):
+    def getarraydmlrowcounts(self):
+        """ Return the number of rows affected by each set of inputs of the last executemany.
+        """
+        return self._rowcounts
+
+    def setinputsizes(self, *args, **kwargs):
+        """ Mimic the setinputsizes call, sqlite3 sizes its binds itself.
+        """
+        self.inputsizes = kwargs if kwargs else args
+
+    def var(self, _type, size=0, arraysize=1, **kwargs):
         """ Mimic the var call.
         """
-        return Slot()
+        return MockVar(_type, size, arraysize)
 
     def callproc(self, procname, procargs):
         """ Mock the calling of Oracle procedures. The following proceedures are handled:
@@ -497,6 +639,50 @@ class MockCursor(sqlite3.Cursor):
         else:
             raise Exception("Unknown proc called")
 
+class MockSessionPool:
+    """ Class for mocking a cx_Oracle SessionPool. All sessions share the sqlite3 singleton, so this
+        only does the bookkeeping of busy and opened sessions and enforces the maximum pool size,
+        waiting up to timeout seconds for a session to be released.
+    """
+    def __init__(self, minsess=1, maxsess=8, increment=1, timeout=60):
+        self.min = minsess
+        self.max = maxsess
+        self.increment = increment
+        self.timeout = timeout
+        self.busy = 0
+        self.opened = minsess
+        self._cond = threading.Condition()
+
+    def checkout(self):
+        """ Reserve a session, waiting for one to be released if the pool is exhausted.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.busy < self.max, self.timeout):
+                raise Exception('Timed out waiting for a pooled session')
+            self.busy += 1
+            if self.busy > self.opened:
+                self.opened = min(self.max, self.opened + self.increment)
+
+    def release(self, con):
+        """ Return a session to the pool.
+        """
+        con.close()
+        with self._cond:
+            self.busy -= 1
+            self._cond.notify()
+
+    def drop(self, con):
+        """ Remove a session from the pool.
+        """
+        self.release(con)
+        with self._cond:
+            self.opened = max(self.min, self.opened - 1)
+
+    def close(self, force=False):
+        """ Mimic closing the pool.
+        """
+        self.opened = 0
+
 class MockConnection:
     """ Class for mocking an oracle connection, using sqlite3. This class creates a (or uses an existing)
         singleton instance of a connection to the sqlite3 database. It mimics the behvior of the DES
@@ -541,8 +727,10 @@ class MockConnection:
                                        'RA_CENT': 'REAL'}
                    }
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, pool=None, **kwargs):
         self.pingval = True
+        if pool is not None:
+            pool.checkout()
         # increment the reference counter
         MockConnection.__refcount += 1
         self.__closed = False
@@ -554,6 +742,16 @@ class MockConnection:
                                                         MockConnection.temp_tables,
                                                         *args, **kwargs)
 
+    @staticmethod
+    def create_pool(access_data, minsess=1, maxsess=8, increment=1, timeout=60):
+        """ Mimic the creation of a session pool.
+
+            Returns
+            -------
+            MockSessionPool
+        """
+        return MockSessionPool(minsess, maxsess, increment, timeout)
+
     def teardown(self):
         """ Close and remove the database from disk.
 
@@ -615,6 +813,87 @@ class MockConnection:
         """
         return self.pingval
 
+    @staticmethod
+    def get_named_bind_string(name):
+        """Return a named bind (substitution) string for name with cx_Oracle."""
+
+        return ":" + name
+
+    @staticmethod
+    def get_positional_bind_string(pos=1):
+        """Return a positional bind (substitution) string for cx_Oracle."""
+
+        return "?"
+
+    @staticmethod
+    def from_dual():
+        """ Ignore calls to this as sqlite3 does not have dual.
+        """
+        return ""
+
+    @staticmethod
+    def get_current_timestamp_str():
+        """ Get a timestamp of the current time.
+        """
+        return str(time.mktime(datetime.datetime.now().timetuple()))
+
+    @staticmethod
+    def get_direct_insert_hint():
+        """ sqlite3 has no direct path inserts, so there is no hint.
+        """
+        return ''
+
+    @staticmethod
+    def get_returning_clause(cols):
+        """ Return the Oracle RETURNING ... INTO clause, which MockCursor emulates.
+        """
+        return f" RETURNING {','.join(cols)} INTO {','.join(':r_' + c for c in cols)}"
+
+    @staticmethod
+    def get_upsert_statements(table, key_cols, cols):
+        """ Return the statements upsert_many runs for each row: an update and an
+            INSERT ... ON CONFLICT.
+        """
+        setcols = [c for c in cols if c not in key_cols]
+        keys = ', '.join(key_cols)
+        update = None
+        if setcols:
+            update = f"UPDATE {table} SET {', '.join(f'{c}=:{c}' for c in setcols)} " \
+                     f"WHERE {' AND '.join(f'{c}=:{c}' for c in key_cols)}"
+            action = f"DO UPDATE SET {', '.join(f'{c}=excluded.{c}' for c in setcols)}"
+        else:
+            action = 'DO NOTHING'
+        insert = f"INSERT INTO {table}({', '.join(cols)}) VALUES({', '.join(':' + c for c in cols)}) " \
+                 f"ON CONFLICT({keys}) {action}"
+        return update, insert
+
+    @staticmethod
+    def get_merge_statement(table, source, key_cols, cols):
+        """ Return an INSERT ... SELECT ... ON CONFLICT which upserts the rows of source into
+            table.
+        """
+        setcols = [c for c in cols if c not in key_cols]
+        if setcols:
+            action = f"DO UPDATE SET {', '.join(f'{c}=excluded.{c}' for c in setcols)}"
+        else:
+            action = 'DO NOTHING'
+        return f"INSERT INTO {table}({', '.join(cols)}) SELECT {', '.join(cols)} FROM {source} " \
+               f"WHERE true ON CONFLICT({', '.join(key_cols)}) {action}"
+
+    @staticmethod
+    def describe_column(name, data_type, data_length=None, char_length=None,
+                        precision=None, scale=None, nullable=True):
+        """
+        Return the cursor.description entry of a column. sqlite3 describes nothing but
+        the column name.
+        """
+        return (name, None, None, None, None, None, None)
+
+    @staticmethod
+    def get_python_type(data_type):
+        """Return the python type of the values of a column of an SQL type."""
+        return _TYPE_MAP.get(data_type.split('(')[0].strip().upper(), str)
+
     def __getattr__(self, name):
         """ Pass all other method calls on to the connection.
         """
@@ -631,6 +910,17 @@ class MockConnection:
             return _MockConnection.mock_fail
         _MockConnection.mock_fail = val
 
+def _after_fork():
+    """ Drop the singleton inherited across fork(), as the sqlite3 connection belongs to the parent.
+        The reference count is left at one so that the child never removes the database file the
+        parent is still using.
+    """
+    MockConnection._MockConnection__instance = None
+    MockConnection._MockConnection__refcount = 1
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
 class _MockConnection(sqlite3.Connection):
     """
     Provide cx_Oracle-specific implementations of canonical database methods
@@ -649,7 +939,9 @@ class _MockConnection(sqlite3.Connection):
         self.temp_tables = temp_tables
         self._results = None
         self.haveExpr = False
-        self.module = _MODULE_NAME
+        # the last value handed out by get_seq_next_values for each sequence
+        self.seq_issued = {}
+        self.module = _module_name()
         self.type = 'MOCKDB'
         self.configdict = {'user': 'non-user',
                            'passwd': 'non-passwd',
@@ -673,6 +965,7 @@ class _MockConnection(sqlite3.Connection):
         sqlite3.Connection.__init__(self, database=os.path.join(self.home_dir, DB_FILE),
                                     detect_types=sqlite3.PARSE_DECLTYPES,
                                     check_same_thread=False)
+        self.lock = threading.RLock()
         cur = self.cursor()
         cur.execute("PRAGMA synchronous = OFF")
         cur.close()
@@ -715,9 +1008,16 @@ class _MockConnection(sqlite3.Connection):
     def commit(self):
         """ Commit any changes to disk
         """
-        curs = self.cursor()
-        self.clearTempTables(curs)
-        super(_MockConnection, self).commit()
+        with self.lock:
+            curs = self.cursor()
+            self.clearTempTables(curs)
+            super(_MockConnection, self).commit()
+
+    def rollback(self):
+        """ Rollback any changes
+        """
+        with self.lock:
+            super(_MockConnection, self).rollback()
 
     def clearTempTables(self, curs):
         """ Clear any temp tables
@@ -765,14 +1065,19 @@ class _MockConnection(sqlite3.Connection):
         """
         Return a Cursor object for operating on the connection.
 
-        The fetchsize argument is ignored, but retained for compatibility
-        with other connection types.
+        As for cx_Oracle, fetchsize sets the arraysize and prefetchrows of the cursor.
         """
-        return MockCursor(self, fail=self.mock_fail, results=self._results)
+        curs = MockCursor(self, fail=self.mock_fail, results=self._results)
+        if fetchsize:
+            curs.arraysize = fetchsize
+            curs.prefetchrows = fetchsize
+        return curs
 
-    def get_column_types(self, table_name):
+    def get_column_types(self, table_name, metadata=None):
         """
         Return a dictionary of python types indexed by column name for a table.
+
+        sqlite3 column descriptions carry no types, so any metadata given is ignored.
         """
 
         curs = self.cursor()
@@ -784,6 +1089,37 @@ class _MockConnection(sqlite3.Connection):
 
         return types
 
+    def get_input_sizes(self, metadata):
+        """
+        Return the bind sizes for the columns of a table. sqlite3 sizes its own binds,
+        so these are all None.
+        """
+        return {name: None for name in metadata}
+
+    def get_table_metadata(self, tables):
+        """
+        Return the column descriptions of several tables, as describe_column gives them.
+        Tables which do not exist are left out of the result.
+        """
+        return {table: {col[0].lower(): MockConnection.describe_column(*col) for col in columns}
+                for table, columns in self.get_table_columns(tables).items()}
+
+    def get_table_columns(self, tables):
+        """
+        Return the column definitions of several tables with a single query of their
+        table_info pragmas. Tables which do not exist are left out of the result.
+        """
+        sql = ' UNION ALL '.join(f"SELECT {i}, cid, name, type, \"notnull\" FROM pragma_table_info('{t}')"
+                                 for i, t in enumerate(tables))
+        result = {}
+        curs = self.cursor()
+        curs.execute(sql + ' ORDER BY 1, 2')
+        for (i, _, name, ctype, notnull) in curs.fetchall():
+            result.setdefault(tables[i].lower(), []).append((name, ctype, None, None, None,
+                                                              None, not notnull))
+        curs.close()
+        return result
+
     def get_expr_exec_format(self):
         """Return a format string for a statement to execute SQL expressions."""
         if self.haveExpr:
@@ -791,16 +1127,6 @@ class _MockConnection(sqlite3.Connection):
             return '{}'
         return 'SELECT {} FROM DUMMY'
 
-    def get_named_bind_string(self, name):
-        """Return a named bind (substitution) string for name with cx_Oracle."""
-
-        return ":" + name
-
-    def get_positional_bind_string(self, pos=1):
-        """Return a positional bind (substitution) string for cx_Oracle."""
-
-        return "?"
-
     def get_regex_format(self, case_sensitive=True):
         """
         Return a format string for constructing a regular expression clause.
@@ -830,14 +1156,40 @@ class _MockConnection(sqlite3.Connection):
         self.haveExpr = True
         return "select seq_val from sequences where name='%s'" % seq
 
+    def get_seq_next_values(self, seqname, n):
+        """ Return the next n values of a sequence, advancing it by n at once.
+        """
+        seq = seqname.upper()
+        c = self.cursor()
+        c.execute("select seq_val from sequences_data where name=?", (seq,))
+        last = max(c.fetchone()[0], self.seq_issued.get(seq, 0)) + n
+        # the update is part of the caller's transaction, which is not committed here; the
+        # values handed out are remembered so that a rollback does not reissue them, as
+        # Oracle sequences never do
+        c.execute("update sequences_data set seq_val = ? where name=?", (last, seq))
+        c.close()
+        self.seq_issued[seq] = last
+        return list(range(last - n + 1, last + 1))
+
     def sequence_drop(self, seq_name):
         """ Drop sequence; do not generate error if it doesn't exist."""
         c = self.cursor()
         c.execute("delete from dummy where name='%s'" % seq_name.upper())
         c.execute("delete from sequences_data where name='%s'" % seq_name.upper())
         c.close()
+        self.seq_issued.pop(seq_name.upper(), None)
         self.commit()
 
+    def get_table_triggers(self, table_name):
+        """ Return the names of the triggers on a table.
+        """
+        curs = self.cursor()
+        curs.execute("SELECT name FROM sqlite_master WHERE type='trigger' AND tbl_name=? COLLATE NOCASE",
+                     (table_name,))
+        triggers = [row[0] for row in curs.fetchall()]
+        curs.close()
+        return triggers
+
     def table_drop(self, table):
         """ Drop table; do not generate error if it doesn't exist. """
 
@@ -850,13 +1202,3 @@ class _MockConnection(sqlite3.Connection):
             pass
         finally:
             curs.close()
-
-    def from_dual(self):
-        """ Ignore calls to this as sqlite3 does not have dual.
-        """
-        return ""
-
-    def get_current_timestamp_str(self):
-        """ Get a timestamp of the current time.
-        """
-        return str(time.mktime(datetime.datetime.now().timetuple()))
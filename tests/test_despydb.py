@@ -2,20 +2,36 @@
 # pylint: skip-file
 
 import unittest
+import asyncio
 from copy import deepcopy
 import sys
 import os
 import stat
+import time
 import datetime
 import sqlite3
 from contextlib import contextmanager
 from io import StringIO
 from mock import patch, MagicMock
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
 from subprocess import Popen, PIPE, STDOUT
 
 from despydb.oracon import OracleConnection, _ORA_NO_TABLE_VIEW, _ORA_NO_SEQUENCE, _TYPE_MAP
+from despydb.oradialect import OracleDialect
+from despydb.schemaregistry import SchemaRegistry
 import despydb.errors as errors
 import despydb.desdbi as desdbi
+import despydb.dbpool as dbpool
+import despydb.configcache as configcache
+import despydb.asyncdesdbi as asyncdesdbi
+import despydb.parallelload as parallelload
 import cx_Oracle as cxo
 import query
 from MockDBI import MockConnection, convert_timestamp
@@ -30,6 +46,38 @@ def capture_output():
     finally:
         sys.stdout, sys.stderr = old_out, old_err
 
+TEST_SERVICES = """
+
+[db-test]
+USER    =   Minimal_user
+PASSWD  =   Minimal_passwd
+name    =   Minimal_name
+sid     =   Minimal_sid
+server  =   Minimal_server
+type    =   test
+port    =   0
+"""
+
+def write_services(filename, text=TEST_SERVICES):
+    open(filename, 'w').write(text)
+    os.chmod(filename, (0xffff & ~(stat.S_IROTH | stat.S_IWOTH | stat.S_IRGRP | stat.S_IWGRP )))
+
+class ServicesTestCase(unittest.TestCase):
+    """ Write a services file with the db-test section, and open a handle on it, for the
+        tests of the class.
+    """
+    sfile = 'services.ini'
+
+    @classmethod
+    def setUpClass(cls):
+        write_services(cls.sfile)
+        cls.dbh = desdbi.DesDbi(cls.sfile, 'db-test')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.dbh.con.teardown()
+        os.unlink(cls.sfile)
+
 class MockOracle(object):
     def __init__(self, user, password, **kwargs):
         self.user = user
@@ -65,6 +113,11 @@ class MockOracle(object):
         self.count += 1
         return self.Cursor(self.value, self.count)
 
+    def ping(self):
+        self.count += 1
+        if self.count >= 0:
+            raise cxo.DatabaseError(self.Cursor.Obj(3113))
+
 """
 class MockPostgres(object):
     def __init__(self, user, password, **kwargs):
@@ -105,7 +158,7 @@ class MockPostgres(object):
 """
 def modifyOracle():
     global OracleConnection
-    OracleConnection = type('OracleConnection', (MockOracle, ), dict(OracleConnection.__dict__))
+    OracleConnection = type('OracleConnection', (OracleDialect, MockOracle, ), dict(OracleConnection.__dict__))
 
 #def modifyPostgres():
 #    global PostgresConnection
@@ -200,6 +253,18 @@ port    =   0
             self.assertTrue('desar2home' in output)
         sys.argv = deepcopy(argv)
 
+    def test_query_fetchsize(self):
+        argv = deepcopy(sys.argv)
+        sys.argv = ['query.py', '--service', self.sfile, '--section', 'db-test', '--fetchsize', '50',
+                    'select name from sequences_data']
+        with patch('query.despydb.DesDbi', wraps=desdbi.DesDbi) as dbi:
+            with capture_output() as (out, _):
+                query.main()
+                output = out.getvalue().strip()
+        sys.argv = deepcopy(argv)
+        self.assertEqual(dbi.call_args[1]['fetchsize'], 50)
+        self.assertTrue('DESFILE_SEQ' in output)
+
     @patch('query.sys.stdin.readline', side_effect=['#', QUERY, ''])
     def test_query_multiline_stdin(self, ptc):
         argv = deepcopy(sys.argv)
@@ -366,6 +431,13 @@ class TestOracon(unittest.TestCase):
         self.assertTrue(con.ping())
         self.assertFalse(con.ping())
 
+    @patch('despydb.oracon.cx_Oracle.Connection', MockOracle)
+    def test_ping_no_cursor(self):
+        con = OracleConnection(self.conData)
+        with patch.object(OracleConnection, 'cursor') as curs:
+            self.assertTrue(con.ping())
+            curs.assert_not_called()
+
     @patch('despydb.oracon.cx_Oracle.Connection', MockOracle)
     def test_getColumn_types(self):
         con = OracleConnection(self.conData)
@@ -378,6 +450,49 @@ class TestOracon(unittest.TestCase):
         self.assertEqual(rt['name'], str)
         self.assertEqual(rt['count'], float)
 
+    @patch('despydb.oracon.cx_Oracle.Connection', MockOracle)
+    def test_getColumn_types_metadata(self):
+        con = OracleConnection(self.conData)
+        meta = {'date': ('DATE', cxo.DATETIME, None, None, None, None, 1),
+                'count': ('COUNT', cxo.NUMBER, None, None, None, None, 1)}
+        rt = con.get_column_types('table', meta)
+        self.assertEqual(rt, {'date': datetime.datetime, 'count': float})
+
+    @patch('despydb.oracon.cx_Oracle.Connection', MockOracle)
+    def test_get_table_metadata(self):
+        con = OracleConnection(self.conData)
+        rows = [('EXPOSURE', 'EXPNUM', 'NUMBER', 22, 0, 10, 0, 'N'),
+                ('EXPOSURE', 'BAND', 'VARCHAR2', 20, 5, None, None, 'Y'),
+                ('EXPOSURE', 'DATE_OBS', 'TIMESTAMP(6)', 11, 0, None, 6, 'Y'),
+                ('EXPOSURE', 'MJD_OBS', 'NUMBER', 22, 0, None, None, 'Y')]
+        with patch.object(OracleConnection, 'cursor') as cursor:
+            curs = cursor.return_value
+            curs.__iter__.return_value = iter(rows)
+            meta = con.get_table_metadata(['exposure', 'catalog'])
+            self.assertEqual(curs.execute.call_count, 1)
+            sql, params = curs.execute.call_args[0]
+            self.assertTrue('all_tab_columns' in sql)
+            self.assertEqual(sorted(params.values()), ['CATALOG', 'EXPOSURE'])
+            curs.close.assert_called_once()
+        exp = meta['exposure']
+        self.assertEqual(list(exp.keys()), ['expnum', 'band', 'date_obs', 'mjd_obs'])
+        self.assertEqual(exp['expnum'], ('EXPNUM', cxo.NUMBER, None, 22, 10, 0, False))
+        self.assertEqual(exp['band'], ('BAND', cxo.STRING, 5, 20, None, None, True))
+        self.assertEqual(exp['date_obs'][1], cxo.TIMESTAMP)
+        self.assertEqual(exp['mjd_obs'][4:6], (0, -127))
+        self.assertFalse('catalog' in meta)
+
+        registry = SchemaRegistry()
+        registry.load_ddl("""CREATE TABLE exposure (expnum NUMBER(10) NOT NULL,
+                                                     band VARCHAR2(20),
+                                                     date_obs TIMESTAMP(6),
+                                                     mjd_obs NUMBER)""")
+        # the byte length of 20 for 5 characters comes from the character set, not the DDL
+        exp['band'] = ('BAND', cxo.STRING, 20, 20, None, None, True)
+        self.assertEqual(registry.lookup('exposure', 'metadata', OracleConnection), exp)
+        self.assertEqual(registry.lookup('exposure', 'types', OracleConnection),
+                         con.get_column_types('exposure', exp))
+
     @patch('despydb.oracon.cx_Oracle.Connection', MockOracle)
     def test_sequence_drop(self):
         con = OracleConnection(self.conData)
@@ -392,6 +507,78 @@ class TestOracon(unittest.TestCase):
         con.table_drop('MYTABLE')
         self.assertRaises(cxo.DatabaseError, con.table_drop, 'MYTABLE')
 
+    @patch('despydb.oracon.cx_Oracle.Connection', MockOracle)
+    def test_cursor_fetchsize(self):
+        con = OracleConnection(self.conData)
+        self.assertFalse(hasattr(con.cursor(), 'arraysize'))
+        with patch.object(MockOracle.Cursor, 'prefetchrows', 2, create=True):
+            curs = con.cursor(1000)
+            self.assertEqual((curs.arraysize, curs.prefetchrows), (1000, 1000))
+
+    @patch('despydb.oracon.cx_Oracle.Connection', MockOracle)
+    def test_stmtcachesize(self):
+        con = OracleConnection(self.conData)
+        self.assertFalse(hasattr(con, 'stmtcachesize'))
+        data = dict(self.conData, stmtcachesize='50')
+        con = OracleConnection(data)
+        self.assertEqual(con.stmtcachesize, 50)
+
+    @patch('despydb.oracon.cx_Oracle.Connection', MockOracle)
+    def test_get_input_sizes(self):
+        con = OracleConnection(self.conData)
+        meta = {'name': ('NAME', cxo.STRING, 20, 80, None, None, 1),
+                'count': ('COUNT', cxo.NUMBER, None, 22, 10, 0, 1),
+                'date': ('DATE', cxo.DATETIME, None, 7, None, None, 1),
+                'notes': ('NOTES', cxo.CLOB, None, None, None, None, 1),
+                'reg': ('REG', str, None, 40, None, None, True)}
+        sizes = con.get_input_sizes(meta)
+        self.assertEqual(sizes, {'name': 80, 'count': cxo.NUMBER, 'date': cxo.DATETIME,
+                                 'notes': None, 'reg': 40})
+
+    def test_upsert_statements(self):
+        update, insert = OracleDialect.get_upsert_statements('exposure', ['expnum'],
+                                                             ['expnum', 'band'])
+        self.assertTrue(update.startswith('MERGE INTO exposure t USING (SELECT :expnum AS expnum, '
+                                          ':band AS band FROM DUAL) s ON (t.expnum = s.expnum)'))
+        self.assertTrue(update.endswith('WHEN MATCHED THEN UPDATE SET t.band = s.band'))
+        self.assertTrue(insert.endswith('WHEN NOT MATCHED THEN INSERT (expnum, band) '
+                                        'VALUES (s.expnum, s.band)'))
+        self.assertIsNone(OracleDialect.get_upsert_statements('exposure', ['expnum'], ['expnum'])[0])
+        sql = OracleDialect.get_merge_statement('exposure', 'gtt_exp', ['expnum'], ['expnum', 'band'])
+        self.assertTrue('USING (SELECT expnum, band FROM gtt_exp) s' in sql)
+        self.assertTrue('WHEN MATCHED' in sql and 'WHEN NOT MATCHED' in sql)
+
+    @patch('despydb.oracon.cx_Oracle.Connection', MockOracle)
+    def test_get_table_triggers(self):
+        con = OracleConnection(self.conData)
+        with patch.object(OracleConnection, 'cursor') as cursor:
+            curs = cursor.return_value
+            curs.__iter__.return_value = iter([('PFW_ATTEMPT_STATE',)])
+            self.assertEqual(con.get_table_triggers('prod.pfw_attempt'), ['PFW_ATTEMPT_STATE'])
+            self.assertEqual(curs.execute.call_args[0][1], {'name': 'PFW_ATTEMPT', 'owner': 'PROD'})
+        self.assertEqual(OracleDialect.get_direct_insert_hint(), '/*+ APPEND_VALUES */')
+        self.assertEqual(OracleDialect.get_returning_clause(['id', 'state']),
+                         ' RETURNING id,state INTO :r_id,:r_state')
+
+    @patch('despydb.oracon.cx_Oracle.Connection', MockOracle)
+    def test_get_seq_next_values(self):
+        con = OracleConnection(self.conData)
+        with patch.object(OracleConnection, 'cursor') as cursor:
+            curs = cursor.return_value
+            curs.__iter__.return_value = iter([(12,), (10,), (11,)])
+            self.assertEqual(con.get_seq_next_values('desfile_seq', 3), [10, 11, 12])
+            self.assertTrue('desfile_seq.NEXTVAL' in curs.execute.call_args[0][0])
+            self.assertEqual(curs.execute.call_args[0][1], {'n': 3})
+
+    def test_create_pool(self):
+        with patch('despydb.oracon.cx_Oracle.SessionPool') as spool:
+            OracleConnection.create_pool(self.conData, 2, 4, 1, 5)
+            kwargs = spool.call_args[1]
+            self.assertEqual(kwargs['min'], 2)
+            self.assertEqual(kwargs['max'], 4)
+            self.assertEqual(kwargs['wait_timeout'], 5000)
+            self.assertTrue('SERVICE_NAME=myDB' in kwargs['dsn'])
+
 
 class TestDesdbi(unittest.TestCase):
     @classmethod
@@ -479,6 +666,135 @@ port    =   0
         self.assertTrue(dbh.ping())
         dbh.close()
 
+    def test_lazy(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test', lazy=True)
+        self.assertFalse(dbh.is_connected())
+        self.assertEqual(dbh.get_named_bind_string('abc'), ':abc')
+        self.assertEqual(dbh.get_positional_bind_string(), '?')
+        self.assertEqual(dbh.from_dual(), '')
+        self.assertTrue(isinstance(dbh.get_current_timestamp_str(), str))
+        self.assertFalse(dbh.is_connected())
+        self.assertEqual(len(dbh.query_simple('dummy')), 6)
+        self.assertTrue(dbh.is_connected())
+        dbh.close()
+
+        with desdbi.DesDbi(self.sfile, 'db-test', lazy=True) as dbh:
+            pass
+        self.assertFalse(dbh.is_connected())
+
+        with patch('despydb.oracon.OracleConnection') as ocon:
+            dbh = desdbi.DesDbi(self.sfile, 'db-minimal', lazy=True)
+            ocon.assert_not_called()
+            dbh.cursor()
+            ocon.assert_called_once()
+
+    def test_reconnect_maxage(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        self.assertIsNotNone(dbh.last_alive)
+        with patch.object(dbh.con, 'ping', return_value=True) as ping:
+            with capture_output() as (out, _):
+                dbh.reconnect(maxage=60)
+                self.assertTrue('recently verified' in out.getvalue())
+            ping.assert_not_called()
+            with capture_output() as (out, _):
+                dbh.reconnect()
+                self.assertTrue('still good' in out.getvalue())
+            ping.assert_called_once()
+        old = dbh.con
+        with patch.object(old, 'ping', return_value=True) as ping:
+            dbh.reconnect(maxage=60, force=True)
+            ping.assert_not_called()
+        self.assertIsNot(dbh.con, old)
+        self.assertTrue(dbh.ping())
+        dbh.close()
+
+    def test_keepalive(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test', keepalive=0.2)
+        self.assertEqual(dbh.keepalive_interval, 0.2)
+        first = dbh.last_alive
+        time.sleep(0.5)
+        self.assertTrue(dbh.last_alive > first)
+        dbh.last_alive = time.time()
+        with patch.object(dbh.con, 'ping') as ping:
+            with capture_output() as (out, _):
+                dbh.reconnect(maxage=dbh.keepalive_interval)
+                self.assertTrue('recently verified' in out.getvalue())
+            ping.assert_not_called()
+            # without maxage, as after an error, a recent keepalive ping is not trusted
+            with capture_output() as (out, _):
+                dbh.reconnect()
+            ping.assert_called_once()
+        dbh.close()
+        self.assertIsNone(dbh.keepalive_interval)
+        last = dbh.last_alive
+        time.sleep(0.5)
+        self.assertEqual(dbh.last_alive, last)
+
+    def test_keepalive_idle(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test', lazy=True, keepalive=0.1)
+        time.sleep(0.3)
+        self.assertFalse(dbh.is_connected())
+        with patch.object(dbh.con, 'ping', return_value=False) as ping:
+            with capture_output() as (out, _):
+                with dbh._uselock:
+                    time.sleep(0.3)
+                    ping.assert_not_called()
+                time.sleep(0.3)
+            self.assertTrue('connection dead' in out.getvalue())
+        dbh.close()
+
+        with patch('despydb.oracon'):
+            dbh = desdbi.DesDbi(self.sfile, 'db-minimal')
+            self.assertRaises(ValueError, dbh.start_keepalive, 10)
+            dbh.close()
+            dbh = desdbi.DesDbi(self.sfile, 'db-minimal', lazy=True, keepalive=10)
+            self.assertTrue(dbh.configdict['threaded'])
+            dbh.close()
+
+    def test_fork(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        parent_con = dbh.con
+        rfd, wfd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                res = dbh.query_simple('dummy')
+                ok = dbh.con is not parent_con and len(res) == 6
+                dbh.close()
+                os.write(wfd, b'ok' if ok else b'bad')
+                status = 0
+            finally:
+                os._exit(status)
+        os.close(wfd)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.read(rfd, 10), b'ok')
+        os.close(rfd)
+        self.assertEqual(status, 0)
+        self.assertIs(dbh.con, parent_con)
+        self.assertEqual(len(dbh.query_simple('dummy')), 6)
+        dbh.close()
+
+    def test_for_thread(self):
+        from concurrent.futures import ThreadPoolExecutor
+        dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        self.assertIs(dbh.for_thread(), dbh)
+
+        def work(_):
+            tdbh = dbh.for_thread()
+            self.assertIs(tdbh, dbh.for_thread())
+            return id(tdbh), len(tdbh.query_simple('dummy'))
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            res = list(executor.map(work, range(12)))
+        handles = {r[0] for r in res}
+        self.assertTrue(1 <= len(handles) <= 3)
+        self.assertFalse(id(dbh) in handles)
+        self.assertTrue(all(r[1] == 6 for r in res))
+        thandles = list(dbh._thread_handles)
+        dbh.close()
+        self.assertFalse(any(h.is_connected() and h.ping() for h in thandles))
+
     def test_autocommit(self):
         self.assertFalse(self.dbh.autocommit(True))
         self.assertTrue(self.dbh.autocommit(False))
@@ -514,6 +830,67 @@ port    =   0
         self.assertEqual(res['telescope'], str)
         self.assertEqual(res['mjd_obs'], float)
 
+    def test_metadata_cache(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        with patch.object(dbh, '_describe', wraps=dbh._describe) as describe:
+            meta = dbh.get_column_metadata('exposure')
+            self.assertEqual(dbh.get_column_names('EXPOSURE'), list(meta.keys()))
+            self.assertEqual(len(dbh.get_column_lengths('exposure')), len(meta))
+            self.assertEqual(dbh.get_column_types('exposure')['telescope'], str)
+            self.assertEqual(describe.call_count, 1)
+            stats = dbh.metacache.stats()
+            self.assertEqual(stats['misses'], 2)
+            self.assertEqual(stats['hits'], 3)
+
+            dbh.invalidate_metadata('exposure')
+            dbh.get_column_names('exposure')
+            self.assertEqual(describe.call_count, 2)
+
+            cur = dbh.cursor()
+            cur.execute('create table meta_test (a INTEGER)')
+            self.assertEqual(dbh.get_column_names('meta_test'), ['a'])
+            dbh.table_drop('meta_test')
+            cur.execute('create table meta_test (a INTEGER, b TEXT)')
+            self.assertEqual(dbh.get_column_names('meta_test'), ['a', 'b'])
+            dbh.table_drop('meta_test')
+            cur.close()
+        dbh.close()
+
+    def test_prefetch_metadata(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        with patch.object(dbh, '_describe', wraps=dbh._describe) as describe:
+            res = dbh.prefetch_metadata(['exposure', 'CATALOG'])
+            self.assertEqual(sorted(res.keys()), ['catalog', 'exposure'])
+            self.assertEqual(list(res['exposure'].keys()), dbh.get_column_names('exposure'))
+            self.assertTrue('filename' in dbh.get_column_names('catalog'))
+            dbh.get_column_lengths('exposure')
+            self.assertEqual(describe.call_count, 0)
+            self.assertRaises(Exception, dbh.prefetch_metadata, ['exposure', 'no_such_table'])
+            self.assertEqual(describe.call_count, 1)
+        self.assertEqual(dbh.prefetch_metadata([]), {})
+        dbh.close()
+
+    def test_metadata_cache_ttl(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test', metacache_ttl=0.1)
+        dbh.get_column_names('exposure')
+        dbh.get_column_names('exposure')
+        time.sleep(0.2)
+        dbh.get_column_names('exposure')
+        self.assertEqual(dbh.metacache.stats()['misses'], 2)
+        dbh.close()
+
+        dbh = desdbi.DesDbi(self.sfile, 'db-test', metacache=False)
+        self.assertIsNone(dbh.metacache)
+        self.assertTrue('expnum' in dbh.get_column_names('exposure'))
+        dbh.close()
+
+        dbh1 = desdbi.DesDbi(self.sfile, 'db-test', metacache='process')
+        dbh2 = desdbi.DesDbi(self.sfile, 'db-test', metacache='process')
+        self.assertIs(dbh1.metacache, dbh2.metacache)
+        self.assertIsNot(dbh1.metacache, self.dbh.metacache)
+        dbh1.close()
+        dbh2.close()
+
     def test_get_named_bind_string(self):
         self.assertTrue('blah' in self.dbh.get_named_bind_string('blah'))
 
@@ -532,6 +909,32 @@ port    =   0
         res2 = self.dbh.get_seq_next_value('DESFILE_SEQ')
         self.assertEqual(res2-res1, 1)
 
+    def test_get_seq_next_values(self):
+        first = self.dbh.get_seq_next_value('TASK_SEQ')
+        vals = self.dbh.get_seq_next_values('TASK_SEQ', 5)
+        self.assertEqual(vals, list(range(first + 1, first + 6)))
+        self.assertEqual(self.dbh.get_seq_next_values('TASK_SEQ', 0), [])
+        self.assertEqual(self.dbh.get_seq_next_value('TASK_SEQ'), first + 6)
+
+        self.dbh.cache_sequence('task_seq', 4)
+        with patch.object(self.dbh, 'get_seq_next_values',
+                          wraps=self.dbh.get_seq_next_values) as fetch:
+            ids = [self.dbh.get_seq_next_value('TASK_SEQ') for _ in range(10)]
+            self.assertEqual(fetch.call_count, 3)
+        self.assertEqual(ids, list(range(first + 7, first + 17)))
+        self.dbh.cache_sequence('TASK_SEQ', None)
+        # the two unused cached values are skipped
+        self.assertEqual(self.dbh.get_seq_next_value('TASK_SEQ'), first + 19)
+
+        # the caller's transaction is neither committed nor allowed to reissue values
+        self.dbh.autocommit(False)
+        self.dbh.basic_insert_row('proctag', {'tag': 'seqtag', 'created_date': '0'})
+        vals = self.dbh.get_seq_next_values('TASK_SEQ', 3)
+        self.dbh.rollback()
+        self.assertEqual(self.dbh.query_simple('proctag', where="tag='seqtag'"), [])
+        self.assertEqual(self.dbh.get_seq_next_values('TASK_SEQ', 1), [vals[-1] + 1])
+        self.dbh.commit()
+
     def test_insert_many(self):
         self.dbh.autocommit(False)
         self.dbh.insert_many('none', 'none', [])
@@ -545,6 +948,159 @@ port    =   0
         self.assertEqual(len(c.fetchall()), 2)
         c.close()
 
+    def test_insert_many_batches(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        rows = ((expnum, '20190813') for expnum in range(100, 125))
+        res = dbh.insert_many('exposure', ['expnum', 'nite'], rows, batchsize=10)
+        self.assertEqual(res['rows'], 25)
+        self.assertEqual(res['batches'], 3)
+        self.assertEqual(res['commits'], 0)
+        self.assertTrue(res['seconds'] >= 0.)
+        rows = [{'expnum': expnum, 'nite': '20190814'} for expnum in range(100, 125)]
+        with patch.object(dbh, 'commit', wraps=dbh.commit) as commit:
+            res = dbh.insert_many('exposure', ['expnum', 'nite'], iter(rows), batchbytes=100,
+                                  commit_every=2)
+        # each row is estimated at 16 bytes
+        self.assertEqual(res['batches'], 4)
+        self.assertEqual(res['commits'], 2)
+        self.assertEqual(commit.call_count, 2)
+        c = dbh.cursor()
+        c.execute('select count(*) from exposure where nite in ("20190813", "20190814")')
+        self.assertEqual(c.fetchone()[0], 50)
+        c.execute('delete from exposure where nite in ("20190813", "20190814")')
+        c.close()
+        dbh.commit()
+        self.assertEqual(dbh.insert_many('exposure', ['expnum'], iter([]))['rows'], 0)
+        dbh.close()
+
+    def test_insert_many_batcherrors(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        cur = dbh.cursor()
+        cur.execute('create table batch_test (id INTEGER PRIMARY KEY, name TEXT NOT NULL)')
+        rows = [(1, 'a'), (2, None), (3, 'c'), (1, 'd'), (5, 'e')]
+        res = dbh.insert_many('batch_test', ['id', 'name'], rows, batchsize=3, batcherrors=True)
+        self.assertEqual(res['rows'], 3)
+        self.assertEqual([err[0] for err in res['errors']], [1, 3])
+        self.assertTrue('NOT NULL' in res['errors'][0][1])
+        cur.execute('select id from batch_test order by id')
+        self.assertEqual([r[0] for r in cur.fetchall()], [1, 3, 5])
+        self.assertRaises(sqlite3.IntegrityError, dbh.insert_many, 'batch_test', ['id', 'name'],
+                          [(6, 'f'), (1, 'g')])
+        cur.close()
+        dbh.table_drop('batch_test')
+        dbh.close()
+
+    def test_insert_many_bisect(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        dbh.autocommit(False)
+        cur = dbh.cursor()
+        cur.execute('create table bisect_test (id INTEGER PRIMARY KEY, name TEXT NOT NULL)')
+        rows = [(i, 'x') for i in range(1000)]
+        rows[10] = (10, None)
+        rows[500] = (1, 'y')
+        rows[998] = (998, None)
+        res = dbh.insert_many('bisect_test', ['id', 'name'], rows, on_error='bisect')
+        self.assertEqual(res['rows'], 997)
+        self.assertEqual([err[0] for err in res['errors']], [10, 500, 998])
+        self.assertTrue(res['statements'] < 70)
+        dbh.commit()
+        cur.execute('select count(*) from bisect_test')
+        self.assertEqual(cur.fetchone()[0], 997)
+        self.assertRaises(ValueError, dbh.insert_many, 'bisect_test', ['id'], [(1,)], on_error='skip')
+        self.assertRaises(ValueError, dbh.insert_many, 'bisect_test', ['id'], [(1,)], batcherrors=True,
+                          on_error='bisect')
+        dbh.autocommit(True)
+        self.assertRaises(ValueError, dbh.insert_many, 'bisect_test', ['id'], [(1,)], on_error='bisect')
+        dbh.autocommit(False)
+        cur.close()
+        dbh.table_drop('bisect_test')
+        dbh.close()
+
+    def test_insert_columns(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        arrays = {'expnum': [201, 202, 203], 'nite': ['20190816'] * 3, 'mjd_obs': [1.5, None, 3.5]}
+        res = dbh.insert_columns('exposure', arrays, batchsize=2)
+        self.assertEqual(res['rows'], 3)
+        self.assertEqual(res['batches'], 2)
+        cur = dbh.cursor()
+        cur.execute('select expnum, mjd_obs from exposure where nite="20190816" order by expnum')
+        self.assertEqual([tuple(r) for r in cur.fetchall()], [(201, 1.5), (202, None), (203, 3.5)])
+        self.assertRaises(ValueError, dbh.insert_columns, 'exposure', {'expnum': [1], 'nite': []})
+        self.assertRaises(ValueError, dbh.insert_columns, 'exposure', {'nocol': [1]})
+        cur.close()
+        dbh.rollback()
+        dbh.close()
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_insert_columns_numpy(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        data = numpy.zeros(4, dtype=[('EXPNUM', 'i8'), ('NITE', 'S8'), ('MJD_OBS', 'f8')])
+        data['EXPNUM'] = [301, 302, 303, 304]
+        data['NITE'] = b'20190817'
+        data['MJD_OBS'] = [1., 2., 3., 4.]
+        res = dbh.insert_columns('exposure', data, batchsize=3)
+        self.assertEqual(res['rows'], 4)
+        masked = {'expnum': numpy.array([305, 306]), 'nite': numpy.array(['20190817'] * 2),
+                  'mjd_obs': numpy.ma.array([5., 6.], mask=[False, True])}
+        dbh.insert_columns('exposure', masked)
+        cur = dbh.cursor()
+        cur.execute('select nite, mjd_obs from exposure where expnum in (301, 306) order by expnum')
+        self.assertEqual([tuple(r) for r in cur.fetchall()], [('20190817', 1.), ('20190817', None)])
+        cur.close()
+        dbh.rollback()
+        dbh.close()
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_insert_columns_arrow(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        table = pyarrow.table({'expnum': [401, 402], 'nite': ['20190818', None]})
+        self.assertEqual(dbh.insert_columns('exposure', table)['rows'], 2)
+        cur = dbh.cursor()
+        cur.execute('select nite from exposure where expnum=402')
+        self.assertIsNone(cur.fetchone()[0])
+        cur.close()
+        dbh.rollback()
+        dbh.close()
+
+    def test_insert_many_direct(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        dbh.autocommit(False)
+        rows = [(expnum, '20190819') for expnum in range(500, 505)]
+        res = dbh.insert_many('exposure', ['expnum', 'nite'], rows, batchsize=2, direct=True)
+        self.assertEqual(res['batches'], 3)
+        self.assertEqual(res['commits'], 3)
+        self.assertEqual(dbh.get_table_triggers('exposure'), [])
+        self.assertEqual(dbh.get_table_triggers('pfw_attempt'), ['PFW_ATTEMPT_STATE'])
+        with patch.object(dbh, 'commit') as commit:
+            with self.assertWarns(RuntimeWarning):
+                res = dbh.insert_many('pfw_attempt', ['reqnum', 'unitname', 'attnum', 'id',
+                                                      'task_id'],
+                                      [(1, 'u', 1, 9001, 9001)], direct=True)
+            commit.assert_not_called()
+        self.assertRaises(ValueError, dbh.insert_many, 'exposure', ['expnum'], [(1,)], direct=True,
+                          on_error='bisect')
+        dbh.rollback()
+        cur = dbh.cursor()
+        cur.execute('delete from exposure where nite="20190819"')
+        cur.close()
+        dbh.commit()
+        dbh.close()
+
+    def test_prepare_insert(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        with patch.object(dbh.con, 'get_input_sizes', wraps=dbh.con.get_input_sizes) as sizes:
+            stmt = dbh.prepare_insert('exposure', ['expnum', 'nite'], inputsizes=True)
+            self.assertEqual(stmt.inputsizes, [None, None])
+            stmt.executemany([(1, '20190815'), (2, '20190815')])
+            self.assertEqual(stmt.cursor.inputsizes, (None, None))
+            stmt = dbh.prepare_insert('exposure', ['expnum', 'nite'], named=True, inputsizes=True)
+            self.assertEqual(stmt.inputsizes, {'expnum': None, 'nite': None})
+            dbh.insert_many('exposure', ['expnum', 'nite'], [(3, '20190815')], inputsizes=False)
+            self.assertIsNone(dbh.prepare('INSERT INTO exposure(expnum,nite) VALUES(?,?)').inputsizes)
+            self.assertEqual(sizes.call_count, 1)
+        dbh.rollback()
+        dbh.close()
+
     def test_insert_many_indiv(self):
         self.dbh.autocommit(False)
         self.dbh.insert_many_indiv('none', 'none', [])
@@ -664,5 +1220,659 @@ port    =   0
 
         self.assertRaises(Exception, self.dbh.basic_update_row, 'dummy2', {'junk': 89}, {'name': 'TASK_SEQ'})
 
+    def test_prepare(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test', stmtcachesize=2)
+        sql = 'select name from dummy where junk=:junk'
+        stmt = dbh.prepare(sql)
+        self.assertIs(dbh.prepare(sql), stmt)
+        curs = stmt.execute({'junk': 86})
+        curs.fetchall()
+        self.assertIs(stmt.execute({'junk': 89}), curs)
+        self.assertEqual(stmt.executions, 2)
+
+        dbh.prepare('select 1 from dummy')
+        dbh.prepare('select 2 from dummy')
+        self.assertEqual(len(dbh._prepared), 2)
+        self.assertFalse(sql in dbh._prepared)
+        self.assertIsNone(stmt._curs)
+
+        for tag in ['tag1', 'tag2', 'tag3']:
+            dbh.basic_insert_row('proctag', {'tag': tag, 'created_date': dbh.get_current_timestamp_str()})
+        inserts = [st for st in dbh._prepared.values() if st.sql.startswith('insert')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(inserts[0].executions, 3)
+        dbh.basic_update_row('proctag', {'tag': 'tag4'}, {'tag': 'tag1'})
+        dbh.basic_update_row('proctag', {'tag': 'tag5'}, {'tag': 'tag2'})
+        updates = [st for st in dbh._prepared.values() if st.sql.startswith('update')]
+        self.assertEqual(updates[0].executions, 2)
+        dbh.rollback()
+        dbh.close()
+        self.assertEqual(len(dbh._prepared), 0)
+
+    def test_insert_many_untyped(self):
+        # values given as strings must insert without any options, even where
+        # the column metadata would bind them as dates or numbers
+        dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        cur = dbh.cursor()
+        cur.execute('create table untyped_test (obsdate DATE, num NUMBER)')
+        with patch.object(dbh.con, 'get_input_sizes',
+                          return_value={'obsdate': datetime.datetime, 'num': float}) as sizes:
+            res = dbh.insert_many('untyped_test', ['obsdate', 'num'],
+                                  [('2019-08-15 01:02:03', '12.5'), ('2019-08-16 00:00:00', '7')])
+            sizes.assert_not_called()
+        self.assertEqual(res['rows'], 2)
+        stmt = dbh.prepare_insert('untyped_test', ['obsdate', 'num'])
+        self.assertIsNone(stmt.inputsizes)
+        cur.execute('select count(*) from untyped_test')
+        self.assertEqual(cur.fetchone()[0], 2)
+        cur.close()
+        dbh.table_drop('untyped_test')
+        dbh.close()
+
+    def test_update_many(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        ctstr = dbh.get_current_timestamp_str()
+        dbh.insert_many('proctag', ['tag', 'created_date', 'pfw_attempt_id'],
+                        [(f'um{i}', ctstr, i) for i in range(5)], inputsizes=False)
+        rows = [{'created_by': 'a', 'pfw_attempt_id': 0},
+                {'created_by': 'b', 'pfw_attempt_id': 1},
+                {'created_by': 'c', 'pfw_attempt_id': 99},
+                {'created_by': ctstr, 'pfw_attempt_id': 3}]
+        counts = dbh.update_many('proctag', ['created_by'], ['pfw_attempt_id'], rows, batchsize=3)
+        self.assertEqual(counts, [1, 1, 0, 1])
+        cur = dbh.cursor()
+        cur.execute("select created_by from proctag where tag like 'um%' order by pfw_attempt_id")
+        res = [r[0] for r in cur.fetchall()]
+        self.assertEqual(res[:3], ['a', 'b', 'USER'])
+        self.assertNotEqual(res[3], 'USER')
+        counts = dbh.update_many('proctag', ['created_by'], ['tag'], [('d', 'um4'), ('d', None)])
+        self.assertEqual(counts, [1, 0])
+        with capture_output():
+            self.assertRaisesRegex(Exception, '0 rows', dbh.update_many, 'proctag', ['created_by'],
+                                   ['tag'], [('e', 'nope')], fail_on_zero=True)
+
+        counts = dbh.delete_many('proctag', ['tag'], [('um0',), {'tag': 'um1'}, ('nope',)])
+        self.assertEqual(counts, [1, 1, 0])
+        with capture_output():
+            self.assertRaisesRegex(Exception, '0 rows deleted', dbh.delete_many, 'proctag', ['tag'],
+                                   [('um0',)], fail_on_zero=True)
+        cur.execute("select count(*) from proctag where tag like 'um%'")
+        self.assertEqual(cur.fetchone()[0], 3)
+        cur.close()
+        dbh.rollback()
+        dbh.close()
+
+    def test_upsert_many(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        cur = dbh.cursor()
+        cur.execute('create table upsert_test (id INTEGER PRIMARY KEY, name TEXT, val REAL)')
+        cur.execute("insert into upsert_test values (1, 'a', 1.0)")
+        cur.execute("insert into upsert_test values (2, 'b', 2.0)")
+        res = dbh.upsert_many('upsert_test', ['id'], ['id', 'name', 'val'],
+                              [(1, 'aa', 1.5), {'id': 3, 'name': 'c', 'val': 3.0}, (4, 'd', 4.0)],
+                              batchsize=2)
+        self.assertEqual(res, {'inserted': 2, 'updated': 1})
+        cur.execute('select id, name from upsert_test order by id')
+        self.assertEqual([tuple(r) for r in cur.fetchall()], [(1, 'aa'), (2, 'b'), (3, 'c'), (4, 'd')])
+        res = dbh.upsert_many('upsert_test', ['id'], ['id'], [(4,), (5,)])
+        self.assertEqual(res, {'inserted': 1, 'updated': 0})
+
+        cur.execute('create temp table upsert_stage (id INTEGER, name TEXT, val REAL)')
+        res = dbh.upsert_many('upsert_test', ['id'], ['id', 'name', 'val'],
+                              [(2, 'bb', 2.5), (6, 'f', 6.0), (7, 'g', 7.0)], stage='upsert_stage')
+        self.assertEqual(res, {'inserted': 2, 'updated': 1})
+        cur.execute("select name from upsert_test where id=2")
+        self.assertEqual(cur.fetchone()[0], 'bb')
+        cur.execute("select count(*) from upsert_stage")
+        self.assertEqual(cur.fetchone()[0], 0)
+
+        # a key repeated within a batch is applied once, with the last row given for it
+        res = dbh.upsert_many('upsert_test', ['id'], ['id', 'name', 'val'],
+                              [(8, 'h', 8.0), (9, 'i', 9.0), {'id': 8, 'name': 'hh', 'val': 8.5}])
+        self.assertEqual(res, {'inserted': 2, 'updated': 1})
+        res = dbh.upsert_many('upsert_test', ['id'], ['id', 'name', 'val'],
+                              [(9, 'ii', 9.5), (10, 'j', 10.0), (9, 'iii', 9.0)], stage='upsert_stage')
+        self.assertEqual(res, {'inserted': 1, 'updated': 2})
+        cur.execute("select id, name from upsert_test where id >= 8 order by id")
+        self.assertEqual([tuple(r) for r in cur.fetchall()], [(8, 'hh'), (9, 'iii'), (10, 'j')])
+        self.assertRaises(ValueError, dbh.upsert_many, 'upsert_test', ['key'], ['id'], [])
+        cur.execute('drop table upsert_stage')
+        cur.close()
+        dbh.table_drop('upsert_test')
+        dbh.close()
+
+    def test_returning(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        cur = dbh.cursor()
+        cur.execute("create table returning_test (id INTEGER PRIMARY KEY, name TEXT UNIQUE, "
+                    "state TEXT DEFAULT 'new')")
+        res = dbh.basic_insert_row('returning_test', {'name': 'a'}, returning=['id', 'state'])
+        self.assertEqual(res, {'id': 1, 'state': 'new'})
+        self.assertTrue(isinstance(res['id'], int))
+        self.assertEqual(dbh.basic_insert_row('returning_test', {'name': 'b'}, returning=['id']),
+                         {'id': 2})
+        self.assertIsNone(dbh.basic_insert_row('returning_test', {'name': 'c'}))
+        res = dbh.basic_update_row('returning_test', {'state': 'done'}, {'state': 'new'},
+                                   returning=['id'])
+        self.assertEqual(sorted(r['id'] for r in res), [1, 2, 3])
+
+        summary = dbh.insert_many('returning_test', ['name'], [('d',), ('e',), ('f',)],
+                                  batchsize=2, returning=['id', 'name'])
+        self.assertEqual(summary['returning'], [{'id': 4, 'name': 'd'}, {'id': 5, 'name': 'e'},
+                                                {'id': 6, 'name': 'f'}])
+        summary = dbh.insert_many('returning_test', ['name'], [{'name': 'g'}, {'name': 'a'}],
+                                  batcherrors=True, returning=['id'])
+        self.assertEqual(summary['returning'], [{'id': 7}, None])
+        self.assertEqual([err[0] for err in summary['errors']], [1])
+        self.assertRaises(ValueError, dbh.insert_many, 'returning_test', ['name'], [('h',)],
+                          on_error='bisect', returning=['id'])
+
+        res = dbh.update_many('returning_test', ['state'], ['name'],
+                              [('redo', 'a'), ('redo', 'zz'), ('redo', 'g')], returning=['id', 'state'])
+        self.assertEqual(res, [[{'id': 1, 'state': 'redo'}], [], [{'id': 7, 'state': 'redo'}]])
+        self.assertEqual(dbh.update_many('returning_test', ['state'], ['name'], [('x', 'b')]), [1])
+        cur.close()
+        dbh.table_drop('returning_test')
+
+        # Oracle describes NUMBER columns as floats; integral ones are returned as ints
+        meta = {'id': ('ID', cxo.NUMBER, None, 22, 10, 0, False),
+                'ra': ('RA', cxo.NUMBER, None, 22, 0, -127, True),
+                'name': ('NAME', cxo.STRING, 20, 20, None, None, True)}
+        curs = MagicMock()
+        with patch.object(dbh, 'get_column_metadata', return_value=meta), \
+             patch.object(dbh, 'get_column_types',
+                          return_value={'id': float, 'ra': float, 'name': str}), \
+             patch.object(dbh, 'get_column_lengths', return_value={'id': 22, 'ra': 22, 'name': 20}):
+            dbh._returning_vars(curs, 'oracle_table', ['id', 'ra', 'name'], 3)
+        self.assertEqual([c[0][:2] for c in curs.var.call_args_list], [(int, 0), (float, 0), (str, 20)])
+        dbh.close()
+
+    def test_fetchsize(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        self.assertIsNone(dbh.fetchsize)
+        self.assertEqual(dbh.cursor().arraysize, 1)
+        cur = dbh.cursor(500)
+        self.assertEqual((cur.arraysize, cur.prefetchrows), (500, 500))
+        dbh = desdbi.DesDbi(self.sfile, 'db-test', fetchsize=200)
+        self.assertEqual(dbh.cursor().arraysize, 200)
+        self.assertEqual(dbh.cursor(20).arraysize, 20)
+        self.assertEqual(desdbi.DesDbi(connection=dbh).fetchsize, 200)
+        config = dict(dbh.configdict, fetchsize='300')
+        with patch.object(configcache, 'get_config', return_value=config):
+            dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        self.assertEqual(dbh.fetchsize, 300)
+        self.assertEqual(dbh.cursor().arraysize, 300)
+
+    def test_iter_query(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        cur = dbh.cursor()
+        cur.execute('create table iter_test (id INTEGER PRIMARY KEY, name TEXT)')
+        dbh.insert_many('iter_test', ['id', 'name'], [(i, f'n{i}') for i in range(250)])
+        rows = dbh.iter_query('iter_test', ['id', 'name'], ['id >= :1'], 'id', params=(10,),
+                              arraysize=100)
+        first = next(rows)
+        self.assertEqual(first, {'id': 10, 'name': 'n10'})
+        self.assertEqual(len(list(rows)), 239)
+        batches = list(dbh.iter_query('iter_test', 'id', orderby='id', rowtype=tuple,
+                                      arraysize=100, prefetchrows=101, batches=True))
+        self.assertEqual([len(b) for b in batches], [100, 100, 50])
+        self.assertEqual(batches[2][-1], (249,))
+        self.assertEqual(list(dbh.iter_query('iter_test', where='id < 0')), [])
+
+        class OldCursor:
+            # a cursor of cx_Oracle before 8, which has no prefetchrows
+            __slots__ = ('curs', 'arraysize')
+
+            def __init__(self, curs):
+                self.curs = curs
+
+            def __getattr__(self, name):
+                if name == 'prefetchrows':
+                    raise AttributeError(name)
+                return getattr(self.curs, name)
+
+        with patch.object(dbh, 'cursor', side_effect=lambda: OldCursor(cur)):
+            self.assertEqual(len(list(dbh.iter_query('iter_test', prefetchrows=50))), 250)
+
+        self.assertEqual(dbh._fetch_size('iter_test a, iter_test b', ['a.id'] * 1000), 1048576 // 8000)
+        meta = {'id': ('ID', int, None, 22, 10, 0, 0), 'name': ('NAME', str, None, 4000, None, None, 1)}
+        with patch.object(dbh, 'get_column_metadata', return_value=meta):
+            self.assertEqual(dbh._fetch_size('iter_test'), 1048576 // 4022)
+            self.assertEqual(dbh._fetch_size('iter_test', ['id']), 10000)
+            self.assertEqual(dbh._fetch_size('iter_test', 'name, name, name, name, name'), 100)
+        cur.close()
+        dbh.table_drop('iter_test')
+        dbh.close()
+
+    def test_stage_keys(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        cur = dbh.cursor()
+        cur.execute('create table stage_test (id INTEGER PRIMARY KEY, name TEXT)')
+        dbh.insert_many('stage_test', ['id', 'name'], [(i, f'n{i}') for i in range(50)])
+        with dbh.stage_keys('gtt_id', 'id', range(0, 100, 5), batchsize=7) as gtt:
+            self.assertEqual(gtt, 'gtt_id')
+            cur.execute(f'select count(*) from {gtt}')
+            self.assertEqual(cur.fetchone()[0], 20)
+            cur.execute(f'select s.name from stage_test s, {gtt} g where s.id = g.id order by s.id')
+            self.assertEqual([r[0] for r in cur.fetchall()], [f'n{i}' for i in range(0, 50, 5)])
+        cur.execute('select count(*) from gtt_id')
+        self.assertEqual(cur.fetchone()[0], 0)
+
+        with self.assertRaises(RuntimeError):
+            with dbh.stage_keys('gtt_filename', ['filename', 'compression'],
+                                [('a.fits', '.fz'), ('b.fits', None)]):
+                raise RuntimeError('stop')
+        cur.execute('select count(*) from gtt_filename')
+        self.assertEqual(cur.fetchone()[0], 0)
+
+        # a failed load is cleaned up too
+        with self.assertRaises(Exception):
+            with dbh.stage_keys('gtt_filename', ['filename', 'compression'],
+                                [('a.fits', '.fz'), ('b.fits',)], batchsize=1):
+                self.fail('the block should not be entered')
+        cur.execute('select count(*) from gtt_filename')
+        self.assertEqual(cur.fetchone()[0], 0)
+
+        # a failed clean up does not replace the error which ended the block
+        patcher = patch.object(dbh, 'cursor', side_effect=Exception('cleanup failed'))
+        with capture_output() as (out, _):
+            with self.assertRaises(RuntimeError):
+                with dbh.stage_keys('gtt_id', 'id', [1, 2]):
+                    patcher.start()
+                    raise RuntimeError('stop')
+        patcher.stop()
+        self.assertTrue('cleanup failed' in out.getvalue())
+        with self.assertRaisesRegex(Exception, 'cleanup failed'):
+            with dbh.stage_keys('gtt_id', 'id', [1, 2]):
+                patcher.start()
+        patcher.stop()
+        dbh.con.execute('delete from gtt_id')
+        cur.close()
+        dbh.table_drop('stage_test')
+        dbh.close()
+
+class TestImportTime(unittest.TestCase):
+    def run_python(self, code):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(sys.path)
+        proc = Popen([sys.executable, '-X', 'importtime', '-c', code], stdout=PIPE, stderr=PIPE,
+                     env=env)
+        out, err = proc.communicate()
+        self.assertEqual(proc.returncode, 0, err.decode())
+        imported = {}
+        for line in err.decode().splitlines():
+            if line.startswith('import time:') and '|' in line:
+                _, cumulative, name = line[len('import time:'):].split('|')
+                if cumulative.strip().isdigit():
+                    imported[name.strip()] = int(cumulative)
+        return out.decode(), imported
+
+    def test_import_despydb(self):
+        out, imported = self.run_python('import sys\n'
+                                        'import despydb\n'
+                                        'print(" ".join(sorted(sys.modules)))\n')
+        self.assertTrue('despydb' in imported)
+        modules = out.split()
+        for mod in ['cx_Oracle', 'numpy', 'despymisc', 'despydb.oracon']:
+            self.assertFalse(mod in modules, f'{mod} imported by "import despydb"')
+        # cumulative microseconds; generous, the heavy imports are the ones checked above
+        self.assertLess(imported['despydb'], 1000000)
+
+    def test_no_dns_at_import(self):
+        code = ('import socket\n'
+                'def fail(*args):\n'
+                '    raise RuntimeError("DNS lookup at import time")\n'
+                'socket.getfqdn = fail\n'
+                'import despydb.oracon\n'
+                'import MockDBI\n')
+        self.run_python(code)
+
+    def test_lazy_dialect(self):
+        code = ('import sys\n'
+                'from unittest.mock import patch\n'
+                'import despydb.desdbi as desdbi\n'
+                'conf = {"type": "oracle", "meta_file": "x", "meta_section": "y"}\n'
+                'with patch("despydb.configcache.get_config", return_value=conf):\n'
+                '    dbh = desdbi.DesDbi(lazy=True)\n'
+                'print(dbh.get_named_bind_string("abc"), "cx_Oracle" in sys.modules)\n')
+        out, _ = self.run_python(code)
+        self.assertEqual(out.strip(), ':abc False')
+
+class TestConfigCache(unittest.TestCase):
+    def setUp(self):
+        self.sfile = 'cache_services.ini'
+        write_services(self.sfile)
+        configcache.clear_cache()
+
+    def tearDown(self):
+        configcache.clear_cache()
+        os.unlink(self.sfile)
+
+    def test_get_config(self):
+        parse = configcache.serviceaccess.parse
+        with patch('despydb.configcache.serviceaccess.parse', side_effect=parse) as ptc:
+            conf = configcache.get_config(self.sfile, 'db-test')
+            self.assertEqual(conf['type'], 'test')
+            conf['type'] = 'changed'
+            self.assertEqual(configcache.get_config(self.sfile, 'db-test')['type'], 'test')
+            self.assertEqual(ptc.call_count, 1)
+
+            st = os.stat(self.sfile)
+            os.utime(self.sfile, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+            configcache.get_config(self.sfile, 'db-test')
+            self.assertEqual(ptc.call_count, 2)
+
+            configcache.clear_cache()
+            configcache.get_config(self.sfile, 'db-test')
+            self.assertEqual(ptc.call_count, 3)
+
+    def test_get_config_environment(self):
+        sfile2 = 'cache_services2.ini'
+        write_services(sfile2, TEST_SERVICES.replace('db-test', 'db-other'))
+        parse = configcache.serviceaccess.parse
+
+        def parse_env(desfile, section, *args):
+            return parse(desfile or os.environ['DES_SERVICES'],
+                         section or os.environ['DES_DB_SECTION'], *args)
+
+        try:
+            with patch('despydb.configcache.serviceaccess.parse', side_effect=parse_env) as ptc:
+                with patch.dict(os.environ, {'DES_SERVICES': self.sfile,
+                                             'DES_DB_SECTION': 'db-test'}):
+                    self.assertEqual(configcache.get_config()['meta_section'], 'db-test')
+                    self.assertEqual(configcache.get_config(self.sfile)['meta_section'], 'db-test')
+                    self.assertEqual(ptc.call_count, 1)
+                with patch.dict(os.environ, {'DES_SERVICES': sfile2,
+                                             'DES_DB_SECTION': 'db-other'}):
+                    conf = configcache.get_config()
+                    self.assertEqual((conf['meta_file'], conf['meta_section']),
+                                     (sfile2, 'db-other'))
+                    self.assertEqual(ptc.call_count, 2)
+        finally:
+            os.unlink(sfile2)
+
+class TestDesDbiPool(ServicesTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        dbpool.DesDbiPool.close_all()
+        super().tearDownClass()
+
+    def test_get(self):
+        pool = dbpool.DesDbiPool.get(self.sfile, 'db-test')
+        self.assertIs(pool, dbpool.DesDbiPool.get(self.sfile, 'db-test'))
+        self.assertIs(pool, dbpool.DesDbiPool.get(os.path.abspath(self.sfile), 'db-test'))
+        with patch.dict(os.environ, {'DES_SERVICES': self.sfile, 'DES_DB_SECTION': 'db-test'}):
+            self.assertIs(pool, dbpool.DesDbiPool.get())
+        with desdbi.DesDbi(self.sfile, 'db-test', pool=True) as dbh:
+            self.assertIs(dbh.pool, pool)
+            self.assertEqual(pool.stats()['busy'], 1)
+            self.assertEqual(len(dbh.query_simple('dummy')), 6)
+        self.assertEqual(pool.stats()['busy'], 0)
+        self.assertFalse(dbh.is_connected())
+        dbh.close()
+        self.assertEqual(pool.stats()['busy'], 0)
+        with self.assertWarns(RuntimeWarning):
+            self.assertIs(dbpool.DesDbiPool.get(self.sfile, 'db-test', maxsess=3), pool)
+
+    def test_close_twice(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test')
+        dbh.close()
+        self.assertFalse(dbh.is_connected())
+        dbh.close()
+
+    def test_stats(self):
+        pool = dbpool.DesDbiPool(self.sfile, 'db-test', maxsess=2, timeout=0.1)
+        dbh1 = desdbi.DesDbi(pool=pool)
+        dbh2 = desdbi.DesDbi(pool=pool)
+        stats = pool.stats()
+        self.assertEqual(stats['busy'], 2)
+        self.assertEqual(stats['open'], 2)
+        self.assertEqual(stats['acquires'], 2)
+        with capture_output():
+            self.assertRaises(Exception, desdbi.DesDbi, pool=pool)
+        dbh1.close()
+        dbh2.close()
+        self.assertEqual(pool.stats()['busy'], 0)
+        pool.close()
+
+    def test_reconnect(self):
+        pool = dbpool.DesDbiPool(self.sfile, 'db-test')
+        dbh = desdbi.DesDbi(pool=pool)
+        dbh.con.pingval = False
+        dbh.reconnect()
+        self.assertTrue(dbh.ping())
+        self.assertEqual(pool.stats()['busy'], 1)
+        dbh.close()
+        pool.close()
+
+class TestAsyncDesDbi(ServicesTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        dbpool.DesDbiPool.close_all()
+        super().tearDownClass()
+
+    def tearDown(self):
+        dbpool.DesDbiPool.close_all()
+
+    def test_gather(self):
+        async def run():
+            async with asyncdesdbi.AsyncDesDbi(self.sfile, 'db-test', maxsess=3) as adbh:
+                return await asyncio.gather(adbh.query_simple('dummy'),
+                                            adbh.query_simple('dummy', 'name', "name='TASK_SEQ'"),
+                                            adbh.get_column_names('exposure'),
+                                            adbh.get_named_bind_string('abc'))
+        res = asyncio.run(run())
+        self.assertEqual(len(res[0]), 6)
+        self.assertEqual(res[1], [{'name': 'TASK_SEQ'}])
+        self.assertTrue('expnum' in res[2])
+        self.assertEqual(res[3], ':abc')
+
+    def test_iter_query(self):
+        async def run():
+            async with asyncdesdbi.AsyncDesDbi(self.sfile, 'db-test') as adbh:
+                rows = [row async for row in adbh.iter_query('dummy', orderby='name', batchsize=4)]
+                tuples = [row async for row in adbh.iter_query('dummy', 'name', 'name=:1',
+                                                               params=('TASK_SEQ',), rowtype=tuple)]
+                return rows, tuples
+        rows, tuples = asyncio.run(run())
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows, self.dbh.query_simple('dummy', orderby='name'))
+        self.assertEqual(tuples, [('TASK_SEQ',)])
+
+    def test_transaction(self):
+        async def run(fail):
+            async with asyncdesdbi.AsyncDesDbi(self.sfile, 'db-test') as adbh:
+                async with adbh.transaction() as tx:
+                    await tx.basic_insert_row('proctag', {'tag': 'asynctag',
+                                                          'created_date': tx.dbh.get_current_timestamp_str()})
+                    res = await tx.query_simple('proctag', where="tag='asynctag'")
+                    if fail:
+                        raise ValueError('rollback')
+                    return res
+        self.assertRaises(ValueError, asyncio.run, run(True))
+        self.assertEqual(len(self.dbh.query_simple('proctag', where="tag='asynctag'")), 0)
+        self.assertEqual(len(asyncio.run(run(False))), 1)
+        self.assertEqual(len(self.dbh.query_simple('proctag', where="tag='asynctag'")), 1)
+        self.dbh.con.execute("delete from proctag where tag='asynctag'")
+        self.dbh.commit()
+
+    def test_unknown_method(self):
+        adbh = asyncdesdbi.AsyncDesDbi(self.sfile, 'db-test')
+        self.assertRaises(AttributeError, getattr, adbh, 'no_such_method')
+        self.assertRaises(AttributeError, getattr, adbh, '_dialect')
+        adbh.close()
+
+    def test_iter_query_limit(self):
+        async def run():
+            async with asyncdesdbi.AsyncDesDbi(self.sfile, 'db-test', maxsess=2) as adbh:
+                self.assertEqual(adbh.max_iterators, 1)
+                first = adbh.iter_query('dummy', batchsize=2)
+                second = adbh.iter_query('dummy', batchsize=2)
+                await first.__anext__()
+                waiting = asyncio.ensure_future(second.__anext__())
+                await asyncio.sleep(0.1)
+                self.assertFalse(waiting.done())
+                # other calls still have a session and a worker
+                self.assertTrue(len(await adbh.query_simple('dummy')) > 0)
+                await first.aclose()
+                await waiting
+                await second.aclose()
+        asyncio.run(run())
+
+    def test_dialect_helper(self):
+        async def run():
+            async with asyncdesdbi.AsyncDesDbi(self.sfile, 'db-test') as adbh:
+                with patch.object(adbh.pool, 'acquire') as acquire:
+                    self.assertEqual(await adbh.get_named_bind_string('abc'), ':abc')
+                    self.assertEqual(await adbh.from_dual(), '')
+                    acquire.assert_not_called()
+        asyncio.run(run())
+
+    def test_session_bound_method(self):
+        async def run():
+            async with asyncdesdbi.AsyncDesDbi(self.sfile, 'db-test') as adbh:
+                for name in ('cursor', 'prepare', 'prepare_insert', 'stage_keys',
+                             'for_thread', 'connect', 'reconnect'):
+                    with self.assertRaises(AttributeError):
+                        await getattr(adbh, name)()
+                for name in ('commit', 'rollback', 'savepoint', 'ping'):
+                    self.assertRaises(AttributeError, getattr, adbh, name)
+                async with adbh.transaction() as tx:
+                    with self.assertRaises(AttributeError):
+                        await tx.cursor()
+                    self.assertEqual(await tx.get_named_bind_string('abc'), ':abc')
+                    self.assertTrue(await tx.ping())
+                    await tx.rollback()
+        asyncio.run(run())
+
+class TestParallelLoader(ServicesTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cur = cls.dbh.cursor()
+        cur.execute('create table load_test (id INTEGER PRIMARY KEY, name TEXT)')
+        cur.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.dbh.table_drop('load_test')
+        super().tearDownClass()
+
+    def tearDown(self):
+        cur = self.dbh.cursor()
+        cur.execute('delete from load_test')
+        cur.close()
+        self.dbh.commit()
+
+    def count(self):
+        cur = self.dbh.cursor()
+        cur.execute('select count(*) from load_test')
+        count = cur.fetchone()[0]
+        cur.close()
+        return count
+
+    def test_load(self):
+        for commit in ['unordered', 'ordered']:
+            loader = parallelload.ParallelLoader('load_test', ['id', 'name'], self.sfile, 'db-test',
+                                                 nsessions=3, batchsize=100, maxqueue=2,
+                                                 commit=commit)
+            stats = loader.load((i, f'n{i}') for i in range(1050))
+            self.assertEqual(stats['rows'], 1050)
+            self.assertEqual(stats['batches'], 11)
+            self.assertEqual(sum(stats['sessions']), 1050)
+            self.assertTrue(stats['rows_per_second'] > 0)
+            self.assertEqual(loader.stats()['rows'], 1050)
+            self.assertEqual(self.count(), 1050)
+            self.tearDown()
+
+    def test_load_columns(self):
+        loader = parallelload.ParallelLoader('load_test', desfile=self.sfile, section='db-test',
+                                             nsessions=2, batchsize=10)
+        stats = loader.load_columns({'id': list(range(25)), 'name': ['x'] * 25})
+        self.assertEqual(stats['batches'], 3)
+        self.assertEqual(self.count(), 25)
+        self.assertRaises(ValueError, loader.load_columns, {'nocol': [1]})
+
+    def test_errors(self):
+        # the duplicate is in the same batch as the row it collides with
+        rows = [(i, 'x') for i in range(10)] + [(5, 'dup')] + [(i, 'x') for i in range(10, 200)]
+        loader = parallelload.ParallelLoader('load_test', ['id', 'name'], self.sfile, 'db-test',
+                                             nsessions=2, batchsize=20, commit='ordered')
+        self.assertRaises(sqlite3.IntegrityError, loader.load, rows)
+        self.tearDown()
+        loader = parallelload.ParallelLoader('load_test', ['id', 'name'], self.sfile, 'db-test',
+                                             nsessions=2, batchsize=20, batcherrors=True)
+        stats = loader.load(rows)
+        self.assertEqual(stats['rows'], 200)
+        self.assertEqual([err[0] for err in stats['errors']], [10])
+        self.assertRaises(ValueError, parallelload.ParallelLoader, 'load_test', commit='random')
+        self.assertRaises(ValueError, parallelload.ParallelLoader, 'load_test', commit_every=2)
+
+class TestSchemaRegistry(ServicesTestCase):
+    sqldir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sqlFiles')
+
+    def test_from_ddl(self):
+        registry = SchemaRegistry.from_ddl(self.sqldir)
+        self.assertTrue('EXPOSURE' in registry)
+        self.assertTrue('sequences_data' in registry)
+        self.assertFalse('no_such_table' in registry)
+        names = list(registry.lookup('exposure', 'metadata', MockConnection).keys())
+        self.assertEqual(names, self.dbh.get_column_names('exposure'))
+        types = registry.lookup('attempt_state_history', 'types', MockConnection)
+        self.assertEqual(types['change_date'], datetime.datetime)
+        self.assertEqual(types['pfw_attempt_id'], int)
+        self.assertFalse(registry._tables['attempt_state'][0]['nullable'])
+
+    def test_live_parity(self):
+        registry = SchemaRegistry.from_ddl(self.sqldir)
+        for table in ('exposure', 'attempt_state_history', 'proctag'):
+            self.assertEqual(registry.lookup(table, 'metadata', MockConnection),
+                             self.dbh.get_column_metadata(table))
+            self.assertEqual(registry.lookup(table, 'types', MockConnection),
+                             self.dbh.get_column_types(table))
+
+    def test_load_ddl(self):
+        registry = SchemaRegistry()
+        added = registry.load_ddl("""CREATE TABLE prod.my_table (
+                                         id NUMBER(10) PRIMARY KEY,
+                                         name VARCHAR2(40) DEFAULT 'a,b' NOT NULL,
+                                         ra BINARY_DOUBLE,
+                                         obs TIMESTAMP(6),
+                                         CONSTRAINT my_uk UNIQUE (name, ra));
+                                     CREATE SEQUENCE my_seq;""")
+        self.assertEqual(added, ['prod.my_table'])
+        meta = registry.lookup('prod.my_table', 'metadata', OracleConnection)
+        self.assertEqual(list(meta.keys()), ['id', 'name', 'ra', 'obs'])
+        self.assertEqual(meta['id'], ('ID', cxo.NUMBER, None, 22, 10, 0, False))
+        self.assertEqual(meta['name'], ('NAME', cxo.STRING, 40, 40, None, None, False))
+        self.assertEqual(meta['ra'][1], cxo.NATIVE_FLOAT)
+        self.assertTrue(meta['ra'][6])
+        self.assertEqual(meta['obs'][1], cxo.TIMESTAMP)
+        types = registry.lookup('prod.my_table', 'types', OracleConnection)
+        self.assertEqual(types, {'id': float, 'name': str, 'ra': float, 'obs': datetime.datetime})
+
+    def test_json(self):
+        jfile = 'schema_test.json'
+        registry = SchemaRegistry.from_database(self.dbh, ['exposure', 'attempt_state'])
+        registry.save_json(jfile)
+        try:
+            loaded = SchemaRegistry.from_json(jfile)
+        finally:
+            os.unlink(jfile)
+        self.assertEqual(sorted(loaded.tables()), ['attempt_state', 'exposure'])
+        self.assertEqual(loaded.lookup('exposure', 'types', MockConnection),
+                         self.dbh.get_column_types('exposure'))
+        self.assertEqual(loaded.lookup('attempt_state', 'metadata', MockConnection),
+                         registry.lookup('attempt_state', 'metadata', MockConnection))
+        self.assertRaises(ValueError, SchemaRegistry.from_database, self.dbh, ['no_such_table'])
+
+    def test_desdbi(self):
+        dbh = desdbi.DesDbi(self.sfile, 'db-test', lazy=True, schema=self.sqldir)
+        self.assertEqual(dbh.get_column_names('exposure'), self.dbh.get_column_names('exposure'))
+        self.assertEqual(dbh.get_column_types('image')['filename'], str)
+        self.assertTrue('band' in dbh.get_column_lengths('exposure'))
+        self.assertFalse(dbh.is_connected())
+        dbh.close()
+
 if __name__ == '__main__':
     unittest.main()